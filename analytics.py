@@ -0,0 +1,248 @@
+# analytics.py
+"""
+Catalogue analytics: score histograms and nutrient distributions per category and brand.
+
+`catalogue_stats` is a materialized aggregate of the products table with one row per
+(group kind, group). Each row holds product counts, score and nutrient sums, a 10-point
+health score histogram and a fixed-bin histogram per nutrient, all as plain columns.
+Triggers on products add (and subtract) each written row, so the view is updated
+incrementally on every insert, update and delete. A stats request reads one row, or one row
+per group for a ranking, no matter how many products the catalogue holds.
+
+Percentiles are interpolated within the nutrient bins, so they are approximate; the bin
+edges below are chosen so typical labels fall into narrow bins.
+"""
+
+import sqlite3
+
+# --- Aggregate Layout ---
+# Group kind -> products column it groups by (also the /api/stats/<kind> path segment)
+GROUP_KINDS = {
+    'categories': 'category',
+    'brands': 'brand',
+}
+
+SCORE_BUCKET_WIDTH = 10
+SCORE_BUCKETS = 10  # 0-9, 10-19, ... 90-100 (a perfect score shares the top bucket)
+
+# Lower bin edges per 100g; the last bin runs up to the importer's plausibility limit
+NUTRIENT_BINS = {
+    'sugar': ((0, 0.5, 1, 2.5, 5, 7.5, 10, 12.5, 15, 22.5, 30, 45, 60, 80), 100.0),
+    'salt': ((0, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.25, 1.5, 2, 3, 5, 10), 100.0),
+    'fat': ((0, 0.5, 1, 3, 5, 10, 17.5, 20, 25, 30, 40, 60, 80), 100.0),
+    'saturated_fat': ((0, 0.1, 0.5, 1, 1.5, 2, 3, 5, 7.5, 10, 15, 20, 40), 100.0),
+    'protein': ((0, 0.5, 1, 2, 3, 5, 8, 10, 12, 15, 20, 30, 50), 100.0),
+    'fiber': ((0, 0.5, 1, 2, 3, 4, 6, 8, 10, 15, 25), 100.0),
+    'calories': ((0, 20, 40, 80, 120, 160, 200, 250, 300, 350, 400, 450, 500, 600, 800), 1000.0),
+}
+
+PERCENTILES = (10, 25, 50, 75, 90)
+
+
+def _score_columns():
+    return [f"score_{bucket}" for bucket in range(SCORE_BUCKETS)]
+
+def _bin_columns(nutrient):
+    return [f"{nutrient}_bin_{index}" for index in range(len(NUTRIENT_BINS[nutrient][0]))]
+
+def _stat_columns():
+    """(column, SQL expression over a products row) for every counter, `{row}` standing for NEW./OLD./nothing."""
+    columns = [
+        ("products", "1"),
+        ("scored", "({row}health_score IS NOT NULL)"),
+        ("score_sum", "IFNULL({row}health_score, 0)"),
+    ]
+    for bucket, column in enumerate(_score_columns()):
+        low = bucket * SCORE_BUCKET_WIDTH
+        if bucket == SCORE_BUCKETS - 1:
+            condition = f"{{row}}health_score >= {low}"
+        elif bucket == 0:
+            condition = f"{{row}}health_score < {low + SCORE_BUCKET_WIDTH}"
+        else:
+            condition = f"{{row}}health_score >= {low} AND {{row}}health_score < {low + SCORE_BUCKET_WIDTH}"
+        columns.append((column, f"(({condition}) IS 1)"))
+    for nutrient, (edges, _) in NUTRIENT_BINS.items():
+        value = f"{{row}}{nutrient}"
+        columns.append((f"{nutrient}_sum", f"IFNULL({value}, 0)"))
+        for index, column in enumerate(_bin_columns(nutrient)):
+            # Out-of-range values are clamped into the first and last bins
+            conditions = []
+            if index > 0:
+                conditions.append(f"{value} >= {edges[index]}")
+            if index < len(edges) - 1:
+                conditions.append(f"{value} < {edges[index + 1]}")
+            condition = " AND ".join(conditions) if conditions else f"{value} IS NOT NULL"
+            columns.append((column, f"(({condition}) IS 1)"))
+    return columns
+
+STAT_COLUMNS = _stat_columns()
+
+SQL_CREATE_CATALOGUE_STATS_TABLE = f"""
+CREATE TABLE IF NOT EXISTS catalogue_stats (
+    kind TEXT NOT NULL,
+    group_key TEXT NOT NULL,
+    {", ".join(f"{column} {'REAL' if column.endswith('_sum') else 'INTEGER'} NOT NULL" for column, _ in STAT_COLUMNS)},
+    PRIMARY KEY (kind, group_key)
+) WITHOUT ROWID
+"""
+
+def _sql_apply(kind, row, sign):
+    """Upsert adding (sign 1) or subtracting (sign -1) one products row to its group."""
+    group = f"IFNULL({row}{GROUP_KINDS[kind]}, '')"
+    values = [expression.format(row=row) for _, expression in STAT_COLUMNS]
+    if sign < 0:
+        values = [f"-{value}" for value in values]
+    names = [column for column, _ in STAT_COLUMNS]
+    sql = f"""
+        INSERT INTO catalogue_stats (kind, group_key, {", ".join(names)})
+        VALUES ('{kind}', {group}, {", ".join(values)})
+        ON CONFLICT (kind, group_key) DO UPDATE SET {", ".join(f"{name} = {name} + excluded.{name}" for name in names)};
+    """
+    if sign < 0:
+        sql += f"DELETE FROM catalogue_stats WHERE kind = '{kind}' AND group_key = {group} AND products = 0;\n"
+    return sql
+
+def _trigger(name, event, statements):
+    return f"CREATE TRIGGER IF NOT EXISTS {name} {event} ON products BEGIN\n{''.join(statements)}END"
+
+# Keep catalogue_stats in sync with every write to products (by name, so bulk imports can suspend them)
+_TRACKED_COLUMNS = ", ".join(dict.fromkeys(["health_score", *GROUP_KINDS.values(), *NUTRIENT_BINS]))
+STATS_TRIGGERS = {
+    "catalogue_stats_ai": _trigger("catalogue_stats_ai", "AFTER INSERT",
+                                   [_sql_apply(kind, "new.", 1) for kind in GROUP_KINDS]),
+    "catalogue_stats_ad": _trigger("catalogue_stats_ad", "AFTER DELETE",
+                                   [_sql_apply(kind, "old.", -1) for kind in GROUP_KINDS]),
+    "catalogue_stats_au": _trigger("catalogue_stats_au", f"AFTER UPDATE OF {_TRACKED_COLUMNS}",
+                                   [_sql_apply(kind, "old.", -1) for kind in GROUP_KINDS]
+                                   + [_sql_apply(kind, "new.", 1) for kind in GROUP_KINDS]),
+}
+
+def rebuild_catalogue_stats(conn):
+    """Recomputes catalogue_stats from the products table in one pass per group kind, then commits."""
+    names = ", ".join(column for column, _ in STAT_COLUMNS)
+    sums = ", ".join(f"TOTAL({expression.format(row='')})" for _, expression in STAT_COLUMNS)
+    conn.execute("DELETE FROM catalogue_stats")
+    for kind, column in GROUP_KINDS.items():
+        conn.execute(f"""
+            INSERT INTO catalogue_stats (kind, group_key, {names})
+            SELECT '{kind}', IFNULL({column}, ''), {sums} FROM products GROUP BY IFNULL({column}, '')
+        """)
+    conn.commit()
+
+# --- Reading the Aggregates ---
+
+def _percentile(counts, edges, upper, fraction):
+    """Interpolates one percentile from a nutrient's bin counts; None when it has no values."""
+    total = sum(counts)
+    if not total:
+        return None
+    target = fraction * total
+    seen = 0
+    for index, count in enumerate(counts):
+        if count and seen + count >= target:
+            low = edges[index]
+            high = edges[index + 1] if index + 1 < len(edges) else upper
+            return round(low + (high - low) * (target - seen) / count, 2)
+        seen += count
+    return float(upper)
+
+def _summary(row):
+    scored = row['scored']
+    return {
+        "name": row['group_key'],
+        "products": int(row['products']),
+        "average_score": round(row['score_sum'] / scored, 1) if scored else None,
+    }
+
+def describe_group(row):
+    """Full statistics for one catalogue_stats row: score histogram and per-nutrient averages and percentiles."""
+    result = _summary(row)
+    result["score_histogram"] = [
+        {"min": bucket * SCORE_BUCKET_WIDTH,
+         "max": 100 if bucket == SCORE_BUCKETS - 1 else bucket * SCORE_BUCKET_WIDTH + SCORE_BUCKET_WIDTH - 1,
+         "count": int(row[column])}
+        for bucket, column in enumerate(_score_columns())
+    ]
+    nutrients = {}
+    for nutrient, (edges, upper) in NUTRIENT_BINS.items():
+        counts = [int(row[column]) for column in _bin_columns(nutrient)]
+        known = sum(counts)
+        stats = {"products": known, "average": round(row[f"{nutrient}_sum"] / known, 2) if known else None}
+        for percentile in PERCENTILES:
+            stats[f"p{percentile}"] = _percentile(counts, edges, upper, percentile / 100)
+        nutrients[nutrient] = stats
+    result["nutrients"] = nutrients
+    return result
+
+def get_group_stats(conn, kind, name):
+    """Statistics for one category or brand, or None when no product belongs to it."""
+    c = conn.cursor()
+    c.row_factory = sqlite3.Row
+    row = c.execute("SELECT * FROM catalogue_stats WHERE kind = ? AND group_key = ?", (kind, name)).fetchone()
+    return describe_group(row) if row is not None else None
+
+# Ranking orders for list_groups: name -> SQL ORDER BY expression
+GROUP_SORTS = {
+    'average_score': "score_sum / NULLIF(scored, 0)",
+    'products': "products",
+    'name': "group_key",
+}
+
+def list_groups(conn, kind, sort='average_score', descending=True, min_products=1, limit=50):
+    """
+    Ranks every category or brand with at least `min_products` products (e.g. worst-scoring brands:
+    sort='average_score', descending=False). Reads one aggregate row per group, never the products.
+    """
+    direction = "DESC" if descending else "ASC"
+    sql = f"""
+    SELECT group_key, products, scored, score_sum FROM catalogue_stats
+    WHERE kind = ? AND products >= ? AND scored > 0
+    ORDER BY {GROUP_SORTS[sort]} {direction}, group_key LIMIT ?
+    """
+    c = conn.cursor()
+    c.row_factory = sqlite3.Row
+    return [_summary(row) for row in c.execute(sql, (kind, min_products, limit))]
+
+def get_catalogue_totals(conn):
+    """Product count and average score over the whole catalogue, summed from the per-category rows."""
+    row = conn.execute(
+        "SELECT TOTAL(products), TOTAL(scored), TOTAL(score_sum), COUNT(*) FROM catalogue_stats WHERE kind = 'categories'"
+    ).fetchone()
+    products, scored, score_sum, categories = row
+    return {
+        "products": int(products),
+        "average_score": round(score_sum / scored, 1) if scored else None,
+        "categories": categories,
+        "brands": conn.execute("SELECT COUNT(*) FROM catalogue_stats WHERE kind = 'brands'").fetchone()[0],
+    }
+
+
+if __name__ == '__main__':
+    # Self-check: the trigger-maintained view matches a full rebuild after inserts, updates and deletes
+    conn = sqlite3.connect(':memory:')
+    conn.execute("""CREATE TABLE products (barcode TEXT PRIMARY KEY, brand TEXT, category TEXT, sugar REAL, salt REAL,
+                    fat REAL, saturated_fat REAL, protein REAL, fiber REAL, calories INTEGER, health_score INTEGER)""")
+    conn.execute(SQL_CREATE_CATALOGUE_STATS_TABLE)
+    for sql in STATS_TRIGGERS.values():
+        conn.execute(sql)
+    import random
+    rng = random.Random(7)
+    def random_row(barcode):
+        return (barcode, rng.choice(['A', 'B', None]), rng.choice(['Snacks', 'Drinks']),
+                *(rng.choice([None, rng.uniform(0, 110)]) for _ in range(6)), rng.randint(0, 1100),
+                rng.choice([None, rng.randint(0, 100)]))
+    conn.executemany("INSERT INTO products VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", [random_row(str(i)) for i in range(500)])
+    conn.executemany("INSERT OR IGNORE INTO products VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                     [random_row(str(i)) for i in range(400, 600)])
+    conn.executemany("UPDATE products SET category = 'Dairy', health_score = ? WHERE barcode = ?",
+                     [(rng.randint(0, 100), str(i)) for i in range(0, 600, 7)])
+    conn.execute("DELETE FROM products WHERE brand = 'B' AND barcode > '3'")
+    incremental = sorted(conn.execute("SELECT * FROM catalogue_stats").fetchall())
+    rebuild_catalogue_stats(conn)
+    rebuilt = sorted(conn.execute("SELECT * FROM catalogue_stats").fetchall())
+    assert len(incremental) == len(rebuilt)
+    for a, b in zip(incremental, rebuilt):
+        assert a[:2] == b[:2] and all(abs(x - y) < 1e-6 for x, y in zip(a[2:], b[2:])), (a, b)
+    print(f"Incremental aggregates match a rebuild over {len(rebuilt)} groups.")
+    print(list_groups(conn, 'categories'))
+    print(get_group_stats(conn, 'brands', 'A')["nutrients"]["sugar"])
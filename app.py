@@ -1,11 +1,32 @@
-from flask import Flask, request, jsonify, g
+from flask import Flask, Response, request, jsonify, g
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+from werkzeug.http import http_date, parse_date, parse_etags, quote_etag
 # Assuming these files are present in your backend directory
-from database import create_connection 
-from scoring import calculate_health_score
-import sqlite3
+from database import (get_pool, PoolTimeout, is_valid_barcode, parse_additives, score_product, get_additives_for,
+                      get_products_with_additive, build_search_query, search_products,
+                      get_products_in_category, upsert_products, ADDITIVES)
+from scoring import (calculate_health_score, calculate_health_scores, get_profile, PROFILES, DEFAULT_PROFILE, SCORED_NUTRIENTS,
+                     SCORING_RULES_VERSION)
+from cache import product_cache, missing_cache, ChangeWatcher
+from recommend import alternatives_index
+from metrics import registry
+from upstream import upstream_source, upstream_flight, UpstreamError
+from snapshot import catalogue_snapshot
+from ratelimit import RATELIMIT_STORAGE_URI, RATELIMIT_STRATEGY, refund_hit  # Also registers the sqlite:// limiter storage
+from submissions import SubmissionQueue, QueueFull
+from export import EXPORT_FORMATS, export_stream
+from analytics import GROUP_KINDS, GROUP_SORTS, get_catalogue_totals, get_group_stats, list_groups
+from collections import namedtuple
+from datetime import datetime
+from functools import partial
+import atexit
+import hashlib
+import math
+import os
+import re
+import time
 
 # 🔑 SECURITY: Define the allowed origins for CORS
 # IMPORTANT: Replace the placeholder below with your final Netlify/Vercel URL!
@@ -18,21 +39,52 @@ FRONTEND_URL = [
 # --- Flask App Initialization ---
 app = Flask(__name__)
 # 🔑 SECURITY: Restrict CORS to only allow requests from the defined FRONTEND_URL
-CORS(app, resources={r"/api/*": {"origins": FRONTEND_URL}}) 
+CORS(app, resources={r"/api/*": {"origins": FRONTEND_URL, "expose_headers": ["X-Export-Timestamp"]}})
+
+# Rate limiting can only be switched off explicitly (benchmarks and load tests set RATELIMIT_ENABLED=0)
+app.config['RATELIMIT_ENABLED'] = os.environ.get('RATELIMIT_ENABLED', '1') != '0'
 
 # 🔑 FIX & SECURITY: Rate Limiter Configuration (Explicitly passing 'app=app' for modern Flask-Limiter versions)
 limiter = Limiter(
     app=app,  # <-- FIX: Explicitly use the 'app' keyword argument to resolve TypeError
     key_func=get_remote_address,
-    default_limits=["200 per day", "50 per hour"] # Global default limits
+    default_limits=["200 per day", "50 per hour"], # Global default limits
+    # 🔑 SECURITY: Counters live in a host-wide SQLite file so limits hold across all gunicorn workers
+    storage_uri=RATELIMIT_STORAGE_URI,
+    strategy=RATELIMIT_STRATEGY,
 )
 
+# --- Instrumentation ---
+# Span histograms for the steps of a scan; request latency is recorded per route below
+POOL_CHECKOUT_SPAN = registry.span('pool_checkout')
+DB_QUERY_SPAN = registry.span('db_query')
+SCORING_SPAN = registry.span('scoring')
+SERIALIZATION_SPAN = registry.span('serialization')
+UPSTREAM_FETCH_SPAN = registry.span('upstream_fetch')
+
+@app.before_request
+def start_request_timer():
+    g._request_started = time.perf_counter()
+    change_watcher.ensure_running()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get('_request_started')
+    rule = request.url_rule
+    stats = registry.route(request.endpoint or '<unmatched>', rule.rule if rule else '<unmatched>', request.method)
+    stats.record(response.status_code, time.perf_counter() - started if started is not None else None)
+    return response
+
 # --- Database Connection Management ---
 
 def get_db_connection():
-    # Helper function to get a database connection that returns rows as dict-like objects
-    conn = create_connection()
-    conn.row_factory = sqlite3.Row 
+    # Helper function to borrow a pooled, read-only connection that returns rows as dict-like objects.
+    # The connection is kept on `g` for the rest of the request and returned to the pool on teardown.
+    conn = getattr(g, '_database', None)
+    if conn is None:
+        started = time.perf_counter()
+        conn = g._database = get_pool().checkout()
+        POOL_CHECKOUT_SPAN.observe(time.perf_counter() - started)
     return conn
 
 # Assuming check_db_exists is defined in database.py
@@ -40,60 +92,112 @@ from database import check_db_exists
 
 @app.teardown_appcontext
 def close_connection(exception):
-    db = getattr(g, '_database', None)
+    db = g.pop('_database', None)
     if db is not None:
-        db.close()
+        get_pool().checkin(db)
 
-# --- API Routes ---
+def json_bytes(payload):
+    # Serialize exactly as jsonify() would, so cached bodies are byte-identical to fresh ones
+    started = time.perf_counter()
+    body = app.json.response(payload).get_data()
+    SERIALIZATION_SPAN.observe(time.perf_counter() - started)
+    return body
 
-@app.route('/api', methods=['GET'])
-def api_info():
-    """Provides basic info about the API."""
-    return jsonify({
-        "status": "OK", 
-        "service": "Health Scanner API", 
-        "version": "1.0",
-        "endpoints": ["/api/product/<barcode>", "/api/product (POST)"]
-    })
+def json_body_response(body, status=200):
+    return Response(body, status=status, mimetype=app.json.mimetype)
 
-@app.route('/api/product/<barcode>', methods=['GET'])
-@limiter.limit("5 per minute") # 🔑 SECURITY: Limit to 5 requests per minute per IP for scanning
-def get_product(barcode):
+@app.errorhandler(PoolTimeout)
+def handle_pool_timeout(error):
+    # All pooled connections stayed busy for the full timeout: ask the client to retry
+    return jsonify({"error": "Service busy, please retry shortly."}), 503
+
+# --- Scan Rate Limits (shared with the ASGI entry point) ---
+SCAN_RATE_LIMIT = "5 per minute"
+LOOKUP_RATE_LIMIT = "10 per minute"
+EXPORT_RATE_LIMIT = "10 per hour"  # A full sync is one request, plus the odd resume
+
+def refund_view_limits(hit_at):
     """
-    Retrieves a product by barcode, calculates its health score, and returns the result.
+    Gives back the hits the current view's limits counted before it ran, at `hit_at` (see refund_hit).
+    🔑 SECURITY: Limits are deducted up front and refunded, never checked first and deducted after the
+    response: concurrent requests would all pass the check before any deduction landed.
     """
-    
-    # 🔑 SECURITY: Basic Input Validation
-    if not barcode.isdigit() or len(barcode) < 8 or len(barcode) > 13:
-        return jsonify({"error": "Invalid barcode format. Must be an 8-13 digit number."}), 400
-        
-    conn = get_db_connection()
-    
-    # 1. Fetch Product Data (Uses prepared statements, preventing SQL Injection)
-    product_row = conn.execute("SELECT * FROM products WHERE barcode = ?", (barcode,)).fetchone()
-    
-    if product_row is None:
-        return jsonify({"error": "Product not found in the database."}), 404
-        
-    product_dict = dict(product_row) 
-    
-    # 2. Extract Additives
-    additives_str = product_dict.get('additives', '')
-    additives_list = [a.strip() for a in additives_str.split(',') if a.strip()] if additives_str else []
-
-    # 3. Prepare Nutrition Data for Scoring
-    nutrition_data = {
-        'sugar': product_dict['sugar'],
-        'salt': product_dict['salt'],
-        'saturated_fat': product_dict['saturated_fat'],
-        'protein': product_dict['protein'],
-        'fiber': product_dict['fiber'],
-    }
-    
-    # 4. Calculate Health Score
-    health_score = calculate_health_score(nutrition_data, additives_list)
+    if limiter.enabled:
+        for request_limit in limiter.current_limits:
+            refund_hit(limiter.limiter, request_limit.limit, request_limit.request_args, hit_at)
+
+INVALID_BARCODE_ERROR = {"error": "Invalid barcode format. Must be an 8-13 digit number."}
+PRODUCT_NOT_FOUND_ERROR = {"error": "Product not found in the database."}
+UNKNOWN_PROFILE_ERROR = {"error": f"Unknown scoring profile. Available profiles: {', '.join(PROFILES)}."}
+
+# --- Batch Lookup Configuration ---
+MAX_BATCH_BARCODES = 100     # One full shopping basket per request
+SQLITE_MAX_PARAMS = 900      # Stay under SQLite's default 999 bound-parameter limit
+
+# --- Pagination Configuration ---
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+ADDITIVE_CODE_PATTERN = re.compile(r'^[Ee]\d{3,4}[A-Za-z]?$')
+
+MAX_SEARCH_LENGTH = 100
+MAX_ALTERNATIVES = 20
+
+def parse_page_limit(default=DEFAULT_PAGE_SIZE):
+    # Returns the requested page size, or None when it is out of bounds
+    limit = request.args.get('limit', default, type=int)
+    return limit if 1 <= limit <= MAX_PAGE_SIZE else None
+
+def parse_cursor(cursor, key_type):
+    # Keyset cursors are "<sort key>:<tie-breaker>" strings handed out as `next_cursor`
+    key, _, tie = cursor.partition(':')
+    try:
+        return key_type(key), tie
+    except ValueError:
+        return None
+
+# --- Shared Product Helpers ---
+DEFAULT_SCORING = get_profile(DEFAULT_PROFILE)
+
+def product_cache_key(barcode, profile=DEFAULT_SCORING):
+    # Each profile's response is cached separately; the default keeps the bare barcode as its key
+    return barcode if profile is DEFAULT_SCORING else f"{barcode}:{profile.name}"
+
+def invalidate_product(barcode):
+    """Drops every cached response for a barcode (all profiles) after it was written."""
+    for profile in PROFILES.values():
+        product_cache.invalidate(product_cache_key(barcode, profile))
+    missing_cache.invalidate(barcode)
+
+def invalidate_products(barcodes):
+    for barcode in barcodes:
+        invalidate_product(barcode)
+
+def reset_product_caches():
+    product_cache.clear()
+    missing_cache.clear()
+
+# Rows written through other connections (other workers, `manage.py import` / `recompute`) never pass through
+# invalidate_product here; the watcher finds them by updated_at and drops their cached responses and 404s
+change_watcher = ChangeWatcher(on_changed=invalidate_products, on_reset=reset_product_caches)
+
+def build_product_response(product_dict, additives_list, health_score=None, profile=DEFAULT_SCORING):
+    """
+    Turns a products row (as a dict) and its additive codes into the scored API response shape.
+    Pass `health_score` when it was already computed (e.g. by the batch scorer).
+    """
+    # 1. Prepare Nutrition Data for Scoring
+    nutrition_data = {nutrient: product_dict[nutrient] for nutrient in profile.nutrients}
+
+    # 2. Use the stored Health Score unless it predates the current scoring rules (stored scores are the default profile's)
+    if health_score is None and profile is DEFAULT_SCORING and product_dict.get('score_version') == SCORING_RULES_VERSION:
+        health_score = product_dict['health_score']
+    if health_score is None:
+        started = time.perf_counter()
+        health_score = calculate_health_score(nutrition_data, additives_list, profile)
+        SCORING_SPAN.observe(time.perf_counter() - started)
 
-    # 5. Build and Return Response
+    # 3. Build Response
     response = {
         "barcode": product_dict['barcode'],
         "name": product_dict['name'],
@@ -111,61 +215,561 @@ def get_product(barcode):
         },
         "additives": additives_list
     }
-    
-    return jsonify(response)
+    # Default responses keep their original shape; other profiles say which scale the score is on
+    if profile is not DEFAULT_SCORING:
+        response["profile"] = profile.name
+        grade = profile.grade(health_score)
+        if grade is not None:
+            response["grade"] = grade
+    return response
+
+# --- Conditional Requests ---
+# Product data rarely changes: let browsers, the Netlify frontend and CDNs reuse responses and revalidate cheaply
+PRODUCT_CACHE_CONTROL = os.environ.get('PRODUCT_CACHE_CONTROL', 'public, max-age=300, stale-while-revalidate=86400')
+
+# A serialized product plus its validators; `body` is None when the client's copy was still fresh
+ProductEntry = namedtuple('ProductEntry', ['body', 'etag', 'updated_at'])
+
+ETAG_FIELDS = ('barcode', 'name', 'brand', 'category', 'sugar', 'salt', 'fat', 'saturated_fat', 'protein', 'fiber', 'calories')
+
+def product_etag(product_dict, additives_list, profile=DEFAULT_SCORING):
+    """Stable ETag from the row contents plus the scoring profile and its version, which together determine the response."""
+    rules = SCORING_RULES_VERSION if profile is DEFAULT_SCORING else (profile.name, profile.version)
+    key = repr((tuple(product_dict[field] for field in ETAG_FIELDS), additives_list, rules))
+    return hashlib.blake2b(key.encode(), digest_size=12).hexdigest()
+
+def is_not_modified(if_none_match, if_modified_since, etag, updated_at):
+    """Evaluates conditional GET headers; If-None-Match takes precedence over If-Modified-Since (RFC 9110)."""
+    if if_none_match:
+        return parse_etags(if_none_match).contains_weak(etag)
+    if if_modified_since and updated_at:
+        since = parse_date(if_modified_since)
+        return since is not None and updated_at <= since.timestamp()
+    return False
+
+def validator_headers(entry, not_modified=False):
+    """ETag, Cache-Control and (except on 304s, which omit representation metadata) Last-Modified."""
+    headers = [('ETag', quote_etag(entry.etag)), ('Cache-Control', PRODUCT_CACHE_CONTROL)]
+    if entry.updated_at and not not_modified:
+        headers.append(('Last-Modified', http_date(entry.updated_at)))
+    return headers
+
+def finish_product_entry(product_dict, additives_list, etag, profile=DEFAULT_SCORING):
+    """Scores and serializes one product, caching the body together with its validators."""
+    body = json_bytes(build_product_response(product_dict, additives_list, profile=profile))
+    entry = ProductEntry(body, etag, product_dict.get('updated_at') or 0)
+    product_cache.set(product_cache_key(product_dict['barcode'], profile), entry)
+    return entry
+
+def fetch_snapshot_entry(barcode, is_fresh=None, profile=DEFAULT_SCORING):
+    """
+    Serves a scan from the memory-mapped catalogue snapshot: no pool checkout and no query.
+    Returns None when no snapshot is configured or the barcode is not in it.
+    """
+    found = catalogue_snapshot.get(barcode) if catalogue_snapshot is not None else None
+    if found is None:
+        return None
+    product_dict, additives_list = found
+    etag = product_etag(product_dict, additives_list, profile)
+    # The client already has this version: skip scoring and serialization entirely
+    if is_fresh is not None and is_fresh(etag, product_dict['updated_at']):
+        return ProductEntry(None, etag, product_dict['updated_at'])
+    return finish_product_entry(product_dict, additives_list, etag, profile)
+
+def fetch_product_entry(conn, barcode, is_fresh=None, profile=DEFAULT_SCORING):
+    """
+    Loads, scores and serializes one product, storing it in the response cache.
+    `is_fresh(etag, updated_at)` lets conditional requests stop before scoring and serialization.
+    Returns None for unknown barcodes. Shared by the Flask route and the ASGI entry point.
+    """
+    # 1. Fetch Product Data (Uses prepared statements, preventing SQL Injection)
+    started = time.perf_counter()
+    product_row = conn.execute("SELECT * FROM products WHERE barcode = ?", (barcode,)).fetchone()
+    DB_QUERY_SPAN.observe(time.perf_counter() - started)
+    if product_row is None:
+        return None
+
+    # 2. Additives from the row itself: the stored string lists the same codes, in order, as product_additives,
+    # so the ETag and the body share one list and a miss costs a single query
+    product_dict = dict(product_row)
+    additives_list = parse_additives(product_dict['additives'])
+    etag = product_etag(product_dict, additives_list, profile)
+    if is_fresh is not None and is_fresh(etag, product_dict['updated_at']):
+        return ProductEntry(None, etag, product_dict['updated_at'])
+
+    # 3. Score and Shape the Response
+    return finish_product_entry(product_dict, additives_list, etag, profile)
+
+def load_upstream_product(barcode):
+    """
+    Fetches a locally unknown barcode from the upstream source and stores it.
+    Returns (products row as a dict, additives list), or None when upstream does not know the product either.
+    """
+    started = time.perf_counter()
+    product = upstream_source.fetch(barcode)
+    UPSTREAM_FETCH_SPAN.observe(time.perf_counter() - started)
+    if product is None:
+        return None
+
+    # Writes are serialized through the pool's single writer connection
+    with get_pool().writer() as conn:
+        upsert_products(conn, [product])
+        conn.commit()
+        product_row = dict(conn.execute("SELECT * FROM products WHERE barcode = ?", (barcode,)).fetchone())
+    alternatives_index.add(product_row)
+    return product_row, parse_additives(product[ADDITIVES])
+
+def fetch_missing_product(barcode, profile=DEFAULT_SCORING):
+    """
+    Handles a local miss: reads through to the upstream source when one is configured, with
+    concurrent requests for the same barcode sharing one fetch (whatever profile they asked for).
+    Confirmed misses are recorded in `missing_cache`. Returns the cached entry or None.
+    """
+    if upstream_source is not None:
+        # A request that missed the database just before another one stored the product
+        entry = product_cache.get(product_cache_key(barcode, profile))
+        if entry is not None:
+            return entry
+        try:
+            loaded = upstream_flight.do(barcode, load_upstream_product, barcode)
+        except UpstreamError as e:
+            # Upstream is down or misbehaving: answer 404 now, but let the next scan try again
+            print(f"Upstream lookup for {barcode} failed: {e}")
+            return None
+        if loaded is not None:
+            product_row, additives_list = loaded
+            return finish_product_entry(product_row, additives_list, product_etag(product_row, additives_list, profile), profile)
+    missing_cache.set(barcode, True)
+    return None
+
+# --- Product Submissions ---
+# Column order of the rows add_product queues (the products INSERT in submissions.py)
+SUBMISSION_ROW_FIELDS = ('barcode', 'name', 'brand', 'category', 'sugar', 'salt', 'fat', 'saturated_fat', 'protein',
+                         'fiber', 'calories', 'additives', 'health_score', 'additive_count', 'score_version')
+SUBMISSION_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+NUTRIENT_FIELDS = ('sugar', 'salt', 'fat', 'saturated_fat', 'protein', 'fiber', 'calories')
+
+def is_finite_number(value):
+    # JSON numbers only: bool is an int subclass, and json accepts NaN/Infinity literals
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+def submission_added(row, additives_list):
+    """Runs on the writer thread after a queued product is committed: refresh this worker's caches."""
+    product = dict(zip(SUBMISSION_ROW_FIELDS, row))
+    invalidate_product(product['barcode'])
+    alternatives_index.add(product)
+
+submission_queue = SubmissionQueue(on_added=submission_added)
+# Commit whatever is still queued when the worker shuts down gracefully
+atexit.register(submission_queue.flush)
+
+def validate_lookup_request(data):
+    """
+    Validates a batch lookup body. Returns (deduplicated barcodes, None) or (None, error payload).
+    """
+    barcodes = data.get('barcodes') if isinstance(data, dict) else None
+
+    if not isinstance(barcodes, list) or not barcodes:
+        return None, {"error": "Request body must contain a non-empty 'barcodes' list."}
+    if len(barcodes) > MAX_BATCH_BARCODES:
+        return None, {"error": f"At most {MAX_BATCH_BARCODES} barcodes can be looked up per request."}
+
+    invalid = [b for b in barcodes if not is_valid_barcode(b)]
+    if invalid:
+        return None, dict(INVALID_BARCODE_ERROR, invalid=invalid)
+
+    # Preserve the client's order while dropping duplicate scans of the same item
+    return list(dict.fromkeys(barcodes)), None
+
+def lookup_products_payload(conn, requested, profile=DEFAULT_SCORING):
+    """
+    Resolves validated barcodes with chunked IN (...) queries and scores them in one pass.
+    """
+    rows = {}
+    additives = {}
+    for i in range(0, len(requested), SQLITE_MAX_PARAMS):
+        chunk = requested[i:i + SQLITE_MAX_PARAMS]
+        placeholders = ",".join("?" * len(chunk))
+        for row in conn.execute(f"SELECT * FROM products WHERE barcode IN ({placeholders})", chunk):
+            rows[row['barcode']] = row
+        additives.update(get_additives_for(conn, chunk))
+
+    found = [dict(rows[b]) for b in requested if b in rows]
+    not_found = [b for b in requested if b not in rows]
+
+    # Rows scored under an older rules version (or every row, for another profile) are scored together in one vectorized pass
+    if profile is DEFAULT_SCORING:
+        stale = [p for p in found if p.get('score_version') != SCORING_RULES_VERSION]
+    else:
+        stale = found
+    columns = {nutrient: [p[nutrient] for p in stale] for nutrient in profile.nutrients}
+    additive_counts = [len(additives.get(p['barcode'], ())) for p in stale]
+    started = time.perf_counter()
+    rescored = {p['barcode']: int(score) for p, score in zip(stale, calculate_health_scores(columns, additive_counts, profile))}
+    SCORING_SPAN.observe(time.perf_counter() - started)
+    products = [
+        build_product_response(p, additives.get(p['barcode'], []), rescored.get(p['barcode']), profile) for p in found
+    ]
+
+    return {"products": products, "not_found": not_found}
+
+# --- API Routes ---
+
+@app.route('/api', methods=['GET'])
+def api_info():
+    """Provides basic info about the API."""
+    return jsonify({
+        "status": "OK", 
+        "service": "Health Scanner API", 
+        "version": "1.0",
+        "endpoints": ["/api/product/<barcode>", "/api/product/<barcode>/alternatives", "/api/product (POST)", "/api/product/submissions/<id>", "/api/products/lookup (POST)", "/api/additive/<code>/products",
+                      "/api/search?q=", "/api/category/<category>", "/api/stats", "/api/stats/<categories|brands>", "/api/stats/<categories|brands>/<name>", "/api/export", "/api/metrics", "/api/pool", "/api/cache"],
+        "scoring_profiles": {name: profile.description for name, profile in PROFILES.items()},
+    })
+
+@app.route('/api/pool', methods=['GET'])
+def pool_stats():
+    """Reports this worker's connection pool checkout/return statistics."""
+    return jsonify(get_pool().stats())
+
+@app.route('/api/cache', methods=['GET'])
+def cache_stats():
+    """Reports this worker's product response cache hit/miss/eviction counters."""
+    return jsonify(product_cache.stats())
+
+@app.route('/api/metrics', methods=['GET'])
+@limiter.exempt # Scraped every few seconds by monitoring, never by clients
+def metrics():
+    """Exposes this worker's request latency histograms, counters and spans in Prometheus text format."""
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+registry.gauge('db_pool', "Connection pool statistics for this worker.", lambda: get_pool().stats())
+registry.gauge('product_cache', "Product response cache statistics for this worker.", product_cache.stats)
+registry.gauge('missing_cache', "Negative (unknown barcode) cache statistics for this worker.", missing_cache.stats)
+if catalogue_snapshot is not None:
+    registry.gauge('catalogue_snapshot', "Catalogue snapshot rows, lookups and reloads for this worker.", catalogue_snapshot.stats)
+registry.gauge('upstream', "Upstream fallback fetches and coalesced waiters for this worker.", upstream_flight.stats)
+registry.gauge('cache_invalidation', "Checks for rows changed by other connections and the entries they dropped.", change_watcher.stats)
+registry.gauge('submission_queue', "Queued product submissions, group commits and outcomes for this worker.", submission_queue.stats)
+
+@app.route('/api/product/<barcode>', methods=['GET'])
+@limiter.limit(SCAN_RATE_LIMIT) # 🔑 SECURITY: Limit to 5 requests per minute per IP for scanning
+def get_product(barcode):
+    """
+    Retrieves a product by barcode, calculates its health score, and returns the result.
+    """
+    hit_at = time.time()  # The limiter has already counted this scan
+    # 🔑 SECURITY: Basic Input Validation
+    if not is_valid_barcode(barcode):
+        return jsonify(INVALID_BARCODE_ERROR), 400
+    profile = get_profile(request.args.get('profile'))
+    if profile is None:
+        return jsonify(UNKNOWN_PROFILE_ERROR), 400
+
+    is_fresh = partial(is_not_modified, request.headers.get('If-None-Match'), request.headers.get('If-Modified-Since'))
+
+    # Hot barcodes are served straight from the cache: no SQLite, scoring or serialization
+    entry = product_cache.get(product_cache_key(barcode, profile))
+    if entry is None:
+        # Known-missing barcodes skip the database (and upstream) until their entry expires
+        if missing_cache.get(barcode):
+            return jsonify(PRODUCT_NOT_FOUND_ERROR), 404
+        entry = (fetch_snapshot_entry(barcode, is_fresh, profile)
+                 or fetch_product_entry(get_db_connection(), barcode, is_fresh, profile))
+    if entry is None:
+        close_connection(None)  # Don't hold a pooled reader while waiting on upstream
+        entry = fetch_missing_product(barcode, profile)
+    if entry is None:
+        return jsonify(PRODUCT_NOT_FOUND_ERROR), 404
+
+    not_modified = entry.body is None or is_fresh(entry.etag, entry.updated_at)
+    if not_modified:
+        # Revalidations answered with 304 cost no scoring or serialization, so they don't use up the scan budget
+        refund_view_limits(hit_at)
+    response = Response(status=304) if not_modified else json_body_response(entry.body)
+    response.headers.extend(validator_headers(entry, not_modified))
+    return response
+
+@app.route('/api/product/<barcode>/alternatives', methods=['GET'])
+@limiter.limit("30 per minute")
+def get_alternatives(barcode):
+    """
+    Suggests healthier products from the same category (`?limit=<n>`, default 5),
+    served from this worker's precomputed per-category index.
+    """
+    if not is_valid_barcode(barcode):
+        return jsonify(INVALID_BARCODE_ERROR), 400
+    limit = request.args.get('limit', 5, type=int)
+    if not 1 <= limit <= MAX_ALTERNATIVES:
+        return jsonify({"error": f"'limit' must be between 1 and {MAX_ALTERNATIVES}."}), 400
+
+    alternatives_index.ensure_loaded(get_db_connection())
+    alternatives = alternatives_index.alternatives(barcode, limit)
+    if alternatives is None:
+        return jsonify(PRODUCT_NOT_FOUND_ERROR), 404
+    return jsonify({"barcode": barcode, "alternatives": alternatives})
+
+@app.route('/api/products/lookup', methods=['POST'])
+@limiter.limit(LOOKUP_RATE_LIMIT) # 🔑 SECURITY: One call covers a whole basket, so keep the per-IP budget small
+def lookup_products():
+    """
+    Resolves a list of barcodes in a single query and returns the scored products plus a not-found list.
+    """
+    requested, error = validate_lookup_request(request.get_json(silent=True))
+    if error is not None:
+        return jsonify(error), 400
+    profile = get_profile(request.args.get('profile'))
+    if profile is None:
+        return jsonify(UNKNOWN_PROFILE_ERROR), 400
+    return jsonify(lookup_products_payload(get_db_connection(), requested, profile))
+
+@app.route('/api/additive/<code>/products', methods=['GET'])
+@limiter.limit("30 per minute")
+def get_additive_products(code):
+    """
+    Lists products containing an additive (e.g. E621), paginated by barcode with `?after=<barcode>&limit=<n>`.
+    """
+    # 🔑 SECURITY: E-numbers only (E100-E1599, optional letter suffix such as E150d)
+    if not ADDITIVE_CODE_PATTERN.match(code):
+        return jsonify({"error": "Invalid additive code. Expected an E-number such as E621."}), 400
+
+    after = request.args.get('after', '')
+    if after and not is_valid_barcode(after):
+        return jsonify({"error": "Invalid 'after' barcode."}), 400
+    limit = parse_page_limit()
+    if limit is None:
+        return jsonify({"error": f"'limit' must be between 1 and {MAX_PAGE_SIZE}."}), 400
+
+    products = get_products_with_additive(get_db_connection(), code, after, limit)
+    return jsonify({
+        "additive": code.upper(),
+        "products": products,
+        "next_after": products[-1]['barcode'] if len(products) == limit else None,
+    })
+
+@app.route('/api/search', methods=['GET'])
+@limiter.limit("30 per minute")
+def search():
+    """
+    Full-text product search by name, brand or category with prefix matching (`?q=clover mil`).
+    Results are ranked by relevance; pass `next_cursor` back as `?cursor=` for the next page.
+    """
+    q = request.args.get('q', '')
+    match_query = build_search_query(q) if len(q) <= MAX_SEARCH_LENGTH else None
+    if match_query is None:
+        return jsonify({"error": f"Query 'q' must contain 1-{MAX_SEARCH_LENGTH} characters of searchable text."}), 400
+
+    limit = parse_page_limit(default=20)
+    if limit is None:
+        return jsonify({"error": f"'limit' must be between 1 and {MAX_PAGE_SIZE}."}), 400
+
+    after = None
+    cursor = request.args.get('cursor')
+    if cursor:
+        after = parse_cursor(cursor, float)
+        if after is None or not after[1].isdigit():
+            return jsonify({"error": "Invalid 'cursor'."}), 400
+        after = (after[0], int(after[1]))
+
+    rows = search_products(get_db_connection(), match_query, after, limit)
+    next_cursor = f"{rows[-1]['rank']!r}:{rows[-1]['search_rowid']}" if len(rows) == limit else None
+    for row in rows:
+        del row['rank'], row['search_rowid']
+    return jsonify({"query": q, "products": rows, "next_cursor": next_cursor})
+
+@app.route('/api/category/<category>', methods=['GET'])
+@limiter.limit("30 per minute")
+def get_category(category):
+    """
+    Lists a category's products, healthiest first. Pass `next_cursor` back as `?cursor=` for the next page.
+    """
+    limit = parse_page_limit()
+    if limit is None:
+        return jsonify({"error": f"'limit' must be between 1 and {MAX_PAGE_SIZE}."}), 400
+
+    after = None
+    cursor = request.args.get('cursor')
+    if cursor:
+        after = parse_cursor(cursor, int)
+        if after is None or not is_valid_barcode(after[1]):
+            return jsonify({"error": "Invalid 'cursor'."}), 400
+
+    products = get_products_in_category(get_db_connection(), category, after, limit)
+    last = products[-1] if len(products) == limit else None
+    return jsonify({
+        "category": category,
+        "products": products,
+        "next_cursor": f"{last['health_score']}:{last['barcode']}" if last else None,
+    })
+
+# --- Catalogue Analytics ---
+# Served from the trigger-maintained catalogue_stats aggregates, never by scanning products
+
+@app.route('/api/stats', methods=['GET'])
+@limiter.limit("30 per minute")
+def get_stats():
+    """Catalogue-wide product count and average health score."""
+    return jsonify(get_catalogue_totals(get_db_connection()))
+
+@app.route('/api/stats/<kind>', methods=['GET'])
+@limiter.limit("30 per minute")
+def get_group_ranking(kind):
+    """
+    Ranks categories or brands, e.g. `/api/stats/brands?sort=average_score&order=asc&min_products=10`
+    for the worst-scoring brands.
+    """
+    if kind not in GROUP_KINDS:
+        return jsonify({"error": f"Stats are grouped by one of: {', '.join(GROUP_KINDS)}."}), 404
+    sort = request.args.get('sort', 'average_score')
+    if sort not in GROUP_SORTS:
+        return jsonify({"error": f"'sort' must be one of: {', '.join(GROUP_SORTS)}."}), 400
+    order = request.args.get('order', 'desc')
+    if order not in ('asc', 'desc'):
+        return jsonify({"error": "'order' must be 'asc' or 'desc'."}), 400
+    min_products = request.args.get('min_products', 1, type=int)
+    limit = parse_page_limit()
+    if limit is None:
+        return jsonify({"error": f"'limit' must be between 1 and {MAX_PAGE_SIZE}."}), 400
+
+    groups = list_groups(get_db_connection(), kind, sort, order == 'desc', min_products, limit)
+    return jsonify({"group_by": GROUP_KINDS[kind], "sort": sort, "order": order, kind: groups})
+
+@app.route('/api/stats/<kind>/<name>', methods=['GET'])
+@limiter.limit("30 per minute")
+def get_group_detail(kind, name):
+    """Score histogram plus per-nutrient averages and (binned, approximate) percentiles for one category or brand."""
+    if kind not in GROUP_KINDS:
+        return jsonify({"error": f"Stats are grouped by one of: {', '.join(GROUP_KINDS)}."}), 404
+    stats = get_group_stats(get_db_connection(), kind, name)
+    if stats is None:
+        return jsonify({"error": f"No products found for {GROUP_KINDS[kind]} '{name}'."}), 404
+    return jsonify(dict(stats, group_by=GROUP_KINDS[kind]))
+
+# --- Catalogue Export ---
+
+SQLITE_MAX_INTEGER = 2 ** 63 - 1
+
+def parse_since(value):
+    # Unix seconds or an ISO 8601 date/time; None when unparseable or outside SQLite's integer range.
+    # 🔑 Checked here: once the export stream has started, a bad bind can only truncate the response.
+    try:
+        since = int(value)
+    except ValueError:
+        try:
+            since = int(datetime.fromisoformat(value).timestamp())
+        except (ValueError, OverflowError, OSError):
+            return None
+    return since if -SQLITE_MAX_INTEGER - 1 <= since <= SQLITE_MAX_INTEGER else None
+
+@app.route('/api/export', methods=['GET'])
+@limiter.limit(EXPORT_RATE_LIMIT) # 🔑 SECURITY: Each call streams the whole catalogue, so keep the per-IP budget small
+def export_catalogue():
+    """
+    Streams the scored catalogue as NDJSON (default) or `?format=csv`, in barcode order.
+    `?since=` limits it to rows changed since then; `?after=<barcode>` resumes an interrupted download.
+    Sent gzip-compressed when the client accepts it.
+    """
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": f"'format' must be one of: {', '.join(EXPORT_FORMATS)}."}), 400
+    after = request.args.get('after', '')
+    if after and not is_valid_barcode(after):
+        return jsonify({"error": "Invalid 'after' barcode."}), 400
+    since = 0
+    if request.args.get('since'):
+        since = parse_since(request.args['since'])
+        if since is None:
+            return jsonify({"error": "'since' must be a Unix timestamp or an ISO 8601 date."}), 400
+
+    # Taken before the first page is read: passing it back as `since` never misses a concurrent change
+    exported_at = int(time.time())
+    gzip = request.accept_encodings.quality('gzip') > 0
+    _, mimetype, filename = EXPORT_FORMATS[fmt]
+    response = Response(export_stream(fmt, after, since, gzip), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['X-Export-Timestamp'] = str(exported_at)
+    response.vary.add('Accept-Encoding')
+    if gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
 
 @app.route('/api/product', methods=['POST'])
 @limiter.limit("2 per hour") # 🔑 SECURITY: Restrict adding new products to prevent DB spam
 def add_product():
     """
     Allows community members to add new products to the database.
+    The product is validated and scored here, then written by the submission queue's group commit:
+    responds 202 with a status URL to poll.
     """
-    data = request.get_json()
-    required_fields = ['barcode', 'name', 'brand', 'sugar', 'salt', 'fat', 'saturated_fat', 'protein', 'fiber', 'calories']
+    data = request.get_json(silent=True)
+    required_fields = ['barcode', 'name', 'brand', *NUTRIENT_FIELDS]
 
-    if not all(field in data for field in required_fields):
+    if not isinstance(data, dict) or not all(field in data for field in required_fields):
         return jsonify({"error": "Missing required nutritional fields."}), 400
 
-    conn = get_db_connection()
-    
+    # 🔑 SECURITY: Check if barcode is valid and already exists
     barcode = data.get('barcode')
+    if not is_valid_barcode(barcode):
+         return jsonify({"error": "Invalid barcode format."}), 400
+
+    # Validate before scoring: strings, nulls and NaN would crash or mis-tier the scoring tables
+    invalid = [field for field in NUTRIENT_FIELDS if not is_finite_number(data[field])]
+    if invalid:
+        return jsonify({"error": f"Nutritional fields must be finite numbers: {', '.join(invalid)}."}), 400
     additives_str = data.get('additives', '')
+    if not isinstance(additives_str, str):
+        return jsonify({"error": "'additives' must be a comma-separated string, e.g. \"E621,E330\"."}), 400
 
-    # 🔑 SECURITY: Check if barcode is valid and already exists
-    if not barcode.isdigit() or len(barcode) < 8 or len(barcode) > 13:
-         return jsonify({"error": "Invalid barcode format."}), 400
-         
-    if conn.execute("SELECT barcode FROM products WHERE barcode = ?", (barcode,)).fetchone():
+    # Text columns must be strings too: anything else would only fail later, in the writer's group commit
+    if not isinstance(data['name'], str) or not data['name'].strip():
+        return jsonify({"error": "'name' must be a non-empty string."}), 400
+    text_fields = [field for field in ('brand', 'category') if not isinstance(data.get(field, ''), str)]
+    if text_fields:
+        return jsonify({"error": f"Text fields must be strings: {', '.join(text_fields)}."}), 400
+
+    additives_list = parse_additives(additives_str)
+    nutrition_data = {nutrient: data[nutrient] for nutrient in SCORED_NUTRIENTS}
+    score_fields = score_product(nutrition_data, additives_list)
+
+    # Cheap early answer from a pooled reader; the writer's ON CONFLICT settles races between submissions
+    if get_db_connection().execute("SELECT 1 FROM products WHERE barcode = ?", (barcode,)).fetchone():
         return jsonify({"error": f"Product with barcode {barcode} already exists."}), 409
 
+    # Row in products column order (prepared statement in the writer, preventing SQL Injection)
+    row = (
+        barcode,
+        data.get('name'),
+        data.get('brand'),
+        data.get('category', 'General'),
+        *(data[field] for field in NUTRIENT_FIELDS),
+        additives_str,
+        # Score once at write time so reads never have to
+        *score_fields
+    )
     try:
-        # Insert product (Uses prepared statements, preventing SQL Injection)
-        conn.execute("""
-            INSERT INTO products 
-            (barcode, name, brand, category, sugar, salt, fat, saturated_fat, protein, fiber, calories, additives) 
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            barcode, 
-            data.get('name'), 
-            data.get('brand'), 
-            data.get('category', 'General'), 
-            data.get('sugar', 0.0), 
-            data.get('salt', 0.0), 
-            data.get('fat', 0.0), 
-            data.get('saturated_fat', 0.0), 
-            data.get('protein', 0.0), 
-            data.get('fiber', 0.0), 
-            data.get('calories', 0.0),
-            additives_str
-        ))
-        
-        conn.commit()
-        
-        return jsonify({"message": "Product added successfully.", "barcode": barcode}), 201
+        submission_id = submission_queue.submit(row, additives_list)
+    except QueueFull:
+        return jsonify({"error": "Too many pending submissions, please retry shortly."}), 503, {'Retry-After': '5'}
+
+    status_url = f"/api/product/submissions/{submission_id}"
+    return jsonify({
+        "message": "Product submission accepted.",
+        "barcode": barcode,
+        "id": submission_id,
+        "status_url": status_url,
+    }), 202, {'Location': status_url}
+
+@app.route('/api/product/submissions/<submission_id>', methods=['GET'])
+def get_submission(submission_id):
+    """Status of a queued product submission: queued, added, duplicate or failed."""
+    # 🔑 SECURITY: Ids are 32 hex characters (see new_submission_id); reject anything else before touching the database
+    if not SUBMISSION_ID_PATTERN.fullmatch(submission_id):
+        return jsonify({"error": "Submission not found."}), 404
 
-    except sqlite3.Error as e:
-        conn.rollback()
-        return jsonify({"error": "Database error during product insertion.", "details": str(e)}), 500
+    status = submission_queue.status(get_db_connection(), submission_id)
+    if status is None:
+        return jsonify({"error": "Submission not found."}), 404
+    return jsonify(status)
 
 
 # --- Server Run ---
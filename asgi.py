@@ -0,0 +1,286 @@
+# asgi.py
+"""
+ASGI entry point for the Health Scanner API.
+
+    uvicorn asgi:app --workers 2
+
+The scan routes (GET /api/product/<barcode> and POST /api/products/lookup) are served by
+native async handlers: validation, caching and rate limits match the Flask app, and the
+SQLite work runs on a bounded thread executor so it never blocks the event loop. Upstream
+fetches for local misses wait on the network, so they get an executor of their own and
+never hold up database work. Every other route is forwarded to the Flask app (`app:app`)
+through a small WSGI bridge on the database executor, so both entry points serve
+identical behaviour.
+"""
+
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
+from urllib.parse import parse_qs
+
+from limits import parse as parse_limit
+from werkzeug.exceptions import TooManyRequests
+
+import app as flask_module
+from database import get_pool, PoolTimeout, is_valid_barcode, POOL_SIZE
+from cache import product_cache, missing_cache
+from metrics import registry
+from ratelimit import refund_hit
+from scoring import get_profile
+
+flask_app = flask_module.app
+
+# --- Executor Configuration ---
+# One thread per pooled reader: more threads would only queue on the pool
+ASGI_THREADS = int(os.environ.get('ASGI_THREADS', POOL_SIZE))
+executor = ThreadPoolExecutor(max_workers=ASGI_THREADS, thread_name_prefix='healthscanner-db')
+# Upstream misses can each wait UPSTREAM_TIMEOUT on the network: on the DB executor a few would stall every scan
+ASGI_UPSTREAM_THREADS = int(os.environ.get('ASGI_UPSTREAM_THREADS', '8'))
+upstream_executor = ThreadPoolExecutor(max_workers=ASGI_UPSTREAM_THREADS, thread_name_prefix='healthscanner-upstream')
+
+JSON_CONTENT_TYPE = flask_app.json.mimetype.encode()
+PRODUCT_PATH = re.compile(r'^/api/product/([^/]+)$')
+
+SCAN_LIMIT = parse_limit(flask_module.SCAN_RATE_LIMIT)
+LOOKUP_LIMIT = parse_limit(flask_module.LOOKUP_RATE_LIMIT)
+
+# --- Response Helpers ---
+
+def json_payload(payload):
+    # Same bytes as jsonify(), without needing an app context
+    return json.dumps(payload, separators=(',', ':'), sort_keys=True).encode() + b'\n'
+
+def cors_headers(scope):
+    # 🔑 SECURITY: Mirrors Flask-CORS: only origins in FRONTEND_URL are echoed back
+    origin = header_value(scope, b'origin')
+    if origin is None:
+        origin = flask_module.FRONTEND_URL[0]
+    elif origin not in flask_module.FRONTEND_URL:
+        return []
+    return [(b'access-control-allow-origin', origin.encode()), (b'vary', b'Origin')]
+
+def query_value(scope, name):
+    values = parse_qs(scope.get('query_string', b'').decode('latin-1')).get(name)
+    return values[0] if values else None
+
+def header_value(scope, name):
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+async def send_response(send, scope, status, body, content_type=JSON_CONTENT_TYPE, extra_headers=()):
+    # 304s carry validators only, no entity headers
+    headers = [] if status == 304 else [(b'content-type', content_type), (b'content-length', str(len(body)).encode())]
+    headers += [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in extra_headers]
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers + cors_headers(scope)})
+    await send({'type': 'http.response.body', 'body': body})
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+def rate_limit_identifiers(endpoint, scope):
+    client = scope.get('client')
+    return 'asgi', endpoint, client[0] if client else '127.0.0.1'
+
+def rate_limited(limit, endpoint, scope):
+    """Counts this request against `limit` in the Flask-Limiter storage; True when over the limit."""
+    if not flask_module.limiter.enabled:
+        return False
+    return not flask_module.limiter.limiter.hit(limit, *rate_limit_identifiers(endpoint, scope))
+
+def refund_rate_limit(limit, endpoint, scope, hit_at):
+    """Gives back a hit counted by rate_limited() at `hit_at`, for requests that turned out to be free."""
+    if flask_module.limiter.enabled:
+        refund_hit(flask_module.limiter.limiter, limit, rate_limit_identifiers(endpoint, scope), hit_at)
+
+def too_many_requests(limit):
+    # Same HTML body Flask-Limiter returns, e.g. "5 per 1 minute"
+    return TooManyRequests(description=str(limit)).get_body().encode()
+
+# --- Async Scan Handlers ---
+
+async def run_in_executor(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+async def run_upstream(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(upstream_executor, func, *args)
+
+def fetch_product(barcode, is_fresh, profile):
+    with get_pool().reader() as conn:
+        return flask_module.fetch_product_entry(conn, barcode, is_fresh, profile)
+
+def lookup_products(requested, profile):
+    with get_pool().reader() as conn:
+        return json_payload(flask_module.lookup_products_payload(conn, requested, profile))
+
+async def get_product(scope, receive, send, barcode):
+    # 🔑 SECURITY: Deducted up front so concurrent scans can't all pass one check; 304s are refunded after
+    if rate_limited(SCAN_LIMIT, 'get_product', scope):
+        return 429, too_many_requests(SCAN_LIMIT), b'text/html; charset=utf-8', ()
+    hit_at = time.time()  # After the hit, see refund_hit()
+    status, body, content_type, headers = await scan_product(scope, barcode)
+    if status == 304:
+        refund_rate_limit(SCAN_LIMIT, 'get_product', scope, hit_at)
+    return status, body, content_type, headers
+
+async def scan_product(scope, barcode):
+    # 🔑 SECURITY: Basic Input Validation
+    if not is_valid_barcode(barcode):
+        return 400, json_payload(flask_module.INVALID_BARCODE_ERROR), JSON_CONTENT_TYPE, ()
+    profile = get_profile(query_value(scope, 'profile'))
+    if profile is None:
+        return 400, json_payload(flask_module.UNKNOWN_PROFILE_ERROR), JSON_CONTENT_TYPE, ()
+
+    is_fresh = partial(flask_module.is_not_modified, header_value(scope, b'if-none-match'),
+                       header_value(scope, b'if-modified-since'))
+
+    # Cache hits, known-missing barcodes and snapshot hits never leave the event loop
+    entry = product_cache.get(flask_module.product_cache_key(barcode, profile))
+    if entry is None:
+        if missing_cache.get(barcode):
+            return 404, json_payload(flask_module.PRODUCT_NOT_FOUND_ERROR), JSON_CONTENT_TYPE, ()
+        # Snapshot lookups are an in-memory binary search, cheap enough for the event loop
+        entry = flask_module.fetch_snapshot_entry(barcode, is_fresh, profile)
+    if entry is None:
+        entry = await run_in_executor(fetch_product, barcode, is_fresh, profile)
+    if entry is None:
+        # Runs after the pooled reader is returned and off the DB executor, so slow upstream fetches hold neither
+        entry = await run_upstream(flask_module.fetch_missing_product, barcode, profile)
+    if entry is None:
+        return 404, json_payload(flask_module.PRODUCT_NOT_FOUND_ERROR), JSON_CONTENT_TYPE, ()
+
+    if entry.body is None or is_fresh(entry.etag, entry.updated_at):
+        return 304, b'', JSON_CONTENT_TYPE, flask_module.validator_headers(entry, not_modified=True)
+    return 200, entry.body, JSON_CONTENT_TYPE, flask_module.validator_headers(entry)
+
+async def lookup(scope, receive, send):
+    body = await read_body(receive)
+    if rate_limited(LOOKUP_LIMIT, 'lookup_products', scope):
+        return 429, too_many_requests(LOOKUP_LIMIT), b'text/html; charset=utf-8', ()
+
+    try:
+        data = json.loads(body) if body else None
+    except ValueError:
+        data = None
+    requested, error = flask_module.validate_lookup_request(data)
+    if error is not None:
+        return 400, json_payload(error), JSON_CONTENT_TYPE, ()
+    profile = get_profile(query_value(scope, 'profile'))
+    if profile is None:
+        return 400, json_payload(flask_module.UNKNOWN_PROFILE_ERROR), JSON_CONTENT_TYPE, ()
+    return 200, await run_in_executor(lookup_products, requested, profile), JSON_CONTENT_TYPE, ()
+
+async def handle_native(scope, receive, send, handler, endpoint, rule, *args):
+    started = time.perf_counter()
+    try:
+        status, body, content_type, headers = await handler(scope, receive, send, *args)
+    except PoolTimeout:
+        # All pooled connections stayed busy for the full timeout: ask the client to retry
+        status, content_type, headers = 503, JSON_CONTENT_TYPE, ()
+        body = json_payload({"error": "Service busy, please retry shortly."})
+    await send_response(send, scope, status, body, content_type, headers)
+    registry.route(endpoint, rule, scope['method']).record(status, time.perf_counter() - started)
+
+# --- WSGI Bridge (every other route) ---
+
+def wsgi_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('127.0.0.1', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+        'CONTENT_LENGTH': str(len(body)),
+    }
+    for key, value in scope['headers']:
+        name = key.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'CONTENT_LENGTH':
+            name = 'HTTP_' + name
+            environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+def call_wsgi(environ):
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+
+    iterable = flask_app(environ, start_response)
+    return started, iter(iterable), iterable
+
+def next_chunk(iterator):
+    return next(iterator, None)
+
+async def handle_wsgi(scope, receive, send):
+    body = await read_body(receive)
+    started, iterator, iterable = await run_in_executor(call_wsgi, wsgi_environ(scope, body))
+    try:
+        # Pull the first chunk before sending headers: Flask may call start_response lazily
+        chunk = await run_in_executor(next_chunk, iterator)
+        await send({'type': 'http.response.start', 'status': started['status'], 'headers': started['headers']})
+        while chunk is not None:
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            chunk = await run_in_executor(next_chunk, iterator)
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        if hasattr(iterable, 'close'):
+            await run_in_executor(iterable.close)
+
+# --- ASGI Application ---
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            executor.shutdown(wait=False)
+            upstream_executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    flask_module.change_watcher.ensure_running()
+    path, method = scope['path'], scope['method']
+    if method == 'GET':
+        match = PRODUCT_PATH.match(path)
+        if match:
+            return await handle_native(scope, receive, send, get_product, 'get_product', '/api/product/<barcode>', match.group(1))
+    elif method == 'POST' and path == '/api/products/lookup':
+        return await handle_native(scope, receive, send, lookup, 'lookup_products', '/api/products/lookup')
+    # CORS preflights and all remaining routes are served by Flask itself
+    await handle_wsgi(scope, receive, send)
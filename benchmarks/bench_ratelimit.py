@@ -0,0 +1,81 @@
+# benchmarks/bench_ratelimit.py
+"""
+Rate-limiter storage benchmark: per-hit overhead and cross-worker correctness.
+
+    python -m benchmarks.bench_ratelimit --processes 4 --output ratelimit.json
+
+Compares the old per-worker in-memory fixed window with the shared SQLite storage
+(ratelimit.SQLiteStorage). Overhead is timed per `hit()`. Correctness runs
+`--processes` workers hammering one client key against "5 per minute" and counts
+how many hits were allowed in total: a host-wide limit allows exactly 5.
+"""
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+
+from limits import parse as parse_limit
+from limits.storage import storage_from_string
+from limits.strategies import STRATEGIES
+
+import ratelimit  # noqa: F401 - registers the sqlite:// scheme
+from benchmarks.bench_scan import time_calls
+from benchmarks.results import write_results
+
+SCAN_LIMIT = "5 per minute"
+
+
+def make_limiter(uri, strategy):
+    return STRATEGIES[strategy](storage_from_string(uri))
+
+def configurations(directory):
+    return {
+        "memory_fixed_window": ("memory://", "fixed-window"),
+        "sqlite_fixed_window": (f"sqlite:///{os.path.join(directory, 'fixed.db')}", "fixed-window"),
+        "sqlite_sliding_window": (f"sqlite:///{os.path.join(directory, 'sliding.db')}", "sliding-window-counter"),
+    }
+
+def bench_overhead(uri, strategy, hits, clients):
+    """Per-hit latency over `clients` distinct keys, so both allowed and rejected hits are measured."""
+    limiter = make_limiter(uri, strategy)
+    item = parse_limit(SCAN_LIMIT)
+    return time_calls(limiter.hit, [(item, "bench", f"10.0.{i % clients // 256}.{i % 256}") for i in range(hits)])
+
+def _worker_hits(args):
+    uri, strategy, attempts = args
+    limiter = make_limiter(uri, strategy)
+    item = parse_limit(SCAN_LIMIT)
+    return sum(limiter.hit(item, "correctness", "203.0.113.7") for _ in range(attempts))
+
+def check_shared_limit(uri, strategy, processes, attempts):
+    """Total hits allowed across `processes` separate workers for one client."""
+    with multiprocessing.get_context('spawn').Pool(processes) as pool:
+        allowed = sum(pool.map(_worker_hits, [(uri, strategy, attempts)] * processes))
+    return {"processes": processes, "attempts": processes * attempts, "allowed": allowed,
+            "configured_limit": parse_limit(SCAN_LIMIT).amount}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rate-limiter storage overhead and correctness.")
+    parser.add_argument("--hits", type=int, default=20000, help="Timed hits per configuration.")
+    parser.add_argument("--clients", type=int, default=1000, help="Distinct client keys in the overhead run.")
+    parser.add_argument("--processes", type=int, default=4, help="Worker processes in the correctness run.")
+    parser.add_argument("--attempts", type=int, default=50, help="Hits per worker in the correctness run.")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout.")
+    args = parser.parse_args(argv)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, (uri, strategy) in configurations(directory).items():
+            results[name] = bench_overhead(uri, strategy, args.hits, args.clients)
+            storage_from_string(uri).reset()
+            results[name]["shared_limit"] = check_shared_limit(uri, strategy, args.processes, args.attempts)
+
+    params = {"hits": args.hits, "clients": args.clients, "processes": args.processes,
+              "attempts": args.attempts, "limit": SCAN_LIMIT}
+    return write_results("ratelimit", results, params, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+# benchmarks/bench_scan.py
+"""
+Micro-benchmarks for the scan path, run in-process against a synthetic catalogue.
+
+    python -m benchmarks.bench_scan --rows 100k --output scan.json
+
+Measures the scalar and batch scorers, database.get_product_by_barcode, the mmap'd
+catalogue snapshot lookup, and the GET /api/product/<barcode> route through the
+Flask test client with a cold and a hot response cache.
+"""
+
+import argparse
+import os
+import time
+from array import array
+
+import database
+from benchmarks.catalogue import build_catalogue, parse_size, pick_barcodes
+from benchmarks.results import summarize, write_results
+
+
+def time_calls(func, args_list):
+    samples = []
+    perf_counter = time.perf_counter
+    started = perf_counter()
+    for args in args_list:
+        t = perf_counter()
+        func(*args)
+        samples.append(perf_counter() - t)
+    return summarize(samples, perf_counter() - started)
+
+def bench_scoring(iterations):
+    from scoring import calculate_health_score, calculate_health_scores, PROFILES, DEFAULT_PROFILE
+
+    products = database.read_sample_products()
+    calls = [
+        ({'sugar': p[database.SUGAR], 'salt': p[database.SALT], 'saturated_fat': p[database.SAT_FAT],
+          'protein': p[database.PROTEIN], 'fiber': p[database.FIBER], 'calories': p[database.CALORIES]},
+         database.parse_additives(p[database.ADDITIVES]))
+        for p in products
+    ]
+    calls = (calls * (iterations // len(calls) + 1))[:iterations]
+    results = {"score_scalar": time_calls(calculate_health_score, calls)}
+    for name, profile in PROFILES.items():
+        if name != DEFAULT_PROFILE:
+            results[f"score_scalar_{name}"] = time_calls(profile.score, calls)
+
+    size = 100_000
+    columns = {
+        name: array('d', (products[i % len(products)][index] for i in range(size)))
+        for name, index in (('sugar', database.SUGAR), ('salt', database.SALT), ('saturated_fat', database.SAT_FAT),
+                            ('protein', database.PROTEIN), ('fiber', database.FIBER))
+    }
+    counts = array('i', (len(database.parse_additives(products[i % len(products)][database.ADDITIVES])) for i in range(size)))
+    started = time.perf_counter()
+    calculate_health_scores(columns, counts)
+    elapsed = time.perf_counter() - started
+    results["score_batch"] = {"count": size, "ops_per_sec": round(size / elapsed, 1), "total_ms": round(elapsed * 1e3, 2)}
+    return results
+
+def bench_lookup(barcodes):
+    with database.get_pool().reader() as conn:
+        return time_calls(database.get_product_by_barcode, [(conn, b) for b in barcodes])
+
+def bench_snapshot(path, barcodes):
+    import snapshot
+
+    # Keyed by format version too: an older snapshot next to the catalogue would fail to open
+    snapshot_path = f"{path}.v{snapshot.FORMAT_VERSION}.snap"
+    if not os.path.exists(snapshot_path):
+        with database.get_pool().reader() as conn:
+            snapshot.export_snapshot(conn, snapshot_path)
+    catalogue = snapshot.CatalogueSnapshot(snapshot_path)
+    return time_calls(catalogue.get, [(b,) for b in barcodes])
+
+def bench_route(barcodes, cached):
+    import app as app_module
+
+    client = app_module.app.test_client()
+    cache = app_module.product_cache
+    cache.clear()
+    maxsize = cache.maxsize
+    cache.maxsize = maxsize if cached else 0
+    try:
+        if cached:
+            for barcode in set(barcodes):
+                client.get(f"/api/product/{barcode}")  # Warm up
+        return time_calls(lambda b: client.get(f"/api/product/{b}"), [(b,) for b in barcodes])
+    finally:
+        cache.maxsize = maxsize
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scan-path micro-benchmarks.")
+    parser.add_argument("--rows", type=parse_size, default=parse_size('10k'), help="Catalogue size: 10k, 100k, 1m or an integer.")
+    parser.add_argument("--requests", type=int, default=5000, help="Lookups per benchmark.")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout.")
+    args = parser.parse_args(argv)
+
+    path = build_catalogue(args.rows)
+    # Must be set before the app module is imported and the pool is opened
+    database.DB_NAME = path
+    os.environ['RATELIMIT_ENABLED'] = '0'
+
+    results = bench_scoring(args.requests)
+    results["db_lookup_cold"] = bench_lookup(pick_barcodes(args.rows, args.requests, 'cold'))
+    results["snapshot_lookup_cold"] = bench_snapshot(path, pick_barcodes(args.rows, args.requests, 'cold'))
+    results["route_cold_cache_cold"] = bench_route(pick_barcodes(args.rows, args.requests, 'cold'), cached=False)
+    results["route_hot_cache_hot"] = bench_route(pick_barcodes(args.rows, args.requests, 'hot'), cached=True)
+
+    return write_results("scan", results, {"rows": args.rows, "requests": args.requests}, args.output)
+
+
+if __name__ == '__main__':
+    main()
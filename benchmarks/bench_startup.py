@@ -0,0 +1,106 @@
+# benchmarks/bench_startup.py
+"""
+Cold-start benchmark: how long a fresh worker takes to answer its first scan.
+
+    python -m benchmarks.bench_startup --runs 10 --output startup.json
+
+Each run starts a new interpreter that imports `app` and serves GET /api/product/<barcode>
+through the Flask test client, timing the import and the first response separately.
+Unless --skip-server is given, gunicorn is also started from scratch (master on_starting hook
+plus one worker) and timed from spawn until the first scan returns 200.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.catalogue import build_catalogue, parse_size, synthetic_barcode
+from benchmarks.loadtest import REPO_ROOT
+from benchmarks.results import summarize, write_results
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+response = app.app.test_client().get(sys.argv[1])
+finished = time.perf_counter()
+assert response.status_code == 200, response.status_code
+print(json.dumps({"import": imported - started, "first_response": finished - imported}))
+"""
+
+
+def probe_env(db_path):
+    return dict(os.environ, HEALTHSCANNER_DB=db_path, RATELIMIT_ENABLED='0', RATELIMIT_STORAGE_URI='memory://')
+
+def bench_import(db_path, path, runs):
+    """Import, first-response and whole-process times over `runs` fresh interpreters."""
+    timings = {"import_app": [], "first_response": [], "import_to_first_response": [], "process": []}
+    for _ in range(runs):
+        started = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", PROBE, path], cwd=REPO_ROOT, env=probe_env(db_path),
+                                capture_output=True, text=True, check=True).stdout
+        timings["process"].append(time.perf_counter() - started)
+        probe = json.loads(output.strip().splitlines()[-1])
+        timings["import_app"].append(probe["import"])
+        timings["first_response"].append(probe["first_response"])
+        timings["import_to_first_response"].append(probe["import"] + probe["first_response"])
+    return {name: summarize(samples) for name, samples in timings.items()}
+
+def wait_for_first_scan(port, path, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", path)
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.01)
+    raise RuntimeError(f"Server did not answer {path} within {timeout:.0f}s.")
+
+def bench_server(db_path, path, runs, port):
+    """Spawn-to-first-200 time for a one-worker gunicorn (reads gunicorn.conf.py from the repo root)."""
+    samples = []
+    for _ in range(runs):
+        command = [sys.executable, "-m", "gunicorn", "--workers", "1", "--bind", f"127.0.0.1:{port}",
+                   "--log-level", "warning", "app:app"]
+        started = time.perf_counter()
+        server = subprocess.Popen(command, cwd=REPO_ROOT, env=probe_env(db_path), stdout=subprocess.DEVNULL)
+        try:
+            wait_for_first_scan(port, path)
+            samples.append(time.perf_counter() - started)
+        finally:
+            server.terminate()
+            server.wait()
+    return summarize(samples)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import-to-first-response time for a fresh worker.")
+    parser.add_argument("--rows", type=parse_size, default=parse_size('10k'), help="Catalogue size: 10k, 100k, 1m or an integer.")
+    parser.add_argument("--runs", type=int, default=10, help="Fresh interpreters (and gunicorn starts) to time.")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--skip-server", action="store_true", help="Only time the in-process import and first response.")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout.")
+    args = parser.parse_args(argv)
+
+    db_path = build_catalogue(args.rows)
+    # The one-time startup step gunicorn's on_starting hook runs; probes then only pay for worker start-up
+    subprocess.run([sys.executable, "manage.py", "init"], cwd=REPO_ROOT, env=probe_env(db_path),
+                   stdout=subprocess.DEVNULL, check=True)
+    path = f"/api/product/{synthetic_barcode(0)}"
+    results = bench_import(db_path, path, args.runs)
+    if not args.skip_server:
+        results["gunicorn_first_scan"] = bench_server(db_path, path, args.runs, args.port)
+
+    params = {"rows": args.rows, "runs": args.runs}
+    return write_results("startup", results, params, args.output)
+
+
+if __name__ == '__main__':
+    main()
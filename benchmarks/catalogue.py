@@ -0,0 +1,110 @@
+# benchmarks/catalogue.py
+"""
+Deterministic synthetic catalogues built from the sample products, for benchmarks and load tests.
+
+    python -m benchmarks.catalogue 100000        # -> benchmarks/.data/catalogue-100000-<schema>.db
+
+Cached files are keyed by row count and a fingerprint of the schema, scoring rules and
+generator, so a commit that changes any of them builds a fresh catalogue instead of
+measuring a stale one.
+"""
+
+import argparse
+import hashlib
+import os
+import random
+import sqlite3
+import time
+
+import database
+from scoring import SCORING_RULES_VERSION
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.data')
+SIZES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+SEED = 20240601
+BATCH_SIZE = 10_000
+
+
+def synthetic_barcode(i):
+    # 13 digits with a '2' prefix (the GS1 in-store range), so they never collide with real sample barcodes
+    return f"2{i:012d}"
+
+def synthetic_products(rows, seed=SEED):
+    """Yields `rows` product tuples: sample products with jittered nutrients and unique barcodes."""
+    rng = random.Random(seed)
+    samples = database.read_sample_products()
+    for i in range(rows):
+        base = samples[i % len(samples)]
+        jitter = [round(max(0.0, v * rng.uniform(0.8, 1.2)), 2) for v in base[database.SUGAR:database.CALORIES]]
+        yield (
+            synthetic_barcode(i), f"{base[database.NAME]} #{i}", base[database.BRAND], base[database.CATEGORY],
+            *jitter, int(base[database.CALORIES] * rng.uniform(0.8, 1.2)), base[database.ADDITIVES],
+        )
+
+def pick_barcodes(rows, count, distribution='hot', seed=SEED):
+    """
+    Barcodes to request. 'hot': 90% of scans hit the 100 most popular products (Coke, milk, bread);
+    'cold': uniform over the whole catalogue, so caches rarely help.
+    """
+    rng = random.Random(seed)
+    hot = min(100, rows)
+    if distribution == 'hot':
+        return [synthetic_barcode(rng.randrange(hot) if rng.random() < 0.9 else rng.randrange(rows)) for _ in range(count)]
+    return [synthetic_barcode(rng.randrange(rows)) for _ in range(count)]
+
+def schema_fingerprint():
+    """Short hash of everything a cached catalogue's contents depend on besides its size."""
+    key = repr((database.MIGRATION_COLUMNS, database.SQL_CREATE_SECONDARY, sorted(database.SECONDARY_INDEXES.items()),
+                SCORING_RULES_VERSION, SEED))
+    return hashlib.blake2b(key.encode(), digest_size=4).hexdigest()
+
+def catalogue_path(rows):
+    return os.path.join(DATA_DIR, f"catalogue-{rows}-{schema_fingerprint()}.db")
+
+def build_catalogue(rows, path=None, force=False, log=print):
+    """Creates (or reuses) a catalogue database with `rows` synthetic products plus the samples."""
+    path = path or catalogue_path(rows)
+    if os.path.exists(path) and not force:
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+    started = time.perf_counter()
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    database.create_table(conn)
+    database.load_sample_data(conn)
+    # Like importer.py: one catalogue_stats rebuild at the end instead of per-row trigger work
+    for name in database.STATS_TRIGGERS:
+        conn.execute(f"DROP TRIGGER {name}")
+    batch = []
+    for product in synthetic_products(rows):
+        batch.append(product)
+        if len(batch) == BATCH_SIZE:
+            database.upsert_products(conn, batch)
+            conn.commit()
+            batch = []
+    if batch:
+        database.upsert_products(conn, batch)
+        conn.commit()
+    for sql in database.STATS_TRIGGERS.values():
+        conn.execute(sql)
+    database.rebuild_catalogue_stats(conn)
+    conn.execute("ANALYZE")
+    conn.close()
+    log(f"Built {path} ({rows} rows) in {time.perf_counter() - started:.1f}s")
+    return path
+
+def parse_size(value):
+    return SIZES.get(value.lower()) or int(value)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build a synthetic benchmark catalogue.")
+    parser.add_argument("rows", type=parse_size, help="Row count: 10k, 100k, 1m or an integer.")
+    parser.add_argument("--force", action="store_true", help="Rebuild even if the file exists.")
+    args = parser.parse_args()
+    build_catalogue(args.rows, force=args.force)
@@ -0,0 +1,53 @@
+# benchmarks/compare.py
+"""
+Compares two benchmark result files and flags regressions.
+
+    python -m benchmarks.compare baseline.json candidate.json --threshold 10
+"""
+
+import argparse
+import json
+import sys
+
+# Metrics where a higher value is better; everything else (latencies) is better lower
+HIGHER_IS_BETTER = {"ops_per_sec"}
+COMPARED_METRICS = ("ops_per_sec", "p50_us", "p95_us", "p99_us")
+
+
+def compare(baseline, candidate, threshold):
+    """Yields (benchmark, metric, before, after, percent change, regressed)."""
+    for name, before in baseline["results"].items():
+        after = candidate["results"].get(name)
+        if after is None:
+            continue
+        for metric in COMPARED_METRICS:
+            if metric not in before or metric not in after or not before[metric]:
+                continue
+            change = (after[metric] - before[metric]) / before[metric] * 100
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            yield name, metric, before[metric], after[metric], change, worse > threshold
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Percent change counted as a regression.")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    print(f"{baseline.get('commit')} -> {candidate.get('commit')}")
+    regressions = 0
+    for name, metric, before, after, change, regressed in compare(baseline, candidate, args.threshold):
+        regressions += regressed
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:28} {metric:12} {before:>14} -> {after:>14} ({change:+.1f}%){flag}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
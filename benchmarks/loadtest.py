@@ -0,0 +1,124 @@
+# benchmarks/loadtest.py
+"""
+Concurrent load driver for GET /api/product/<barcode>.
+
+Spawns the app under gunicorn (or uvicorn with --server asgi) with the requested worker count against a synthetic
+catalogue (or targets an already running server with --url), then replays hot and
+cold barcode distributions from concurrent client threads.
+
+    python -m benchmarks.loadtest --rows 100k --workers 4 --concurrency 32 --output load.json
+"""
+
+import argparse
+import http.client
+import os
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+from benchmarks.catalogue import build_catalogue, parse_size, pick_barcodes
+from benchmarks.results import summarize, write_results
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def start_server(db_path, workers, port, extra_args=(), server='wsgi'):
+    env = dict(os.environ, HEALTHSCANNER_DB=db_path, RATELIMIT_ENABLED='0')
+    if server == 'asgi':
+        command = [
+            sys.executable, "-m", "uvicorn", "--workers", str(workers), "--host", "127.0.0.1", "--port", str(port),
+            "--log-level", "warning", *extra_args, "asgi:app",
+        ]
+    else:
+        command = [
+            sys.executable, "-m", "gunicorn", "--workers", str(workers), "--bind", f"127.0.0.1:{port}",
+            "--log-level", "warning", *extra_args, "app:app",
+        ]
+    server = subprocess.Popen(command, cwd=REPO_ROOT, env=env)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/api")
+            if conn.getresponse().status == 200:
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("Server did not become ready within 30s.")
+
+def run_load(base_url, barcodes, concurrency):
+    """Replays `barcodes` from `concurrency` threads; returns latency summary plus status counts."""
+    parts = urlsplit(base_url)
+    samples = [[] for _ in range(concurrency)]
+    statuses = [{} for _ in range(concurrency)]
+
+    def client(index):
+        conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+        perf_counter = time.perf_counter
+        for barcode in barcodes[index::concurrency]:
+            started = perf_counter()
+            try:
+                conn.request("GET", f"{parts.path}/api/product/{barcode}")
+                response = conn.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                status = 0
+            samples[index].append(perf_counter() - started)
+            statuses[index][status] = statuses[index].get(status, 0) + 1
+        conn.close()
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    summary = summarize([s for per_thread in samples for s in per_thread], elapsed)
+    merged = {}
+    for per_thread in statuses:
+        for status, count in per_thread.items():
+            merged[str(status)] = merged.get(str(status), 0) + count
+    summary["statuses"] = merged
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent load test for the product scan endpoint.")
+    parser.add_argument("--rows", type=parse_size, default=parse_size('100k'), help="Catalogue size: 10k, 100k, 1m or an integer.")
+    parser.add_argument("--workers", type=int, default=4, help="Server worker processes to spawn.")
+    parser.add_argument("--server", choices=("wsgi", "asgi"), default="wsgi", help="Spawn gunicorn app:app or uvicorn asgi:app.")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent client threads.")
+    parser.add_argument("--requests", type=int, default=20000, help="Requests per distribution.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--url", help="Target a running server instead of spawning gunicorn.")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout.")
+    args = parser.parse_args(argv)
+
+    server = None
+    if not args.url:
+        server = start_server(build_catalogue(args.rows), args.workers, args.port, server=args.server)
+    base_url = args.url or f"http://127.0.0.1:{args.port}"
+    try:
+        results = {
+            distribution: run_load(base_url, pick_barcodes(args.rows, args.requests, distribution), args.concurrency)
+            for distribution in ('hot', 'cold')
+        }
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    params = {"rows": args.rows, "workers": args.workers, "server": args.server, "concurrency": args.concurrency,
+              "requests": args.requests, "url": args.url}
+    return write_results("load", results, params, args.output)
+
+
+if __name__ == '__main__':
+    main()
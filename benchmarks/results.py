@@ -0,0 +1,54 @@
+# benchmarks/results.py
+"""Machine-readable benchmark results, so runs can be compared between commits."""
+
+import json
+import platform
+import subprocess
+import sys
+import time
+
+
+def percentile(sorted_samples, q):
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, int(round(q * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+def summarize(samples, elapsed=None):
+    """Latency samples (seconds) -> throughput and percentile summary in microseconds."""
+    samples = sorted(samples)
+    total = elapsed if elapsed is not None else sum(samples)
+    return {
+        "count": len(samples),
+        "ops_per_sec": round(len(samples) / total, 1) if total else 0.0,
+        "mean_us": round(sum(samples) / len(samples) * 1e6, 2) if samples else 0.0,
+        "p50_us": round(percentile(samples, 0.50) * 1e6, 2),
+        "p95_us": round(percentile(samples, 0.95) * 1e6, 2),
+        "p99_us": round(percentile(samples, 0.99) * 1e6, 2),
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def write_results(kind, results, params, output=None):
+    document = {
+        "kind": kind,
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "params": params,
+        "results": results,
+    }
+    text = json.dumps(document, indent=2)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return document
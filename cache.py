@@ -0,0 +1,170 @@
+# cache.py
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# --- Cache Configuration ---
+PRODUCT_CACHE_SIZE = int(os.environ.get('PRODUCT_CACHE_SIZE', '2048'))
+PRODUCT_CACHE_TTL = float(os.environ.get('PRODUCT_CACHE_TTL', '0'))  # Seconds; 0 disables expiry
+# How often each worker looks for rows changed by other connections (imports, rescoring, other workers)
+CACHE_CHECK_SECONDS = float(os.environ.get('CACHE_CHECK_SECONDS', '2'))
+CACHE_INVALIDATE_MAX = 5000  # More changed rows than this in one check (a bulk import): clear everything
+# updated_at is stamped when a row is written but becomes visible at commit: rows stamped up to this many
+# seconds before the newest one seen are read again, so a transaction that commits late is still noticed
+CACHE_CHANGE_OVERLAP_SECONDS = 30
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    A bounded, thread-safe LRU cache with an optional time-to-live.
+
+    Entries are evicted least-recently-used first once `maxsize` is reached.
+    When `ttl` is set, entries older than `ttl` seconds are treated as misses.
+    """
+
+    def __init__(self, maxsize=PRODUCT_CACHE_SIZE, ttl=PRODUCT_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl or None
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+            self._data[key] = (value, expires_at)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+# Serialized JSON bodies of GET /api/product/<barcode>, keyed by barcode
+product_cache = LRUCache()
+
+# Barcodes known to be missing (locally and upstream), so repeated scans skip the database
+MISSING_CACHE_SIZE = int(os.environ.get('MISSING_CACHE_SIZE', '10000'))
+MISSING_CACHE_TTL = float(os.environ.get('MISSING_CACHE_TTL', '300'))
+missing_cache = LRUCache(maxsize=MISSING_CACHE_SIZE, ttl=MISSING_CACHE_TTL)
+
+
+class ChangeWatcher:
+    """
+    Background thread that polls products.updated_at (indexed) for rows committed by any connection
+    since the last check, and hands their barcodes to `on_changed`. A bulk rewrite of more than
+    `max_changes` rows calls `on_reset` instead, so each worker drops stale responses and misses.
+    """
+
+    def __init__(self, on_changed, on_reset, interval=CACHE_CHECK_SECONDS, max_changes=CACHE_INVALIDATE_MAX,
+                 overlap=CACHE_CHANGE_OVERLAP_SECONDS):
+        self.on_changed = on_changed
+        self.on_reset = on_reset
+        self.interval = interval
+        self.max_changes = max_changes
+        self.overlap = overlap
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._newest = None  # Newest updated_at seen so far (not the time of the last check)
+        self._floor = None  # Nothing stamped before this needs invalidating: the cache was empty or just cleared
+        self._seen = {}  # Barcode -> updated_at already handed over, within the overlap window
+        self._stats = {"checks": 0, "invalidated": 0, "resets": 0, "errors": 0}
+
+    def ensure_running(self):
+        # 🔑 Started lazily (and again after a fork): threads do not survive into gunicorn's forked workers
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid != os.getpid() or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._newest = self._floor = int(time.time())
+                self._seen = {}
+                self._thread = threading.Thread(target=self._run, name='cache-change-watcher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.check()
+
+    def check(self):
+        import sqlite3
+        from database import get_pool, PoolTimeout  # Imported here: database is not needed to use the LRU cache
+        now = int(time.time())
+        # The window is re-read every time: rows seen with the same updated_at are skipped, not invalidated again
+        start = max(self._newest - self.overlap, self._floor)
+        try:
+            with get_pool().reader() as conn:
+                rows = conn.execute(
+                    "SELECT barcode, updated_at FROM products WHERE updated_at >= ? LIMIT ?",
+                    (start, self.max_changes + len(self._seen) + 1)
+                ).fetchall()
+        except (sqlite3.Error, PoolTimeout) as e:
+            self._stats["errors"] += 1
+            print(f"Error checking for changed products: {e}")
+            return
+        changed = [(barcode, updated_at) for barcode, updated_at in rows if self._seen.get(barcode) != updated_at]
+        self._stats["checks"] += 1
+        if len(changed) > self.max_changes:
+            # Everything is dropped, so the rows of this bulk write are not read again
+            self._newest = self._floor = now
+            self._seen = {}
+            self._stats["resets"] += 1
+            self.on_reset()
+            return
+        if changed:
+            self._seen.update(changed)
+            self._newest = max(self._newest, max(updated_at for _, updated_at in changed))
+            start = max(self._newest - self.overlap, self._floor)
+            self._seen = {barcode: updated_at for barcode, updated_at in self._seen.items() if updated_at >= start}
+            self._stats["invalidated"] += len(changed)
+            self.on_changed([barcode for barcode, _ in changed])
+
+    def stats(self):
+        return dict(self._stats, interval=self.interval)
@@ -2,11 +2,19 @@
 
 import sqlite3
 import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from scoring import calculate_health_score, calculate_health_scores, SCORING_RULES_VERSION
+from metrics import registry, timed
+from analytics import SQL_CREATE_CATALOGUE_STATS_TABLE, STATS_TRIGGERS, rebuild_catalogue_stats
 
 # --- Database Configuration ---
-DB_NAME = 'healthscanner.db'
+DB_NAME = os.environ.get('HEALTHSCANNER_DB', 'healthscanner.db')
 
-# Column indices for easy access (used in load_sample_data)
+# Column indices of product tuples (sample data, imports and upserts)
 BARCODE = 0
 NAME = 1
 BRAND = 2
@@ -20,160 +28,23 @@ FIBER = 9
 CALORIES = 10
 ADDITIVES = 11
 
-# --- Sample Data (104 Products) ---
-# Format: (Barcode, Name, Brand, Category, Sugar, Salt, Fat, Sat_Fat, Protein, Fiber, Calories (kcal), Additives)
-# Nutritional values are per 100g/100ml
-SAMPLE_PRODUCTS = [
-    # --- 1. Original 14 Products ---
-    ("6009900000001", "Full Cream Milk", "Clover", "Dairy", 4.7, 0.10, 3.3, 2.0, 3.4, 0.0, 61, ""),
-    ("6009900000002", "White Rice (Cooked)", "Tastic", "Staple", 0.0, 0.00, 0.0, 0.0, 2.7, 0.4, 130, ""),
-    ("6009900000003", "Coke Original", "Coca-Cola", "Soda", 10.6, 0.00, 0.0, 0.0, 0.0, 0.0, 42, "E150d,E338"),
-    ("6009900000004", "Baked Beans in Tomato Sauce", "Koo", "Canned", 5.0, 0.50, 0.5, 0.1, 4.0, 5.0, 100, "E1422"),
-    ("6009900000005", "Biltong (Lean Beef)", "Generic Butcher", "Protein", 1.0, 2.50, 5.0, 2.0, 50.0, 0.0, 260, "E250,E301"),
-    ("6009900000006", "Wholewheat Bread", "Albany", "Bakery", 3.0, 0.45, 2.0, 0.4, 9.0, 5.0, 230, "E282"),
-    ("6009900000007", "Salted Butter", "Anchor", "Dairy", 0.1, 1.80, 81.0, 51.0, 0.5, 0.0, 740, ""),
-    ("6009900000008", "Cheddar Cheese", "Lactalis", "Dairy", 0.1, 1.80, 33.0, 20.0, 25.0, 0.0, 400, ""),
-    ("6009900000009", "Potato Chips (Salted)", "Lay's", "Snack", 0.5, 1.00, 35.0, 4.0, 6.0, 3.0, 550, "E621"),
-    ("6009900000010", "100% Orange Juice", "Ceres", "Juice", 10.0, 0.00, 0.0, 0.0, 0.5, 0.5, 45, ""),
-    ("6009900000011", "Sweet Biscuits (Cream Filled)", "Bakers", "Snack", 30.0, 0.40, 25.0, 15.0, 4.0, 1.0, 520, "E471,E450"),
-    ("6009900000012", "Polony (Red)", "Eskort", "Processed Meat", 1.0, 2.50, 20.0, 8.0, 10.0, 0.0, 240, "E250,E316,E407"),
-    ("6009900000013", "Olive Oil (Extra Virgin)", "B-Well", "Oil", 0.0, 0.00, 100.0, 14.0, 0.0, 0.0, 900, ""),
-    ("6009900000014", "Instant Noodles (Chicken)", "Noodle King", "Pasta", 2.0, 1.20, 8.0, 4.0, 7.0, 2.0, 420, "E621,E150a"),
-
-    # --- 2. New 90 Common SA Products for Demo ---
-    # B01: Dairy & Alternatives
-    ("6000000000101", "Danone Plain Yoghurt", "Danone", "Dairy", 4.5, 0.15, 3.5, 2.0, 5.0, 0.0, 65, ""),
-    ("6000000000102", "Clover Bliss Chocolate", "Clover", "Dairy", 14.0, 0.20, 2.5, 1.5, 3.0, 0.0, 95, "E1422,E407"),
-    ("6000000000103", "Parmalat Cheddar Cheese", "Parmalat", "Dairy", 0.1, 1.80, 33.0, 20.0, 25.0, 0.0, 400, ""),
-    ("6000000000104", "Rama Original Margarine", "Rama", "Spreads", 0.5, 0.70, 70.0, 25.0, 0.0, 0.0, 630, "E471,E160a"),
-    ("6000000000105", "Clover Fresh Cream", "Clover", "Dairy", 3.5, 0.10, 35.0, 22.0, 2.0, 0.0, 330, ""),
-    ("6000000000106", "Oatly Oat Drink Original", "Oatly", "Alt. Dairy", 4.0, 0.10, 1.5, 0.2, 1.0, 0.8, 45, ""),
-    
-    # B02: Snacks & Treats
-    ("6000000000201", "Bakers Tennis Biscuits", "Bakers", "Snack", 22.0, 0.50, 20.0, 11.0, 5.0, 1.0, 480, "E450,E500"),
-    ("6000000000202", "Pringles Original", "Pringles", "Snack", 0.5, 0.80, 32.0, 3.0, 6.0, 3.0, 530, "E621,E635"),
-    ("6000000000203", "Cadbury Dairy Milk", "Cadbury", "Chocolate", 56.0, 0.20, 30.0, 18.0, 8.0, 0.5, 550, "E476"),
-    ("6000000000204", "Beacon Heavenly Hash", "Beacon", "Sweets", 70.0, 0.10, 1.0, 0.5, 0.5, 0.0, 320, "E129,E133"),
-    ("6000000000205", "Willards Big Korn Bites", "Willards", "Snack", 1.0, 1.30, 25.0, 3.0, 7.0, 2.0, 500, "E621,E631,E627"),
-    ("6000000000206", "Safari Mixed Dried Fruit", "Safari", "Dried Fruit", 45.0, 0.10, 1.0, 0.5, 3.0, 7.0, 300, "E220"),
-    ("6000000000207", "ProNutro Power Bar", "ProNutro", "Bar", 20.0, 0.50, 15.0, 5.0, 18.0, 5.0, 450, "E320"),
-    ("6000000000208", "Five Roses Tea Bags (No milk/sugar)", "Five Roses", "Beverage", 0.0, 0.00, 0.0, 0.0, 0.0, 0.0, 0, ""),
-    ("6000000000209", "Ricoffy Instant Coffee", "Ricoffy", "Beverage", 0.0, 0.00, 0.0, 0.0, 0.0, 0.0, 2, ""),
-    ("6000000000210", "Lay's Salted Chips", "Lay's", "Snack", 0.5, 1.00, 35.0, 4.0, 6.0, 3.0, 550, ""),
-
-    # B03: Staples & Grains
-    ("6000000000301", "White Star Maize Meal", "White Star", "Staple", 1.0, 0.00, 1.0, 0.2, 8.0, 4.0, 350, ""),
-    ("6000000000302", "Sasko Brown Bread", "Sasko", "Bakery", 3.5, 0.40, 2.5, 0.5, 9.5, 5.5, 240, "E282"),
-    ("6000000000303", "Kellogg's Corn Flakes", "Kellogg's", "Cereal", 8.0, 0.80, 0.5, 0.1, 7.0, 1.5, 370, ""),
-    ("6000000000304", "Pioneer Ready-to-Eat Oats", "Pioneer", "Cereal", 1.0, 0.05, 7.0, 1.0, 13.0, 10.0, 380, ""),
-    ("6000000000305", "Jungle Oats Original", "Jungle", "Cereal", 1.5, 0.05, 8.0, 1.5, 14.0, 11.0, 390, ""),
-    ("6000000000306", "Spekko Blue Rice", "Spekko", "Grain", 0.2, 0.00, 0.0, 0.0, 7.0, 0.8, 360, ""),
-    ("6000000000307", "Noodle King Noodles Chicken", "Noodle King", "Pasta", 2.0, 1.20, 8.0, 4.0, 7.0, 2.0, 420, "E621,E150a"),
-    ("6000000000308", "Bokomo Weet-Bix", "Bokomo", "Cereal", 4.0, 0.40, 1.5, 0.3, 12.0, 10.0, 370, ""),
-    ("6000000000309", "Iwisa Maize Meal", "Iwisa", "Staple", 1.0, 0.00, 1.0, 0.2, 8.0, 4.0, 350, ""),
-
-    # B04: Sauces, Condiments & Spreads
-    ("6000000000401", "Knorr Brown Onion Soup", "Knorr", "Soup", 15.0, 4.00, 1.0, 0.5, 4.0, 0.5, 100, "E621,E631"),
-    ("6000000000402", "All Gold Tomato Sauce", "All Gold", "Sauce", 20.0, 1.20, 0.1, 0.0, 0.5, 1.0, 85, "E211"),
-    ("6000000000403", "Black Cat Smooth Peanut Butter", "Black Cat", "Spread", 8.0, 0.50, 48.0, 8.0, 25.0, 5.0, 600, "E471"),
-    ("6000000000404", "Wellington's Sweet Chili Sauce", "Wellington's", "Sauce", 30.0, 1.50, 0.1, 0.0, 0.5, 0.5, 130, "E202,E211"),
-    ("6000000000405", "Robertsons Spices (Mixed Herbs)", "Robertsons", "Spice", 0.0, 0.00, 0.0, 0.0, 0.0, 0.0, 0, ""),
-    ("6000000000406", "Crosse & Blackwell Mayonnaise", "C&B", "Condiment", 5.0, 0.80, 70.0, 10.0, 1.0, 0.0, 650, "E385,E412"),
-    ("6000000000407", "Rajah Curry Powder Mild", "Rajah", "Spice", 0.0, 0.00, 10.0, 1.0, 10.0, 30.0, 350, "E102,E110"),
-    ("6000000000408", "Mrs Ball's Original Chutney", "Mrs Ball's", "Condiment", 25.0, 1.00, 0.1, 0.0, 0.1, 0.5, 80, "E330,E415"),
-
-    # B05: Beverages & Juices
-    ("6000000000501", "Fanta Orange Soda", "Fanta", "Soda", 11.0, 0.00, 0.0, 0.0, 0.0, 0.0, 44, "E110,E129"),
-    ("6000000000502", "Valpre Still Water", "Valpre", "Water", 0.0, 0.00, 0.0, 0.0, 0.0, 0.0, 0, ""),
-    ("6000000000503", "Ceres 100% Orange Juice", "Ceres", "Juice", 10.0, 0.00, 0.0, 0.0, 0.5, 0.5, 45, ""),
-    ("6000000000504", "Nestea Peach Iced Tea", "Nestea", "Iced Tea", 5.0, 0.05, 0.0, 0.0, 0.0, 0.0, 20, "E211,E330"),
-    ("6000000000505", "Appletiser Sparkling Juice", "Appletiser", "Juice", 10.0, 0.00, 0.0, 0.0, 0.0, 0.0, 42, ""),
-    ("6000000000506", "BOS Ice Tea Lemon", "BOS", "Iced Tea", 3.0, 0.00, 0.0, 0.0, 0.0, 0.0, 12, ""),
-
-    # B06: Tinned & Canned Goods
-    ("6000000000601", "Lucky Star Pilchards (Tomato Sauce)", "Lucky Star", "Canned Fish", 4.0, 1.00, 10.0, 3.0, 18.0, 1.0, 170, "E1422"),
-    ("6000000000602", "Koo Peaches in Syrup", "Koo", "Canned Fruit", 18.0, 0.05, 0.1, 0.0, 0.5, 1.0, 75, "E330"),
-    ("6000000000603", "Rhodes Tomato Puree", "Rhodes", "Canned Veg", 3.0, 0.50, 0.1, 0.0, 1.5, 2.0, 30, "E330"),
-    ("6000000000604", "Rajah Tinned Beans (Chili)", "Rajah", "Canned Legumes", 4.0, 0.60, 1.0, 0.2, 5.0, 5.0, 120, "E150a"),
-    ("6000000000605", "Koo Baked Beans (Sweetened)", "Koo", "Canned Legumes", 5.0, 0.50, 0.5, 0.1, 4.0, 5.0, 100, "E1422"),
-
-    # B07: Ready Meals & Frozen
-    ("6000000000701", "Fry's Chicken-Style Strips", "Fry's", "Frozen Veggie", 0.5, 1.00, 3.0, 0.5, 20.0, 5.0, 130, "E621"),
-    ("6000000000702", "McCain French Fries", "McCain", "Frozen Veg", 0.5, 0.10, 5.0, 1.0, 2.0, 3.0, 150, "E450"),
-    ("6000000000703", "Eskimo Pies", "Eskimo", "Ice Cream", 28.0, 0.10, 18.0, 12.0, 4.0, 0.0, 300, "E471,E412"),
-    ("6000000000704", "I&J Crumbed Hake Fillets", "I&J", "Frozen Fish", 1.0, 0.80, 8.0, 2.0, 14.0, 1.0, 180, "E450"),
-    ("6000000000705", "Dr. Oetker Pizza Margherita", "Dr. Oetker", "Frozen Pizza", 2.5, 1.20, 12.0, 6.0, 10.0, 2.0, 280, "E472e"),
-
-    # B08: Baking & Cooking
-    ("6000000000801", "Selati White Sugar", "Selati", "Baking", 100.0, 0.00, 0.0, 0.0, 0.0, 0.0, 400, ""),
-    ("6000000000802", "Snowflake Cake Flour", "Snowflake", "Baking", 0.5, 0.00, 1.0, 0.2, 10.0, 3.0, 360, ""),
-    ("6000000000803", "B-Well Canola Oil", "B-Well", "Oil", 0.0, 0.00, 100.0, 8.0, 0.0, 0.0, 900, ""),
-    ("6000000000804", "Huletts Brown Sugar", "Huletts", "Baking", 98.0, 0.00, 0.0, 0.0, 0.0, 0.0, 390, ""),
-    ("6000000000805", "Safari Yeast", "Safari", "Baking", 0.0, 0.00, 1.0, 0.2, 40.0, 20.0, 300, ""),
-
-    # B09: Cereals & Breakfast
-    ("6000000000901", "Nestlé Milo", "Nestlé", "Cereal", 50.0, 0.30, 8.0, 4.0, 12.0, 3.0, 420, "E341"),
-    ("6000000000902", "Clover Tropika Fruit Nectar", "Clover", "Beverage", 8.0, 0.05, 0.0, 0.0, 0.0, 0.0, 35, "E102,E110,E122"),
-    ("6000000000903", "Kellogg's Coco Pops", "Kellogg's", "Cereal", 35.0, 0.50, 2.0, 1.0, 5.0, 1.0, 390, "E320"),
-    ("6000000000904", "Liqui-Fruit Guava 100% Juice", "Liqui-Fruit", "Juice", 9.0, 0.00, 0.0, 0.0, 0.1, 0.0, 40, ""),
-    ("6000000000905", "Nescafé Instant Coffee (Pure)", "Nescafé", "Beverage", 0.0, 0.00, 0.0, 0.0, 0.0, 0.0, 2, ""),
-
-    # B10: Meats & Processed
-    ("6000000001001", "Eskort Polony Red", "Eskort", "Processed Meat", 1.0, 2.50, 20.0, 8.0, 10.0, 0.0, 240, "E250,E316,E407"),
-    ("6000000001002", "Rainbow Chicken Frozen Drumsticks", "Rainbow", "Frozen Meat", 0.0, 0.50, 15.0, 5.0, 20.0, 0.0, 220, ""),
-    ("6000000001003", "Enterprise Beef Boerewors", "Enterprise", "Processed Meat", 1.0, 1.50, 30.0, 15.0, 15.0, 0.0, 350, "E223,E300"),
-    ("6000000001004", "Sea Harvest Hake Medallions", "Sea Harvest", "Frozen Fish", 0.0, 0.50, 2.0, 0.5, 18.0, 0.0, 90, ""),
-
-    # B11: General Household & Snacks
-    ("6000000001101", "Sunlight Dishwashing Liquid", "Sunlight", "Household", 0.0, 0.00, 0.0, 0.0, 0.0, 0.0, 0, ""), # Non-food item for demo of "not found" or category filtering
-    ("6000000001102", "Koo Green Beans (Salted)", "Koo", "Canned Veg", 3.0, 0.40, 0.1, 0.0, 1.5, 3.0, 30, ""),
-    ("6000000001103", "Oros Orange Squash", "Oros", "Drink Mix", 35.0, 0.05, 0.0, 0.0, 0.0, 0.0, 140, "E104,E110,E211"),
-    ("6000000001104", "Selati Icing Sugar", "Selati", "Baking", 100.0, 0.00, 0.0, 0.0, 0.0, 0.0, 400, ""),
-    ("6000000001105", "Albany Low GI White Bread", "Albany", "Bakery", 4.0, 0.45, 2.5, 0.5, 9.0, 5.0, 250, "E282"),
-    ("6000000001106", "Kellogg's Special K", "Kellogg's", "Cereal", 15.0, 0.80, 1.0, 0.2, 10.0, 1.0, 380, "E320"),
-    ("6000000001107", "Black Cat Crunchy Peanut Butter", "Black Cat", "Spread", 8.0, 0.50, 48.0, 8.0, 25.0, 5.0, 600, "E471"),
-    ("6000000001108", "Knorr Aromat Seasoning", "Knorr", "Seasoning", 1.0, 15.0, 0.1, 0.0, 1.0, 0.0, 50, "E621,E631"),
-    ("6000000001109", "Bakers Eet-Sum-Mor Biscuits", "Bakers", "Snack", 20.0, 0.60, 22.0, 12.0, 6.0, 1.0, 500, "E450,E500"),
-    ("6000000001110", "Simba NikNaks Cheese", "Simba", "Snack", 1.0, 1.50, 28.0, 4.0, 6.0, 2.0, 510, "E621,E635,E110"),
-
-    # B12: Additional Staples
-    ("6000000001201", "Sasko Self-Raising Flour", "Sasko", "Baking", 0.5, 0.10, 1.0, 0.2, 10.0, 3.0, 360, "E500,E450"),
-    ("6000000001202", "Nulaid Large Eggs", "Nulaid", "Protein", 0.0, 0.40, 10.0, 3.0, 13.0, 0.0, 140, ""),
-    ("6000000001203", "Robertsons Rajah Hot Curry Powder", "Robertsons", "Spice", 0.0, 0.00, 10.0, 1.0, 10.0, 30.0, 350, "E102,E110"),
-    ("6000000001204", "Huletts Caster Sugar", "Huletts", "Baking", 100.0, 0.00, 0.0, 0.0, 0.0, 0.0, 400, ""),
-    ("6000000001205", "Sasko Sam's Cake Mix Vanilla", "Sasko", "Baking", 35.0, 0.50, 12.0, 6.0, 4.0, 1.0, 400, "E471,E150"),
-    ("6000000001206", "Clover Medium Fat Cottage Cheese", "Clover", "Dairy", 3.0, 0.60, 4.0, 2.5, 10.0, 0.0, 90, ""),
-    ("6000000001207", "Lipton Black Tea", "Lipton", "Beverage", 0.0, 0.00, 0.0, 0.0, 0.0, 0.0, 0, ""),
-    ("6000000001208", "Five Roses Rooibos Tea", "Five Roses", "Beverage", 0.0, 0.00, 0.0, 0.0, 0.0, 0.0, 0, ""),
-    ("6000000001209", "Kelloggs All-Bran Flakes", "Kellogg's", "Cereal", 20.0, 0.50, 1.5, 0.3, 10.0, 15.0, 340, ""),
-    ("6000000001210", "Albany White Sliced Bread", "Albany", "Bakery", 4.5, 0.50, 2.5, 0.5, 8.0, 2.5, 260, "E282"),
-
-    # B13: Frozen & Ice Cream
-    ("6000000001301", "Ola Rich 'n Creamy Vanilla", "Ola", "Ice Cream", 22.0, 0.10, 12.0, 8.0, 4.0, 0.0, 240, "E471,E412,E160a"),
-    ("6000000001302", "Natures Garden Mixed Veg", "Natures Garden", "Frozen Veg", 4.0, 0.10, 0.1, 0.0, 2.0, 4.0, 40, ""),
-    ("6000000001303", "Nando's Peri-Peri Sauce (Medium)", "Nando's", "Sauce", 4.0, 2.50, 5.0, 1.0, 1.0, 1.0, 80, "E415"),
-    ("6000000001304", "Beacon Sparkles", "Beacon", "Sweets", 65.0, 0.10, 5.0, 3.0, 1.0, 0.0, 350, "E102,E129,E133"),
-    ("6000000001305", "Bakers Salticrax", "Bakers", "Snack", 1.0, 1.50, 20.0, 5.0, 8.0, 3.0, 450, "E503"),
-    ("6000000001306", "Willards Crinkle Cut Chips", "Willards", "Snack", 0.5, 1.40, 30.0, 4.0, 6.0, 3.0, 530, "E621,E631"),
-
-    # B14: Spreads & Fats
-    ("6000000001401", "Golden Cloud Cake Flour", "Golden Cloud", "Baking", 0.5, 0.00, 1.0, 0.2, 10.0, 3.0, 360, ""),
-    ("6000000001402", "Sunfoil Sunflower Oil", "Sunfoil", "Oil", 0.0, 0.00, 100.0, 10.0, 0.0, 0.0, 900, ""),
-    ("6000000001403", "Liqui-Fruit Cranberry 100% (Dummy)", "Liqui-Fruit", "Juice", 9.0, 0.00, 0.0, 0.0, 0.1, 0.0, 40, ""),
-    ("6000000001404", "Clover Full Cream Yoghurt Strawberry", "Clover", "Dairy", 12.0, 0.20, 3.0, 2.0, 4.0, 0.0, 90, "E120"),
-    ("6000000001405", "Tastic Parboiled Rice", "Tastic", "Grain", 0.2, 0.00, 0.0, 0.0, 7.0, 0.8, 360, ""),
-
-    # B15: Last 5 for 104 Total
-    ("6000000001501", "Albany Low GI Seeded Bread", "Albany", "Bakery", 3.0, 0.35, 4.0, 0.8, 10.0, 8.0, 270, "E282,E300"),
-    ("6000000001502", "Woolworths Full Cream Milk", "Woolworths", "Dairy", 4.7, 0.10, 3.3, 2.1, 3.4, 0.0, 61, ""),
-    ("6000000001503", "Kellogg's Rice Krispies", "Kellogg's", "Cereal", 10.0, 0.70, 0.5, 0.1, 6.0, 0.5, 380, ""),
-    ("6000000001504", "All Gold Smooth Apricot Jam", "All Gold", "Jam", 60.0, 0.05, 0.1, 0.0, 0.1, 0.5, 250, "E202,E211"),
-    ("6000000001505", "Simba Chippies Salt & Vinegar", "Simba", "Snack", 0.5, 1.40, 30.0, 4.0, 6.0, 3.0, 530, "E621,E631"),
-]
+# --- Sample Data ---
+# South African sample products in importer.py's csv layout; nutritional values are per 100g/100ml.
+# Parsed only when seeding an empty database, so workers never pay for it at import time.
+SAMPLE_DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'sample_products.csv')
+
+def read_sample_products(path=SAMPLE_DATA_PATH):
+    """Returns the sample product tuples (BARCODE..ADDITIVES column order) from the bundled CSV."""
+    import importer  # Imported here: importer imports this module, and only seeding needs it
+    return [product for product in map(importer.normalize_record, importer.iter_csv(path)) if product]
+
 
+# Time spent opening SQLite connections (exposed at /api/metrics)
+DB_CONNECT_SPAN = registry.span('db_connect')
 
 # --- Database Functions ---
 
+@timed(DB_CONNECT_SPAN)
 def create_connection():
     """Create a database connection to the SQLite database."""
     conn = None
@@ -199,38 +70,361 @@ def create_table(conn):
         protein REAL,
         fiber REAL,
         calories INTEGER,
-        additives TEXT
+        additives TEXT,
+        health_score INTEGER,
+        additive_count INTEGER,
+        score_version INTEGER NOT NULL DEFAULT 0,
+        updated_at INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
     );
     """
     try:
         c = conn.cursor()
         c.execute(sql_create_products_table)
+        for sql in SQL_CREATE_SECONDARY:
+            c.execute(sql)
     except sqlite3.Error as e:
         print(f"Error creating table: {e}")
 
+# Lets recompute_scores() find rows scored under an older rules version without a full scan
+SQL_CREATE_SCORE_VERSION_INDEX = "CREATE INDEX IF NOT EXISTS idx_products_score_version ON products (score_version)"
+
+# One row per (product, additive), in the order the additives were listed on the product.
+# The (code, barcode) index answers "products containing E621" without touching the products table scan.
+SQL_CREATE_PRODUCT_ADDITIVES_TABLE = """
+CREATE TABLE IF NOT EXISTS product_additives (
+    barcode TEXT NOT NULL REFERENCES products (barcode) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    code TEXT NOT NULL COLLATE NOCASE,
+    PRIMARY KEY (barcode, position)
+) WITHOUT ROWID
+"""
+SQL_CREATE_ADDITIVE_CODE_INDEX = "CREATE INDEX IF NOT EXISTS idx_product_additives_code ON product_additives (code, barcode)"
+
+# Category listings, best score first: /api/category/<category> reads this index in order
+SQL_CREATE_CATEGORY_SCORE_INDEX = (
+    "CREATE INDEX IF NOT EXISTS idx_products_category_score ON products (category, health_score DESC, barcode)"
+)
+
+# Full-text index over name/brand/category. External content: the text itself stays in `products`.
+# 🔑 NOTE: it is keyed on products.rowid, so run rebuild_search_index() after any VACUUM.
+SQL_CREATE_PRODUCTS_FTS_TABLE = """
+CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5 (
+    name, brand, category,
+    content = 'products', content_rowid = 'rowid',
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+)
+"""
+
+# Keep products_fts in sync with every write to products (by name, so bulk imports can suspend them)
+FTS_TRIGGERS = {
+    "products_fts_ai": """
+    CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts (rowid, name, brand, category) VALUES (new.rowid, new.name, new.brand, new.category);
+    END
+    """,
+    "products_fts_ad": """
+    CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts (products_fts, rowid, name, brand, category)
+        VALUES ('delete', old.rowid, old.name, old.brand, old.category);
+    END
+    """,
+    "products_fts_au": """
+    CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF name, brand, category ON products BEGIN
+        INSERT INTO products_fts (products_fts, rowid, name, brand, category)
+        VALUES ('delete', old.rowid, old.name, old.brand, old.category);
+        INSERT INTO products_fts (rowid, name, brand, category) VALUES (new.rowid, new.name, new.brand, new.category);
+    END
+    """,
+}
+
+# Outcome of each queued POST /api/product submission, written in the same group commit as the products
+SQL_CREATE_SUBMISSIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS product_submissions (
+    id TEXT PRIMARY KEY,
+    barcode TEXT NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT,
+    submitted_at REAL NOT NULL,
+    processed_at REAL NOT NULL
+) WITHOUT ROWID
+"""
+
+# Rows changed since a time: workers' cache invalidation (cache.ChangeWatcher) polls this every few seconds
+SQL_CREATE_UPDATED_AT_INDEX = "CREATE INDEX IF NOT EXISTS idx_products_updated_at ON products (updated_at)"
+
+SQL_CREATE_SECONDARY = (
+    SQL_CREATE_SCORE_VERSION_INDEX,
+    SQL_CREATE_UPDATED_AT_INDEX,
+    SQL_CREATE_PRODUCT_ADDITIVES_TABLE,
+    SQL_CREATE_ADDITIVE_CODE_INDEX,
+    SQL_CREATE_CATEGORY_SCORE_INDEX,
+    SQL_CREATE_PRODUCTS_FTS_TABLE,
+    *FTS_TRIGGERS.values(),
+    SQL_CREATE_SUBMISSIONS_TABLE,
+    # Per-category/brand aggregates behind /api/stats (see analytics.py)
+    SQL_CREATE_CATALOGUE_STATS_TABLE,
+    *STATS_TRIGGERS.values(),
+)
+
+# Secondary indexes by name: bulk imports drop these and rebuild them once after the load
+SECONDARY_INDEXES = {
+    "idx_products_score_version": SQL_CREATE_SCORE_VERSION_INDEX,
+    "idx_products_updated_at": SQL_CREATE_UPDATED_AT_INDEX,
+    "idx_product_additives_code": SQL_CREATE_ADDITIVE_CODE_INDEX,
+    "idx_products_category_score": SQL_CREATE_CATEGORY_SCORE_INDEX,
+}
+
+def rebuild_search_index(conn):
+    """Repopulates products_fts from the products table."""
+    conn.execute("INSERT INTO products_fts (products_fts) VALUES ('rebuild')")
+    conn.commit()
+
+# Columns added after the original schema: (name, declaration)
+MIGRATION_COLUMNS = (
+    ("health_score", "INTEGER"),
+    ("additive_count", "INTEGER"),
+    ("score_version", "INTEGER NOT NULL DEFAULT 0"),
+    # ALTER TABLE only accepts constant defaults; migrate() stamps existing rows instead
+    ("updated_at", "INTEGER NOT NULL DEFAULT 0"),
+)
+
+SQL_NOW = "CAST(strftime('%s', 'now') AS INTEGER)"
+
+def migrate(conn):
+    """Brings an existing products table up to the current schema."""
+    try:
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(products)")}
+        for name, declaration in MIGRATION_COLUMNS:
+            if name not in existing:
+                conn.execute(f"ALTER TABLE products ADD COLUMN {name} {declaration}")
+        has_search_index = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'"
+        ).fetchone()
+        has_stats = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'catalogue_stats'"
+        ).fetchone()
+        for sql in SQL_CREATE_SECONDARY:
+            conn.execute(sql)
+        conn.execute(f"UPDATE products SET updated_at = {SQL_NOW} WHERE updated_at = 0")
+        conn.commit()
+        backfill_product_additives(conn)
+        if not has_search_index:
+            rebuild_search_index(conn)
+        if not has_stats:
+            rebuild_catalogue_stats(conn)
+    except sqlite3.Error as e:
+        print(f"Error migrating database: {e}")
+
+def backfill_product_additives(conn, batch_size=5000):
+    """Converts comma-joined `additives` strings into product_additives rows for products that have none yet."""
+    sql_select_missing = """
+    SELECT barcode, additives FROM products p
+    WHERE additives IS NOT NULL AND additives != ''
+      AND barcode > ?
+      AND NOT EXISTS (SELECT 1 FROM product_additives pa WHERE pa.barcode = p.barcode)
+    ORDER BY barcode LIMIT ?
+    """
+    last_barcode = ''
+    while True:
+        rows = conn.execute(sql_select_missing, (last_barcode, batch_size)).fetchall()
+        if not rows:
+            break
+        conn.executemany(SQL_INSERT_PRODUCT_ADDITIVE, [
+            pair for barcode, additives in rows for pair in additive_rows(barcode, parse_additives(additives))
+        ])
+        conn.commit()
+        last_barcode = rows[-1][0]
+
+SQL_INSERT_PRODUCT_ADDITIVE = "INSERT INTO product_additives (barcode, position, code) VALUES (?, ?, ?)"
+
+def additive_rows(barcode, additives_list):
+    """product_additives rows (barcode, position, code) for one product."""
+    return [(barcode, position, code) for position, code in enumerate(additives_list)]
+
+def replace_product_additives(conn, barcode, additives_list):
+    """Rewrites a product's additive rows. Runs inside the caller's transaction."""
+    conn.execute("DELETE FROM product_additives WHERE barcode = ?", (barcode,))
+    conn.executemany(SQL_INSERT_PRODUCT_ADDITIVE, additive_rows(barcode, additives_list))
+
+def get_additives(conn, barcode):
+    """Additive codes for one product, in their listed order."""
+    sql = "SELECT code FROM product_additives WHERE barcode = ? ORDER BY position"
+    return [row[0] for row in conn.execute(sql, (barcode,))]
+
+def get_additives_for(conn, barcodes):
+    """Additive codes for many products (at most SQLite's parameter limit), as {barcode: [codes]}."""
+    placeholders = ",".join("?" * len(barcodes))
+    sql = f"SELECT barcode, code FROM product_additives WHERE barcode IN ({placeholders}) ORDER BY barcode, position"
+    additives = {}
+    for barcode, code in conn.execute(sql, barcodes):
+        additives.setdefault(barcode, []).append(code)
+    return additives
+
+def build_search_query(text, max_terms=8):
+    """
+    Turns free text into a safe FTS5 MATCH expression: every word must match as a prefix.
+    Returns None when the text has no searchable words.
+    """
+    # 🔑 SECURITY: Only quoted word tokens reach MATCH, so FTS5 operators/syntax in user input are inert
+    terms = re.findall(r'\w+', text.lower())[:max_terms]
+    return ' '.join(f'"{term}"*' for term in terms) or None
+
+def search_products(conn, match_query, after=None, limit=20):
+    """
+    One page of full-text matches ordered by relevance (bm25, name weighted above brand and category).
+    `after` is the (rank, rowid) of the last row of the previous page.
+    """
+    sql = """
+    SELECT p.barcode, p.name, p.brand, p.category, p.health_score, s.rank, s.rowid AS search_rowid
+    FROM (
+        SELECT rowid, bm25(products_fts, 10.0, 5.0, 1.0) AS rank FROM products_fts WHERE products_fts MATCH ?
+    ) s
+    JOIN products p ON p.rowid = s.rowid
+    {keyset}
+    ORDER BY s.rank, s.rowid LIMIT ?
+    """
+    c = conn.cursor()
+    c.row_factory = sqlite3.Row
+    if after is None:
+        rows = c.execute(sql.format(keyset=""), (match_query, limit))
+    else:
+        rows = c.execute(sql.format(keyset="WHERE (s.rank, s.rowid) > (?, ?)"), (match_query, *after, limit))
+    return [dict(row) for row in rows]
+
+def get_products_in_category(conn, category, after=None, limit=50):
+    """
+    One page of a category, healthiest first, served in index order from idx_products_category_score.
+    `after` is the (health_score, barcode) of the last row of the previous page.
+    """
+    sql = """
+    SELECT barcode, name, brand, category, health_score FROM products
+    WHERE category = ? {keyset}
+    ORDER BY health_score DESC, barcode LIMIT ?
+    """
+    c = conn.cursor()
+    c.row_factory = sqlite3.Row
+    if after is None:
+        rows = c.execute(sql.format(keyset=""), (category, limit))
+    else:
+        score, barcode = after
+        keyset = "AND (health_score < ? OR (health_score = ? AND barcode > ?))"
+        rows = c.execute(sql.format(keyset=keyset), (category, score, score, barcode, limit))
+    return [dict(row) for row in rows]
+
+def get_products_with_additive(conn, code, after='', limit=50):
+    """One keyset page of products containing an additive, served from idx_product_additives_code."""
+    sql = """
+    SELECT p.barcode, p.name, p.brand, p.category, p.health_score
+    FROM product_additives pa JOIN products p ON p.barcode = pa.barcode
+    WHERE pa.code = ? AND pa.barcode > ?
+    ORDER BY pa.barcode LIMIT ?
+    """
+    c = conn.cursor()
+    c.row_factory = sqlite3.Row
+    return [dict(row) for row in c.execute(sql, (code, after, limit))]
+
+def is_valid_barcode(barcode):
+    """🔑 SECURITY: Basic Input Validation (8-13 digit EAN/UPC codes only)."""
+    return isinstance(barcode, str) and barcode.isdigit() and 8 <= len(barcode) <= 13
+
+def parse_additives(additives_str):
+    """Splits the stored comma-joined additives string (e.g. "E621,E631") into a list."""
+    return [a.strip() for a in additives_str.split(',') if a.strip()] if additives_str else []
+
+def score_product(nutrition_data, additives_list):
+    """Returns the stored score columns (health_score, additive_count, score_version) for one product."""
+    return calculate_health_score(nutrition_data, additives_list), len(additives_list), SCORING_RULES_VERSION
+
+def _is_scoreable(value):
+    # NULLs score as 0.0; REAL columns can also hold text SQLite couldn't convert (older versions stored
+    # unvalidated input), which scores as NULL too instead of failing the whole batch
+    return value is None or (isinstance(value, (int, float)) and not isinstance(value, bool))
+
+def score_rows(rows):
+    """
+    Batch-scores product tuples in BARCODE..ADDITIVES column order.
+    Returns a list of (health_score, additive_count, score_version) tuples.
+    """
+    scored_columns = {'sugar': SUGAR, 'salt': SALT, 'saturated_fat': SAT_FAT, 'protein': PROTEIN, 'fiber': FIBER}
+    columns = {
+        nutrient: [r[index] if _is_scoreable(r[index]) else None for r in rows]
+        for nutrient, index in scored_columns.items()
+    }
+    additives = [r[ADDITIVES] if isinstance(r[ADDITIVES], str) else None for r in rows]
+    bad = [r[BARCODE] for r, a in zip(rows, additives)
+           if not all(_is_scoreable(r[index]) for index in scored_columns.values())
+           or (a is None and r[ADDITIVES] is not None)]
+    if bad:
+        print(f"Warning: scored {len(bad)} product(s) with malformed nutrients or additives as NULL, "
+              f"e.g. {', '.join(map(str, bad[:5]))}")
+    counts = [len(parse_additives(a)) for a in additives]
+    scores = calculate_health_scores(columns, counts)
+    return [(int(score), count, SCORING_RULES_VERSION) for score, count in zip(scores, counts)]
+
 def load_sample_data(conn):
-    """Load sample data into the products table."""
+    """Load sample data into the products table. Returns the number of sample products."""
     sql_insert_product = """
-    INSERT INTO products (barcode, name, brand, category, sugar, salt, fat, saturated_fat, protein, fiber, calories, additives)
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    INSERT INTO products (barcode, name, brand, category, sugar, salt, fat, saturated_fat, protein, fiber, calories, additives,
+                          health_score, additive_count, score_version)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
     """
+    products = read_sample_products()
     try:
         c = conn.cursor()
-        c.executemany(sql_insert_product, SAMPLE_PRODUCTS)
+        scored = [product + fields for product, fields in zip(products, score_rows(products))]
+        c.executemany(sql_insert_product, scored)
+        c.executemany(SQL_INSERT_PRODUCT_ADDITIVE, [
+            pair for product in products for pair in additive_rows(product[BARCODE], parse_additives(product[ADDITIVES]))
+        ])
         conn.commit()
     except sqlite3.IntegrityError as e:
         # This prevents the app from crashing if it tries to insert the same data twice
         print("Warning: Sample data already exists or duplicate barcodes found.")
     except sqlite3.Error as e:
         print(f"Error loading sample data: {e}")
+    return len(products)
+
+SQL_UPSERT_PRODUCT = """
+INSERT INTO products (barcode, name, brand, category, sugar, salt, fat, saturated_fat, protein, fiber, calories, additives,
+                      health_score, additive_count, score_version)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (barcode) DO UPDATE SET
+    name = excluded.name, brand = excluded.brand, category = excluded.category,
+    sugar = excluded.sugar, salt = excluded.salt, fat = excluded.fat, saturated_fat = excluded.saturated_fat,
+    protein = excluded.protein, fiber = excluded.fiber, calories = excluded.calories, additives = excluded.additives,
+    health_score = excluded.health_score, additive_count = excluded.additive_count, score_version = excluded.score_version,
+    -- Re-importing an unchanged product keeps its Last-Modified time
+    updated_at = CASE
+        WHEN (name, brand, category, sugar, salt, fat, saturated_fat, protein, fiber, calories, additives, health_score)
+          IS NOT (excluded.name, excluded.brand, excluded.category, excluded.sugar, excluded.salt, excluded.fat,
+                  excluded.saturated_fat, excluded.protein, excluded.fiber, excluded.calories, excluded.additives,
+                  excluded.health_score)
+        THEN CAST(strftime('%s', 'now') AS INTEGER) ELSE updated_at END
+"""
+
+def upsert_products(conn, products):
+    """
+    Inserts or replaces product tuples (BARCODE..ADDITIVES column order), scoring them in one batch.
+    Runs inside the caller's transaction; the caller commits.
+    """
+    # Last row wins when a barcode repeats within the batch
+    products = list({product[BARCODE]: product for product in products}.values())
+    scored = [product + fields for product, fields in zip(products, score_rows(products))]
+    conn.executemany(SQL_UPSERT_PRODUCT, scored)
+    conn.executemany("DELETE FROM product_additives WHERE barcode = ?", [(product[BARCODE],) for product in products])
+    conn.executemany(SQL_INSERT_PRODUCT_ADDITIVE, [
+        pair for product in products for pair in additive_rows(product[BARCODE], parse_additives(product[ADDITIVES]))
+    ])
+    return len(products)
 
 def get_product_by_barcode(conn, barcode):
     """Retrieve a product by its barcode."""
-    # 🔑 FIX: Set row_factory to access columns by name for this specific function
-    conn.row_factory = sqlite3.Row
     sql = "SELECT * FROM products WHERE barcode=?"
     try:
+        # 🔑 FIX: Set row_factory on the cursor only, so pooled connections are never mutated
         c = conn.cursor()
+        c.row_factory = sqlite3.Row
         c.execute(sql, (barcode,))
         row = c.fetchone()
         if row:
@@ -255,18 +449,44 @@ def get_product_by_barcode(conn, barcode):
     except sqlite3.Error as e:
         print(f"Database error during lookup: {e}")
         return None
-    finally:
-        # 🔑 FIX: Reset row_factory to avoid side-effects
-        conn.row_factory = None
+
+def recompute_scores(conn, batch_size=5000):
+    """
+    Rescores only the rows stored under an older SCORING_RULES_VERSION, one batch per transaction.
+    Returns the number of rows rewritten.
+    """
+    sql_select_stale = """
+    SELECT barcode, name, brand, category, sugar, salt, fat, saturated_fat, protein, fiber, calories, additives
+    FROM products WHERE score_version < ? LIMIT ?
+    """
+    sql_update_score = f"""
+    UPDATE products SET health_score = ?, additive_count = ?, score_version = ?, updated_at = {SQL_NOW} WHERE barcode = ?
+    """
+    updated = 0
+    try:
+        while True:
+            rows = conn.execute(sql_select_stale, (SCORING_RULES_VERSION, batch_size)).fetchall()
+            if not rows:
+                break
+            conn.executemany(sql_update_score, [
+                fields + (row[BARCODE],) for row, fields in zip(rows, score_rows(rows))
+            ])
+            conn.commit()
+            updated += len(rows)
+    except (sqlite3.Error, ValueError, TypeError) as e:
+        # Runs at boot: a row that still can't be scored is logged, never a reason not to start
+        conn.rollback()
+        print(f"Error recomputing scores: {e}")
+    return updated
 
 def initialize_database():
     """Connects to or creates the DB, and ensures tables and data are loaded."""
     conn = create_connection()
     if conn is not None:
         create_table(conn)
-        load_sample_data(conn)
+        loaded = load_sample_data(conn)
         conn.close()
-        print(f"Database initialized and {len(SAMPLE_PRODUCTS)} sample products loaded successfully.")
+        print(f"Database initialized and {loaded} sample products loaded successfully.")
     else:
         print("Error! Cannot create the database connection.")
 
@@ -276,7 +496,189 @@ def check_db_exists():
         print(f"Database file not found. Initializing database...")
         initialize_database()
     else:
-        print("Database file found. Ready to use.")
+        conn = create_connection()
+        migrate(conn)
+        rescored = recompute_scores(conn)
+        conn.close()
+        print(f"Database file found ({rescored} products rescored). Ready to use.")
+
+# --- Connection Pool ---
+
+# Per-worker pool settings (override through the environment on Render)
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '4'))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '5.0'))
+
+# Applied to every connection the pool opens
+SHARED_PRAGMAS = (
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA cache_size = -8000",      # ~8 MB page cache per connection
+    "PRAGMA mmap_size = 67108864",    # 64 MB memory-mapped reads, shared through the OS page cache
+    "PRAGMA temp_store = MEMORY",
+)
+# Applied once to the single writer connection
+WRITER_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",      # Readers never block the writer (and vice versa)
+    "PRAGMA synchronous = NORMAL",    # Safe with WAL, avoids an fsync on every commit
+)
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes available within the timeout."""
+
+
+class ConnectionPool:
+    """
+    A per-process pool of read-only SQLite connections plus one serialized writer.
+
+    Read connections are opened lazily up to `size` and reused across requests.
+    All writes go through a single connection guarded by a lock, which matches
+    SQLite's single-writer model and avoids 'database is locked' retries.
+    """
+
+    def __init__(self, db_name=None, size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.db_name = db_name or DB_NAME
+        self.size = size
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._idle = []
+        self._created = 0
+        self._in_use = 0
+        self._writer_lock = threading.Lock()
+        self._stats = {
+            "checkouts": 0,
+            "returns": 0,
+            "waits": 0,
+            "wait_seconds": 0.0,
+            "timeouts": 0,
+            "peak_in_use": 0,
+            "writer_acquisitions": 0,
+            "writer_wait_seconds": 0.0,
+        }
+        # 🔑 The writer is opened first so the database is switched to WAL before any reader attaches
+        self._writer = self._connect_writer()
+
+    @timed(DB_CONNECT_SPAN)
+    def _connect_writer(self):
+        conn = sqlite3.connect(self.db_name, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for pragma in SHARED_PRAGMAS + WRITER_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    @timed(DB_CONNECT_SPAN)
+    def _connect_reader(self):
+        path = os.path.abspath(self.db_name)
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for pragma in SHARED_PRAGMAS:
+            conn.execute(pragma)
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    def checkout(self):
+        """Borrow a read-only connection, opening a new one if the pool is not yet full."""
+        waited_since = None
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._created < self.size:
+                    self._created += 1
+                    conn = None
+                    break
+                now = time.perf_counter()
+                if waited_since is None:
+                    waited_since = now
+                    self._stats["waits"] += 1
+                remaining = self.timeout - (now - waited_since)
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    self._stats["timeouts"] += 1
+                    self._stats["wait_seconds"] += time.perf_counter() - waited_since
+                    raise PoolTimeout(f"No database connection available after {self.timeout}s.")
+            if waited_since is not None:
+                self._stats["wait_seconds"] += time.perf_counter() - waited_since
+            self._in_use += 1
+            self._stats["checkouts"] += 1
+            self._stats["peak_in_use"] = max(self._stats["peak_in_use"], self._in_use)
+
+        if conn is None:
+            try:
+                conn = self._connect_reader()
+            except sqlite3.Error:
+                with self._cond:
+                    self._created -= 1
+                    self._in_use -= 1
+                    self._cond.notify()
+                raise
+        return conn
+
+    def checkin(self, conn):
+        """Return a connection obtained from checkout()."""
+        if conn.in_transaction:
+            conn.rollback()
+        with self._cond:
+            self._idle.append(conn)
+            self._in_use -= 1
+            self._stats["returns"] += 1
+            self._cond.notify()
+
+    @contextmanager
+    def reader(self):
+        conn = self.checkout()
+        try:
+            yield conn
+        finally:
+            self.checkin(conn)
+
+    @contextmanager
+    def writer(self):
+        """Serialize access to the single writer connection."""
+        started = time.perf_counter()
+        with self._writer_lock:
+            self._stats["writer_acquisitions"] += 1
+            self._stats["writer_wait_seconds"] += time.perf_counter() - started
+            try:
+                yield self._writer
+            finally:
+                if self._writer.in_transaction:
+                    self._writer.rollback()
+
+    def stats(self):
+        """Snapshot of pool usage counters; sustained waits mean the pool is undersized."""
+        with self._cond:
+            return dict(
+                self._stats,
+                size=self.size,
+                created=self._created,
+                idle=len(self._idle),
+                in_use=self._in_use,
+            )
+
+    def close(self):
+        with self._cond:
+            for conn in self._idle:
+                conn.close()
+            self._created -= len(self._idle)
+            self._idle = []
+        with self._writer_lock:
+            self._writer.close()
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Returns this worker's pool, creating it after fork so connections are never shared across processes."""
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                _pool = ConnectionPool()
+                _pool_pid = pid
+    return _pool
 
 if __name__ == '__main__':
     # Test function to run directly
@@ -0,0 +1,14 @@
+# gunicorn.conf.py
+"""
+Gunicorn settings, read automatically from the working directory by `gunicorn app:app`.
+
+The schema, migrations and score recomputation run once in the master before any worker
+is forked, so a worker (re)start only imports the app. Workers also inherit the modules the
+master imported here (database, scoring, metrics) instead of importing them again.
+"""
+
+
+def on_starting(server):
+    """Creates or migrates the database once per deploy, before workers are forked."""
+    import database  # Imported in the hook so reading this config stays free of app imports
+    database.check_db_exists()
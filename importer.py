@@ -0,0 +1,272 @@
+# importer.py
+"""
+Streaming bulk import of product catalogues into the products table.
+
+Supported formats:
+    csv        Our own column layout (barcode, name, brand, category, sugar, salt, fat,
+               saturated_fat, protein, fiber, calories, additives)
+    jsonl      One JSON object per line with the same keys as `csv`
+    off-csv    Open Food Facts tab-separated export (en.openfoodfacts.org.products.csv[.gz])
+    off-jsonl  Open Food Facts JSONL dump (openfoodfacts-products.jsonl[.gz])
+
+Files are read one record at a time, so memory stays flat regardless of file size.
+"""
+
+import csv
+import gzip
+import json
+import os
+import sys
+import time
+from itertools import islice
+
+import database
+
+# --- Import Configuration ---
+DEFAULT_BATCH_SIZE = 5000
+REPORT_EVERY_SECONDS = 5.0
+
+# Per-100g values above these limits are data-entry errors (common in crowd-sourced dumps)
+MAX_GRAMS_PER_100G = 100.0
+MAX_KCAL_PER_100G = 1000.0
+
+# Nutrient fields in product tuple column order
+NUTRIENT_FIELDS = ('sugar', 'salt', 'fat', 'saturated_fat', 'protein', 'fiber')
+
+# Open Food Facts nutriment keys for each of our nutrient fields
+OFF_NUTRIMENTS = {
+    'sugar': 'sugars_100g',
+    'salt': 'salt_100g',
+    'fat': 'fat_100g',
+    'saturated_fat': 'saturated-fat_100g',
+    'protein': 'proteins_100g',
+    'fiber': 'fiber_100g',
+}
+
+SQL_CREATE_IMPORT_PROGRESS_TABLE = """
+CREATE TABLE IF NOT EXISTS import_progress (
+    source TEXT PRIMARY KEY,
+    records_done INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+
+
+# --- Readers ---
+
+def open_text(path):
+    """Opens a (possibly gzip-compressed) text file for streaming."""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, 'r', encoding='utf-8', newline='')
+
+def detect_format(path):
+    name = os.path.basename(path).lower()
+    if name.endswith('.gz'):
+        name = name[:-3]
+    is_off = 'openfoodfacts' in name
+    if name.endswith('.jsonl') or name.endswith('.ndjson'):
+        return 'off-jsonl' if is_off else 'jsonl'
+    if name.endswith('.csv') or name.endswith('.tsv'):
+        return 'off-csv' if is_off else 'csv'
+    raise ValueError(f"Cannot detect the format of {path}; pass it explicitly.")
+
+def iter_csv(path, delimiter=','):
+    # Open Food Facts rows carry very long text fields (ingredients, packaging)
+    csv.field_size_limit(sys.maxsize)
+    with open_text(path) as f:
+        yield from csv.DictReader(f, delimiter=delimiter)
+
+def iter_jsonl(path):
+    with open_text(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                yield None
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+
+
+# --- Normalization ---
+
+def _to_float(value, upper):
+    # Missing values default to 0.0 like add_product; unparsable or out-of-range values reject the record
+    if value is None or value == '':
+        return 0.0
+    number = float(value)
+    if not 0.0 <= number <= upper:
+        raise ValueError(f"value {number} out of range")
+    return number
+
+def _clean_text(value, limit=200):
+    return ' '.join(str(value).split())[:limit] if value else ''
+
+def normalize_additive_code(tag):
+    """'en:e150d' or ' e330 ' -> 'E150d' / 'E330'."""
+    code = tag.strip().split(':')[-1]
+    return 'E' + code[1:] if code[:1] in ('e', 'E') else code
+
+def _additive_codes(tags):
+    # Comma-joined normalized codes, or None when the field is not a string or a list of strings
+    if isinstance(tags, str):
+        tags = tags.split(',')
+    if not isinstance(tags, list) or not all(isinstance(tag, str) for tag in tags):
+        return None
+    return ','.join(normalize_additive_code(tag) for tag in tags if tag.strip())
+
+def normalize_record(record):
+    """
+    Validates one record in our own csv/jsonl layout.
+    Returns a product tuple in BARCODE..ADDITIVES column order (see database.py), or None if the record is unusable.
+    """
+    # JSON lines can hold any value; only objects are products
+    if not record or not isinstance(record, dict):
+        return None
+    barcode = str(record.get('barcode') or '').strip()
+    name = _clean_text(record.get('name'))
+    if not database.is_valid_barcode(barcode) or not name:
+        return None
+    additives = _additive_codes(record.get('additives') or '')
+    if additives is None:
+        return None
+    try:
+        nutrients = tuple(_to_float(record.get(field), MAX_GRAMS_PER_100G) for field in NUTRIENT_FIELDS)
+        calories = int(round(_to_float(record.get('calories'), MAX_KCAL_PER_100G)))
+    except (TypeError, ValueError):
+        return None
+    return (
+        barcode, name, _clean_text(record.get('brand')), _clean_text(record.get('category')) or 'General',
+        *nutrients, calories, additives,
+    )
+
+def normalize_off_product(record):
+    """
+    Validates one Open Food Facts product (JSON dump/API object or flat CSV export row).
+    Returns a product tuple in BARCODE..ADDITIVES column order (see database.py), or None if the record is unusable.
+    """
+    if not record or not isinstance(record, dict):
+        return None
+    barcode = str(record.get('code') or '').strip()
+    name = _clean_text(record.get('product_name'))
+    if not database.is_valid_barcode(barcode) or not name:
+        return None
+
+    # JSON products nest nutriments; the CSV export flattens them onto the row
+    nutriments = record.get('nutriments') or record
+    if not isinstance(nutriments, dict):
+        return None
+    try:
+        values = {field: _to_float(nutriments.get(key), MAX_GRAMS_PER_100G) for field, key in OFF_NUTRIMENTS.items()}
+        if not values['salt'] and nutriments.get('sodium_100g') not in (None, ''):
+            values['salt'] = _to_float(float(nutriments['sodium_100g']) * 2.5, MAX_GRAMS_PER_100G)
+        kcal = nutriments.get('energy-kcal_100g')
+        if kcal in (None, '') and nutriments.get('energy_100g') not in (None, ''):
+            kcal = float(nutriments['energy_100g']) / 4.184  # kJ -> kcal
+        calories = int(round(_to_float(kcal, MAX_KCAL_PER_100G)))
+    except (TypeError, ValueError):
+        return None
+
+    brands = record.get('brands') or ''
+    categories = record.get('categories') or ''
+    additives = _additive_codes(record.get('additives_tags') or [])
+    if additives is None or not isinstance(brands, str) or not isinstance(categories, str):
+        return None
+    # The last listed category is the most specific one
+    category = categories.split(',')[-1] if categories else ''
+
+    return (
+        barcode, name, _clean_text(brands.split(',')[0]), _clean_text(category) or 'General',
+        *(values[field] for field in NUTRIENT_FIELDS), calories, additives,
+    )
+
+# format -> (reader, normalizer)
+FORMATS = {
+    'csv': (iter_csv, normalize_record),
+    'jsonl': (iter_jsonl, normalize_record),
+    'off-csv': (lambda path: iter_csv(path, delimiter='\t'), normalize_off_product),
+    'off-jsonl': (iter_jsonl, normalize_off_product),
+}
+
+
+# --- Loader ---
+
+def _batches(records, size):
+    it = iter(records)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+def import_file(conn, path, fmt=None, batch_size=DEFAULT_BATCH_SIZE, resume=True, log=print):
+    """
+    Streams a catalogue file into the products table in batched upsert transactions.
+
+    Progress is checkpointed in the same transaction as each batch, so an interrupted
+    import resumes after the last committed batch. Secondary indexes and the full-text
+    triggers are dropped for the duration of the load and rebuilt once at the end.
+
+    Returns:
+        dict: records read, products imported, records rejected, elapsed seconds and rows/sec.
+    """
+    fmt = fmt or detect_format(path)
+    reader, normalize = FORMATS[fmt]
+    source = os.path.abspath(path)
+
+    conn.execute(SQL_CREATE_IMPORT_PROGRESS_TABLE)
+    done = 0
+    if resume:
+        row = conn.execute("SELECT records_done FROM import_progress WHERE source = ?", (source,)).fetchone()
+        done = row[0] if row else 0
+        if done:
+            log(f"Resuming {path} after {done} records.")
+    conn.commit()
+
+    for name in database.SECONDARY_INDEXES:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+    # Per-row full-text and analytics trigger work is replaced by a single rebuild at the end
+    for name in (*database.FTS_TRIGGERS, *database.STATS_TRIGGERS):
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    conn.commit()
+
+    stats = {"records": done, "imported": 0, "rejected": 0}
+    started = last_report = time.perf_counter()
+    try:
+        for batch in _batches(islice(reader(path), done, None), batch_size):
+            products = [p for p in map(normalize, batch) if p is not None]
+            stats["rejected"] += len(batch) - len(products)
+            stats["records"] += len(batch)
+            if products:
+                stats["imported"] += database.upsert_products(conn, products)
+            conn.execute(
+                "INSERT OR REPLACE INTO import_progress (source, records_done, updated_at) VALUES (?, ?, ?)",
+                (source, stats["records"], time.time()),
+            )
+            conn.commit()
+
+            now = time.perf_counter()
+            if now - last_report >= REPORT_EVERY_SECONDS:
+                log(f"  {stats['records']} records read, {stats['imported'] / (now - started):.0f} rows/sec")
+                last_report = now
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        log("Rebuilding secondary and full-text indexes and catalogue stats...")
+        for sql in database.SECONDARY_INDEXES.values():
+            conn.execute(sql)
+        for sql in (*database.FTS_TRIGGERS.values(), *database.STATS_TRIGGERS.values()):
+            conn.execute(sql)
+        conn.commit()
+        database.rebuild_search_index(conn)
+        database.rebuild_catalogue_stats(conn)
+
+    # A completed import starts from scratch next time
+    conn.execute("DELETE FROM import_progress WHERE source = ?", (source,))
+    conn.commit()
+
+    stats["seconds"] = time.perf_counter() - started
+    stats["rows_per_sec"] = stats["imported"] / stats["seconds"] if stats["seconds"] else 0.0
+    return stats
@@ -0,0 +1,98 @@
+# manage.py
+"""
+Command-line maintenance tasks for the Health Scanner database.
+
+    python manage.py init        # Create the schema and load the sample products
+    python manage.py migrate     # Upgrade an existing database to the current schema
+    python manage.py recompute   # Rescore rows stored under an older scoring-rules version
+    python manage.py import FILE # Stream a CSV/JSONL/Open Food Facts catalogue into the database
+    python manage.py snapshot    # Export the mmap-able catalogue snapshot workers serve scans from
+"""
+
+import argparse
+
+import database
+from scoring import SCORING_RULES_VERSION
+
+
+def cmd_init(args):
+    database.check_db_exists()
+
+def cmd_migrate(args):
+    conn = database.create_connection()
+    database.migrate(conn)
+    conn.close()
+    print("Database schema is up to date.")
+
+def cmd_recompute(args):
+    conn = database.create_connection()
+    database.migrate(conn)
+    updated = database.recompute_scores(conn, batch_size=args.batch_size)
+    conn.close()
+    print(f"Rescored {updated} products under scoring rules v{SCORING_RULES_VERSION}.")
+
+def cmd_import(args):
+    import importer
+
+    conn = database.create_connection()
+    database.create_table(conn)
+    database.migrate(conn)
+    # Bulk-load settings: WAL avoids blocking live readers, a larger page cache speeds up the upserts
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA cache_size = -262144")
+    try:
+        stats = importer.import_file(
+            conn, args.path, fmt=args.format, batch_size=args.batch_size, resume=not args.restart
+        )
+    except KeyboardInterrupt:
+        print("Import interrupted; rerun the same command to resume.")
+        return
+    finally:
+        conn.close()
+    print(
+        f"Imported {stats['imported']} products from {stats['records']} records "
+        f"({stats['rejected']} rejected) in {stats['seconds']:.1f}s, {stats['rows_per_sec']:.0f} rows/sec."
+    )
+
+def cmd_snapshot(args):
+    import snapshot
+
+    output = args.output or snapshot.CATALOGUE_SNAPSHOT
+    if not output:
+        print("Pass --output or set CATALOGUE_SNAPSHOT.")
+        return
+    conn = database.create_connection()
+    database.migrate(conn)
+    snapshot.export_snapshot(conn, output)
+    conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Health Scanner database maintenance.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("init", help="Create the database and load sample data if missing.").set_defaults(func=cmd_init)
+    subparsers.add_parser("migrate", help="Apply schema migrations.").set_defaults(func=cmd_migrate)
+
+    recompute = subparsers.add_parser("recompute", help="Rescore products stored under an older rules version.")
+    recompute.add_argument("--batch-size", type=int, default=5000, help="Rows rescored per transaction.")
+    recompute.set_defaults(func=cmd_recompute)
+
+    load = subparsers.add_parser("import", help="Stream a product catalogue file into the database.")
+    load.add_argument("path", help="CSV, JSONL or Open Food Facts export (optionally .gz).")
+    load.add_argument("--format", choices=["csv", "jsonl", "off-csv", "off-jsonl"], help="Defaults to detection by file name.")
+    load.add_argument("--batch-size", type=int, default=5000, help="Rows upserted per transaction.")
+    load.add_argument("--restart", action="store_true", help="Ignore any saved progress and start from the first record.")
+    load.set_defaults(func=cmd_import)
+
+    export = subparsers.add_parser("snapshot", help="Export the read-only catalogue snapshot (replaced atomically).")
+    export.add_argument("--output", help="Snapshot path; defaults to $CATALOGUE_SNAPSHOT.")
+    export.set_defaults(func=cmd_snapshot)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
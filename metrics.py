@@ -0,0 +1,186 @@
+# metrics.py
+"""
+In-process latency/throughput metrics, rendered in the Prometheus text exposition format.
+
+All histograms use fixed, preallocated buckets, so recording an observation costs a
+bisect and a few integer increments with no per-request allocations. Metrics are per
+worker process; Prometheus aggregates across workers when scraping each one.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+
+# Upper bounds (seconds) shared by every latency histogram; the final bucket is +Inf
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+METRIC_PREFIX = 'healthscanner'
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """A fixed-bucket latency histogram with percentile estimates."""
+
+    __slots__ = ('bounds', 'counts', 'total', 'count', '_lock')
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect_left(self.bounds, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.total += seconds
+            self.count += 1
+
+    def percentile(self, q):
+        """Estimates the q-quantile (0-1) by linear interpolation inside the bucket that contains it."""
+        with self._lock:
+            counts = list(self.counts)
+            count = self.count
+        if not count:
+            return 0.0
+        rank = q * count
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            if bucket_count and seen + bucket_count >= rank:
+                lower = self.bounds[index - 1] if index else 0.0
+                if index == len(self.bounds):
+                    return lower  # Beyond the last bound: report the bound itself
+                upper = self.bounds[index]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.bounds[-1]
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.total, self.count
+
+
+class RouteStats:
+    """Latency histogram plus response counts by status class (1xx-5xx) for one route."""
+
+    __slots__ = ('route', 'method', 'latency', 'status_counts')
+
+    def __init__(self, route, method):
+        self.route = route
+        self.method = method
+        self.latency = Histogram()
+        self.status_counts = [0] * 6  # Index = status // 100
+
+    def record(self, status, seconds):
+        if seconds is not None:
+            self.latency.observe(seconds)
+        self.status_counts[min(status // 100, 5)] += 1
+
+
+class Registry:
+    def __init__(self):
+        self.started = time.time()
+        self.routes = {}   # endpoint name -> RouteStats
+        self.spans = {}    # span name -> Histogram
+        self.gauges = []   # (name, help, callable returning {label value: number} or a number)
+        self._lock = threading.Lock()
+
+    def route(self, endpoint, rule, method):
+        stats = self.routes.get(endpoint)
+        if stats is None:
+            with self._lock:
+                stats = self.routes.setdefault(endpoint, RouteStats(rule, method))
+        return stats
+
+    def span(self, name):
+        """Returns (creating once) the histogram for a named span, e.g. 'db_query'."""
+        with self._lock:
+            return self.spans.setdefault(name, Histogram())
+
+    def gauge(self, name, help_text, collect):
+        """Registers a callable sampled at scrape time (e.g. pool or cache statistics)."""
+        self.gauges.append((name, help_text, collect))
+
+    def render(self):
+        """Renders every metric in the Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        name = f"{METRIC_PREFIX}_http_request_duration_seconds"
+        lines += [f"# HELP {name} Request latency by route.", f"# TYPE {name} histogram"]
+        for stats in list(self.routes.values()):
+            labels = f'route="{_escape(stats.route)}",method="{stats.method}"'
+            _render_histogram(lines, name, labels, stats.latency)
+
+        name = f"{METRIC_PREFIX}_http_request_latency_seconds"
+        lines += [f"# HELP {name} Estimated request latency percentiles by route.", f"# TYPE {name} gauge"]
+        for stats in list(self.routes.values()):
+            labels = f'route="{_escape(stats.route)}",method="{stats.method}"'
+            for q in QUANTILES:
+                lines.append(f'{name}{{{labels},quantile="{q}"}} {stats.latency.percentile(q):.6f}')
+
+        name = f"{METRIC_PREFIX}_http_requests_total"
+        lines += [f"# HELP {name} Responses by route and status class.", f"# TYPE {name} counter"]
+        for stats in list(self.routes.values()):
+            labels = f'route="{_escape(stats.route)}",method="{stats.method}"'
+            for status_class, count in enumerate(stats.status_counts):
+                if count:
+                    lines.append(f'{name}{{{labels},status="{status_class}xx"}} {count}')
+
+        name = f"{METRIC_PREFIX}_http_request_errors_total"
+        lines += [f"# HELP {name} Server errors (5xx) by route.", f"# TYPE {name} counter"]
+        for stats in list(self.routes.values()):
+            labels = f'route="{_escape(stats.route)}",method="{stats.method}"'
+            lines.append(f'{name}{{{labels}}} {stats.status_counts[5]}')
+
+        name = f"{METRIC_PREFIX}_span_duration_seconds"
+        lines += [f"# HELP {name} Time spent in internal steps of a request.", f"# TYPE {name} histogram"]
+        for span_name, histogram in sorted(self.spans.items()):
+            _render_histogram(lines, name, f'span="{span_name}"', histogram)
+
+        for gauge_name, help_text, collect in self.gauges:
+            name = f"{METRIC_PREFIX}_{gauge_name}"
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+            value = collect()
+            if isinstance(value, dict):
+                for label, number in value.items():
+                    if isinstance(number, (int, float)):
+                        lines.append(f'{name}{{stat="{label}"}} {float(number)}')
+            else:
+                lines.append(f"{name} {float(value)}")
+
+        name = f"{METRIC_PREFIX}_process_start_time_seconds"
+        lines += [f"# TYPE {name} gauge", f"{name} {self.started}"]
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+def _render_histogram(lines, name, labels, histogram):
+    counts, total, count = histogram.snapshot()
+    cumulative = 0
+    for bound, bucket_count in zip(histogram.bounds, counts):
+        cumulative += bucket_count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {count}')
+    lines.append(f'{name}_sum{{{labels}}} {total:.6f}')
+    lines.append(f'{name}_count{{{labels}}} {count}')
+
+
+def timed(histogram):
+    """Decorator recording a function's wall time into `histogram`."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+# This worker's metrics
+registry = Registry()
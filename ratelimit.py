@@ -0,0 +1,203 @@
+# ratelimit.py
+"""
+Host-wide rate-limit storage for Flask-Limiter, backed by a SQLite file.
+
+Every gunicorn worker on a host opens the same file (on /dev/shm where available, so it
+never touches disk), which makes "5 per minute" mean 5 per minute per client rather than
+5 per worker. Each hit is one short IMMEDIATE transaction: there is no network round trip
+as with Redis, and the sliding-window check-and-increment is atomic across processes.
+
+Importing this module registers the ``sqlite://`` storage scheme with `limits`:
+
+    RATELIMIT_STORAGE_URI=sqlite:////dev/shm/healthscanner-ratelimits.db
+"""
+
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from limits.storage import Storage
+from limits.storage.base import SlidingWindowCounterSupport, TimestampedSlidingWindow
+from limits.strategies import FixedWindowRateLimiter, SlidingWindowCounterRateLimiter
+
+# --- Rate Limit Storage Configuration ---
+_SHARED_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+RATELIMIT_STORAGE_URI = os.environ.get(
+    'RATELIMIT_STORAGE_URI', f"sqlite:///{os.path.join(_SHARED_DIR, 'healthscanner-ratelimits.db')}"
+)
+RATELIMIT_STRATEGY = os.environ.get('RATELIMIT_STRATEGY', 'sliding-window-counter')
+RATELIMIT_CLEANUP_SECONDS = float(os.environ.get('RATELIMIT_CLEANUP_SECONDS', '60'))  # Expired-key sweep interval
+RATELIMIT_BUSY_TIMEOUT = 5.0  # Seconds a worker waits for another worker's transaction
+
+SQL_CREATE_RATE_LIMITS_TABLE = """
+CREATE TABLE IF NOT EXISTS rate_limits (
+    key TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID
+"""
+
+# Expired counters restart from `amount`; live ones are incremented and keep their expiry
+SQL_INCR = """
+INSERT INTO rate_limits (key, count, expires_at) VALUES (?1, ?2, ?3)
+ON CONFLICT(key) DO UPDATE SET
+    count = CASE WHEN expires_at <= ?4 THEN excluded.count ELSE count + excluded.count END,
+    expires_at = CASE WHEN expires_at <= ?4 THEN excluded.expires_at ELSE expires_at END
+RETURNING count
+"""
+
+# Refunds never take a live counter below zero and leave expired ones to the sweep
+SQL_DECR = """
+UPDATE rate_limits SET count = MAX(count - ?1, 0)
+WHERE key = ?2 AND expires_at > ?3
+RETURNING count
+"""
+
+SQL_GET = "SELECT count FROM rate_limits WHERE key = ? AND expires_at > ?"
+SQL_GET_PAIR = "SELECT key, count FROM rate_limits WHERE key IN (?, ?) AND expires_at > ?"
+
+
+def refund_hit(strategy, item, identifiers, hit_at):
+    """
+    Gives back one hit `strategy` counted against `item` at `hit_at`, e.g. for a request that turned
+    out to be free. Take `hit_at` after the hit: across a window boundary the refund is then lost, never
+    given to the wrong window. Moving windows keep one entry per hit and are not refunded.
+    """
+    key = item.key_for(*identifiers)
+    if isinstance(strategy, SlidingWindowCounterRateLimiter):
+        # The hit went into the window that was current when it was counted, not the one current now
+        key = strategy.storage.sliding_window_keys(key, item.get_expiry(), hit_at)[1]
+    elif not isinstance(strategy, FixedWindowRateLimiter):
+        return
+    strategy.storage.decr(key)
+
+
+class SQLiteStorage(Storage, SlidingWindowCounterSupport, TimestampedSlidingWindow):
+    """
+    `limits` storage shared by all processes that open the same SQLite file.
+    Supports the fixed-window and sliding-window-counter strategies.
+    """
+
+    STORAGE_SCHEME = ["sqlite"]
+
+    def __init__(self, uri=None, wrap_exceptions=False, cleanup_interval=RATELIMIT_CLEANUP_SECONDS, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.path = uri[len('sqlite://'):] if uri and uri.startswith('sqlite://') else uri
+        if not self.path:
+            raise ValueError("SQLite rate-limit storage needs a file path, e.g. sqlite:////dev/shm/limits.db")
+        self.cleanup_interval = cleanup_interval
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._next_cleanup = 0.0
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _connection(self):
+        # 🔑 One connection per process: gunicorn forks workers after the app may have been imported
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=RATELIMIT_BUSY_TIMEOUT, isolation_level=None,
+                                   check_same_thread=False)
+            # Counters are disposable: skip fsyncs entirely, losing them on a crash is harmless
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = OFF")
+            conn.execute(SQL_CREATE_RATE_LIMITS_TABLE)
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def _maybe_cleanup(self, conn, now):
+        # Expired rows are ignored by every read, so they are swept in one batch per interval
+        if now >= self._next_cleanup:
+            self._next_cleanup = now + self.cleanup_interval
+            conn.execute("DELETE FROM rate_limits WHERE expires_at <= ?", (now,))
+
+    # --- Fixed window ---
+
+    def incr(self, key, expiry, amount=1):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            self._maybe_cleanup(conn, now)
+            return conn.execute(SQL_INCR, (key, amount, now + expiry, now)).fetchone()[0]
+
+    def decr(self, key, amount=1):
+        """Gives back `amount` hits on a live counter, e.g. for requests that turned out to be free."""
+        with self._lock:
+            row = self._connection().execute(SQL_DECR, (amount, key, time.time())).fetchone()
+        return row[0] if row else 0
+
+    def get(self, key):
+        with self._lock:
+            row = self._connection().execute(SQL_GET, (key, time.time())).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key):
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT expires_at FROM rate_limits WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else time.time()
+
+    def clear(self, key):
+        with self._lock:
+            self._connection().execute("DELETE FROM rate_limits WHERE key = ?", (key,))
+
+    def check(self):
+        try:
+            with self._lock:
+                self._connection().execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        with self._lock:
+            return self._connection().execute("DELETE FROM rate_limits").rowcount
+
+    # --- Sliding window counter ---
+
+    def _window(self, conn, key, expiry, now):
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        counts = dict(conn.execute(SQL_GET_PAIR, (previous_key, current_key, now)).fetchall())
+        previous_count = counts.get(previous_key, 0)
+        current_count = counts.get(current_key, 0)
+        previous_ttl = (1 - (((now - expiry) / expiry) % 1)) * expiry if previous_count else 0.0
+        current_ttl = (1 - ((now / expiry) % 1)) * expiry + expiry
+        return current_key, previous_count, previous_ttl, current_count, current_ttl
+
+    def acquire_sliding_window_entry(self, key, limit, expiry, amount=1):
+        if amount > limit:
+            return False
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            # IMMEDIATE takes the write lock up front, so read-check-increment is atomic across workers
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                current_key, previous_count, previous_ttl, current_count, _ = self._window(conn, key, expiry, now)
+                if math.floor(previous_count * previous_ttl / expiry + current_count) + amount > limit:
+                    allowed = False
+                else:
+                    # The current window is still weighed as the "previous" one for a full window after it ends
+                    conn.execute(SQL_INCR, (current_key, amount, now + 2 * expiry, now)).fetchone()
+                    allowed = True
+                self._maybe_cleanup(conn, now)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return allowed
+
+    def get_sliding_window(self, key, expiry):
+        with self._lock:
+            return self._window(self._connection(), key, expiry, time.time())[1:]
+
+    def clear_sliding_window(self, key, expiry):
+        previous_key, current_key = self.sliding_window_keys(key, expiry, time.time())
+        with self._lock:
+            self._connection().execute("DELETE FROM rate_limits WHERE key IN (?, ?)", (previous_key, current_key))
@@ -0,0 +1,204 @@
+# recommend.py
+
+import heapq
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+
+# --- Recommendation Configuration ---
+# Workers only see other workers' inserts after a full reload, so cap the index age
+ALTERNATIVES_REFRESH_SECONDS = float(os.environ.get('ALTERNATIVES_REFRESH_SECONDS', '300'))
+
+# Nutrients used for similarity, each divided by a typical per-100g maximum so they weigh alike
+SIMILARITY_NUTRIENTS = (
+    ('sugar', 100.0),
+    ('salt', 10.0),
+    ('fat', 100.0),
+    ('saturated_fat', 100.0),
+    ('protein', 100.0),
+    ('fiber', 50.0),
+    ('calories', 900.0),
+)
+
+_BARCODE_MAX = '\uffff'  # Sorts after every barcode, to find the end of a score group
+
+
+def nutrient_vector(product):
+    return tuple((product[name] or 0.0) / scale for name, scale in SIMILARITY_NUTRIENTS)
+
+def _distance(a, b):
+    return sum((x - y) * (x - y) for x, y in zip(a, b))
+
+
+class _CategoryBucket:
+    """One category's products, ordered by health score (best first) then barcode."""
+
+    def __init__(self):
+        self.keys = []      # (-health_score, barcode), kept sorted
+        self.entries = []   # Response summaries, parallel to `keys`
+
+    def add(self, key, entry):
+        index = bisect_left(self.keys, key)
+        if index < len(self.keys) and self.keys[index] == key:
+            self.entries[index] = entry
+            return
+        self.keys.insert(index, key)
+        self.entries.insert(index, entry)
+
+    def remove(self, key):
+        index = bisect_left(self.keys, key)
+        if index < len(self.keys) and self.keys[index] == key:
+            del self.keys[index]
+            del self.entries[index]
+
+
+class AlternativesIndex:
+    """
+    Precomputed "healthier alternatives" per category.
+
+    Each category keeps its products sorted by health score, so every strictly better product
+    is a prefix of the list. Candidates are taken best score first, and ties within a score
+    are broken by nutrient similarity to the scanned product.
+    """
+
+    def __init__(self, max_age=ALTERNATIVES_REFRESH_SECONDS):
+        self.max_age = max_age
+        self.loaded_at = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()  # One (re)build at a time
+        self._refreshing = False
+        self._replay = None  # Products added while a rebuild reads the table, re-applied to the new index
+        self._categories = {}
+        self._products = {}  # barcode -> (category, health_score, nutrient vector)
+
+    def is_stale(self):
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > self.max_age
+
+    def load(self, conn):
+        """(Re)builds the whole index from the products table."""
+        with self._load_lock:
+            self._build(conn)
+
+    def _build(self, conn):
+        sql = """
+        SELECT barcode, name, brand, category, health_score, sugar, salt, fat, saturated_fat, protein, fiber, calories
+        FROM products WHERE health_score IS NOT NULL
+        ORDER BY category, health_score DESC, barcode
+        """
+        with self._lock:
+            self._replay = []
+        categories = {}
+        products = {}
+        try:
+            cursor = conn.execute(sql)
+            names = [d[0] for d in cursor.description]
+            for values in cursor:
+                row = dict(zip(names, values))
+                bucket = categories.get(row['category'])
+                if bucket is None:
+                    bucket = categories[row['category']] = _CategoryBucket()
+                # Rows arrive in index order, so appending keeps every bucket sorted
+                bucket.keys.append((-row['health_score'], row['barcode']))
+                bucket.entries.append(self._entry(row))
+                products[row['barcode']] = (row['category'], row['health_score'], nutrient_vector(row))
+        except Exception:
+            with self._lock:
+                self._replay = None
+            raise
+        with self._lock:
+            replay, self._replay = self._replay, None
+            self._categories = categories
+            self._products = products
+            for product in replay:
+                self._add_locked(product)
+            self.loaded_at = time.monotonic()
+
+    def ensure_loaded(self, conn):
+        """
+        Builds the index on first use (concurrent first requests wait for the one build). A stale
+        index keeps serving while a single background thread rebuilds it from its own connection.
+        """
+        if self.loaded_at is None:
+            with self._load_lock:
+                if self.loaded_at is None:
+                    self._build(conn)
+        elif self.is_stale():
+            with self._lock:
+                if self._refreshing:
+                    return
+                self._refreshing = True
+            threading.Thread(target=self._refresh, name='alternatives-refresh', daemon=True).start()
+
+    def _refresh(self):
+        from database import create_connection  # Imported here: the index itself only needs a connection
+        # A private connection: a rebuild reads the whole table and would otherwise hold a pooled reader for seconds
+        conn = create_connection()
+        try:
+            self.load(conn)
+        except Exception as e:
+            print(f"Error refreshing the alternatives index: {e}")
+        finally:
+            if conn is not None:
+                conn.close()
+            with self._lock:
+                self._refreshing = False
+
+    def add(self, product):
+        """Incrementally indexes one inserted or updated product (a dict with the products columns)."""
+        with self._lock:
+            if self.loaded_at is not None:
+                self._add_locked(product)
+            # A (re)build in progress may have read the table before this write: apply it again afterwards
+            if self._replay is not None:
+                self._replay.append(product)
+
+    def _add_locked(self, product):
+        previous = self._products.get(product['barcode'])
+        if previous is not None:
+            self._categories[previous[0]].remove((-previous[1], product['barcode']))
+        bucket = self._categories.get(product['category'])
+        if bucket is None:
+            bucket = self._categories[product['category']] = _CategoryBucket()
+        bucket.add((-product['health_score'], product['barcode']), self._entry(product))
+        self._products[product['barcode']] = (product['category'], product['health_score'], nutrient_vector(product))
+
+    def alternatives(self, barcode, limit=5):
+        """
+        Up to `limit` products in the same category with a strictly higher health score.
+        Returns None when the barcode is not indexed.
+        """
+        with self._lock:
+            product = self._products.get(barcode)
+            if product is None:
+                return None
+            category, score, vector = product
+            bucket = self._categories[category]
+            end = bisect_left(bucket.keys, (-score, ''))
+
+            results = []
+            start = 0
+            while start < end and len(results) < limit:
+                group_score = bucket.keys[start][0]
+                stop = bisect_right(bucket.keys, (group_score, _BARCODE_MAX), start, end)
+                group = range(start, stop)
+                closest = heapq.nsmallest(
+                    limit - len(results), group,
+                    key=lambda i: _distance(self._products[bucket.keys[i][1]][2], vector),
+                )
+                results.extend(bucket.entries[i] for i in closest)
+                start = stop
+            return results
+
+    @staticmethod
+    def _entry(product):
+        return {
+            "barcode": product['barcode'],
+            "name": product['name'],
+            "brand": product['brand'],
+            "health_score": product['health_score'],
+        }
+
+
+# This worker's index, built lazily on the first alternatives request
+alternatives_index = AlternativesIndex()
@@ -1,67 +1,364 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from math import inf, nextafter
+
+# NumPy is optional: the batch scorer falls back to the standard library `array` module without it.
+# It is imported on the first large batch, so web workers that only score single scans never load it.
+np = None
+_numpy_checked = False
+NUMPY_MIN_BATCH = 32  # Below this the pure-Python loop beats NumPy's per-call overhead
+
+def _load_numpy():
+    global np, _numpy_checked
+    if not _numpy_checked:
+        try:
+            import numpy
+            np = numpy
+        except ImportError:
+            pass
+        _numpy_checked = True
+    return np
+
 # --- Scoring Constants ---
+# 🔑 Bump whenever a constant or rule below changes: stored scores from older versions get recomputed
+# v2: NULL nutrients score as 0.0 in the batch scorers (v1 NumPy batches gave them the top deduction tier)
+SCORING_RULES_VERSION = 2
 BASE_SCORE = 100
 MAX_DEDUCTION_ADDITIVES = 15
 DEDUCTION_PER_ADDITIVE = 3
+MIN_SCORE = 0
+MAX_SCORE = 100
+
+# --- Nutrient Rule Table ---
+# Shared by the scalar and batch scorers so the two paths cannot drift.
+# Each rule is (nutrient, tiers). Tiers are checked in order and only the first match applies.
+# A tier is (threshold, inclusive, points): inclusive tiers match value >= threshold, the others value > threshold.
+NUTRIENT_RULES = (
+    # --- Deductions ---
+    # Sugar Content (Thresholds: >15g, 5-15g)
+    ('sugar', ((15.0, False, -30), (5.0, True, -15))),
+    # Salt Content (Thresholds: >1.5g, 0.5-1.5g)
+    ('salt', ((1.5, False, -25), (0.5, True, -10))),
+    # Saturated Fat (Thresholds: >5g, 2-5g)
+    ('saturated_fat', ((5.0, False, -20), (2.0, True, -10))),
+    # --- Bonuses ---
+    # Fiber (Thresholds: ≥6g, 3-6g)
+    ('fiber', ((6.0, True, 5), (3.0, True, 2))),
+    # Protein (Thresholds: ≥10g, 5-10g)
+    ('protein', ((10.0, True, 5), (5.0, True, 2))),
+)
+SCORED_NUTRIENTS = tuple(nutrient for nutrient, _ in NUTRIENT_RULES)
+
+# --- Scoring Profiles ---
+# Each profile is plain data, compiled once at import into bisect threshold tables (ScoringProfile).
+#   base, min, max          Starting score and clamp bounds (None leaves that side unclamped)
+#   additive_deduction      Points removed per additive, up to max_additive_deduction
+#   rules                   Dicts with 'nutrient' and 'tiers' (as in NUTRIENT_RULES), plus optional
+#                           'scale' (unit conversion applied to the value) and 'while_below' (the rule only
+#                           counts while the points gained from earlier rules are below this)
+#   grades                  Optional (highest score, letter) bands, lowest first; the last bound is None
+# 🔑 Bump a profile's version whenever its data changes: it is part of the response ETag
+
+def _ladder(thresholds, step=1):
+    # Tiers for a points-per-band table: exceeding thresholds[i] scores (i + 1) * step
+    return tuple((threshold, False, (i + 1) * step) for i, threshold in reversed(list(enumerate(thresholds))))
+
+DEFAULT_PROFILE = 'default'
+
+SCORING_PROFILES = {
+    DEFAULT_PROFILE: {
+        'version': SCORING_RULES_VERSION,
+        'description': "Health Score (0-100, higher is healthier).",
+        'base': BASE_SCORE,
+        'min': MIN_SCORE,
+        'max': MAX_SCORE,
+        'additive_deduction': DEDUCTION_PER_ADDITIVE,
+        'max_additive_deduction': MAX_DEDUCTION_ADDITIVES,
+        'rules': tuple({'nutrient': nutrient, 'tiers': tiers} for nutrient, tiers in NUTRIENT_RULES),
+    },
+    'nutriscore': {
+        'version': 1,
+        'description': "Nutri-Score points for solid foods (-15 to 40, lower is healthier) and the A-E grade. "
+                       "Fruit and vegetable content is not recorded, so it never earns points.",
+        'base': 0,
+        'min': None,
+        'max': None,
+        'additive_deduction': 0,
+        'max_additive_deduction': 0,
+        'rules': (
+            # --- Unfavourable (N) points ---
+            {'nutrient': 'calories', 'scale': 4.184,  # kcal -> kJ
+             'tiers': _ladder((335, 670, 1005, 1340, 1675, 2010, 2345, 2680, 3015, 3350))},
+            {'nutrient': 'sugar', 'tiers': _ladder((4.5, 9, 13.5, 18, 22.5, 27, 31, 36, 40, 45))},
+            {'nutrient': 'saturated_fat', 'tiers': _ladder((1, 2, 3, 4, 5, 6, 7, 8, 9, 10))},
+            {'nutrient': 'salt', 'scale': 400.0,  # g salt -> mg sodium
+             'tiers': _ladder((90, 180, 270, 360, 450, 540, 630, 720, 810, 900))},
+            # --- Favourable (P) points, subtracted ---
+            # Protein only counts while N is below 11 (the fruit/vegetable exception never applies here)
+            {'nutrient': 'protein', 'while_below': 11, 'tiers': _ladder((1.6, 3.2, 4.8, 6.4, 8.0), step=-1)},
+            {'nutrient': 'fiber', 'tiers': _ladder((0.9, 1.9, 2.8, 3.7, 4.7), step=-1)},
+        ),
+        'grades': ((-1, 'A'), (2, 'B'), (10, 'C'), (18, 'D'), (None, 'E')),
+    },
+}
+
 
-def calculate_health_score(product_data, additives_list):
+def _without_nulls(values):
+    # SQL NULLs score as 0.0 in every engine, like missing keys in score(): NumPy would read them as NaN
+    # (and searchsorted puts NaN in the top tier) while the array engine cannot compare None at all
+    if values is None or isinstance(values, array) or getattr(values, 'dtype', object) != object:
+        return values
+    return [0.0 if value is None else value for value in values] if None in values else values
+
+
+class ScoringProfile:
+    """
+    A scoring profile compiled for fast evaluation. Each rule becomes a sorted threshold list and
+    a points table (used by the NumPy engine), and the scalar scorers are generated Python code
+    with every rule unrolled into a comparison chain, as fast as a hand-written if-chain.
+
+    score(product_data, additives_list)   One product from a dict of per-100g values;
+                                          missing (or None) nutrients count as 0.0.
+    score_values(values, num_additives)   One product from its nutrient values in `nutrients` order.
+    """
+
+    def __init__(self, name, spec):
+        self.name = name
+        self.version = spec['version']
+        self.description = spec.get('description', '')
+        self.base = spec['base']
+        self.min = spec.get('min')
+        self.max = spec.get('max')
+        self.additive_deduction = spec.get('additive_deduction', 0)
+        self.max_additive_deduction = spec.get('max_additive_deduction', 0)
+        self.nutrients = tuple(rule['nutrient'] for rule in spec['rules'])
+        self.rules = tuple(self._compile_rule(rule) for rule in spec['rules'])
+        self.score, self.score_values = self._compile_scorers()
+        grades = spec.get('grades') or ()
+        self._grade_bounds = [bound for bound, _ in grades[:-1]]
+        self._grade_letters = tuple(letter for _, letter in grades)
+
+    def _compile_rule(self, rule):
+        tiers = rule['tiers']
+        if any(a[0] <= b[0] for a, b in zip(tiers, tiers[1:])):
+            raise ValueError(f"Profile {self.name!r}: {rule['nutrient']} tiers must go from the highest threshold down.")
+        # `value > t` is `value >= nextafter(t)`, so every tier becomes inclusive and bisect_right finds the match
+        thresholds = [threshold if inclusive else nextafter(threshold, inf) for threshold, inclusive, _ in reversed(tiers)]
+        points = (0, *(points for _, _, points in reversed(tiers)))
+        return rule.get('scale', 1.0), thresholds, points, rule.get('while_below')
+
+    def _compile_scorers(self):
+        """
+        Generates score() and score_values() for this profile. Thresholds are written with repr(),
+        which round-trips floats exactly, so each chain matches points[bisect_right(thresholds, value)].
+        """
+        body = ["    score = %r" % self.base]
+        for index, (scale, thresholds, points, while_below) in enumerate(self.rules):
+            value = f"v{index}" if scale == 1.0 else f"v{index} * {scale!r}"
+            chain = []
+            for position in range(len(thresholds) - 1, -1, -1):
+                keyword = "if" if not chain else "elif"
+                chain += [f"{keyword} {value} >= {thresholds[position]!r}:", f"    score += {points[position + 1]!r}"]
+            if while_below is not None:
+                body.append(f"    if score - {self.base!r} < {while_below!r}:")
+                body += [f"        {line}" for line in chain]
+            else:
+                body += [f"    {line}" for line in chain]
+        body.append(f"    score -= min(num_additives * {self.additive_deduction!r}, {self.max_additive_deduction!r})")
+        numbers = [self.base, self.additive_deduction, *(p for rule in self.rules for p in rule[2])]
+        if not all(isinstance(number, int) for number in numbers):
+            body.append("    score = int(round(score))")
+        if self.min is not None:
+            body.append(f"    if score < {self.min!r}: score = {self.min!r}")
+        if self.max is not None:
+            body.append(f"    if score > {self.max!r}: score = {self.max!r}")
+        body.append("    return score")
+
+        names = [f"v{index}" for index in range(len(self.rules))]
+        source = "\n".join([
+            "def score(product_data, additives_list):",
+            "    get = product_data.get",
+            *(f"    {name} = get({nutrient!r})\n    if {name} is None: {name} = 0.0"
+              for name, nutrient in zip(names, self.nutrients)),
+            "    num_additives = len(additives_list)",
+            *body,
+            "",
+            "def score_values(values, num_additives):",
+            f"    {', '.join(names)}, = values",
+            *body,
+        ])
+        namespace = {}
+        exec(compile(source, f"<scoring profile {self.name}>", "exec"), namespace)
+        return namespace['score'], namespace['score_values']
+
+    def grade(self, score):
+        """The letter band for a score, or None when the profile defines no grades."""
+        return self._grade_letters[bisect_left(self._grade_bounds, score)] if self._grade_letters else None
+
+    def score_batch(self, columns, additive_counts):
+        """Columnar scoring, identical to score() per product (see calculate_health_scores)."""
+        columns = {nutrient: _without_nulls(columns.get(nutrient)) for nutrient in self.nutrients}
+        if len(additive_counts) >= NUMPY_MIN_BATCH and _load_numpy() is not None:
+            return self._score_batch_numpy(columns, additive_counts)
+        return self._score_batch_array(columns, additive_counts)
+
+    def _score_batch_numpy(self, columns, additive_counts):
+        counts = np.asarray(additive_counts, dtype=np.int64)
+        size = len(counts)
+        score = np.full(size, self.base, dtype=np.float64)
+
+        for nutrient, (scale, thresholds, points, while_below) in zip(self.nutrients, self.rules):
+            values = columns.get(nutrient)
+            values = np.zeros(size) if values is None else np.asarray(values, dtype=np.float64)
+            if scale != 1.0:
+                values = values * scale
+            gained = np.asarray(points, dtype=np.float64)[np.searchsorted(thresholds, values, side='right')]
+            if while_below is not None:
+                gained = np.where(score - self.base < while_below, gained, 0.0)
+            score += gained
+
+        score -= np.minimum(counts * self.additive_deduction, self.max_additive_deduction)
+
+        # np.rint rounds half to even, matching Python's round()
+        score = np.rint(score)
+        if self.min is not None or self.max is not None:
+            score = np.clip(score, self.min, self.max)
+        return score.astype(np.int64)
+
+    def _score_batch_array(self, columns, additive_counts):
+        size = len(additive_counts)
+        nutrient_columns = [
+            columns[nutrient] if columns.get(nutrient) is not None else array('d', bytes(8 * size))
+            for nutrient in self.nutrients
+        ]
+        scores = array('i', bytes(4 * size))
+        for i, values in enumerate(zip(*nutrient_columns)):
+            scores[i] = self.score_values(values, additive_counts[i])
+        return scores
+
+
+PROFILES = {name: ScoringProfile(name, spec) for name, spec in SCORING_PROFILES.items()}
+
+def get_profile(name=None):
+    """Compiled profile by name (the default profile when `name` is empty), or None if unknown."""
+    return PROFILES.get(name or DEFAULT_PROFILE)
+
+_DEFAULT_SCORER = PROFILES[DEFAULT_PROFILE].score
+
+def calculate_health_score(product_data, additives_list, profile=None):
     """
     Calculates the Health Score (0-100) based on nutritional data (per 100g) and additives.
-    
+
     Args:
         product_data (dict): Product nutrition (sugar, salt, sat_fat, protein, fiber) per 100g.
         additives_list (list): List of additive E-numbers/names.
-        
+        profile (ScoringProfile): Scores with another profile instead of the default one.
+
     Returns:
         int: The final health score clamped between 0 and 100.
     """
-    score = BASE_SCORE
-    sugar = product_data.get('sugar', 0.0)
-    salt = product_data.get('salt', 0.0)
-    saturated_fat = product_data.get('saturated_fat', 0.0)
-    fiber = product_data.get('fiber', 0.0)
-    protein = product_data.get('protein', 0.0)
-    num_additives = len(additives_list)
-    
-    # --- Deductions ---
-    
-    # Sugar Content (Thresholds: >15g, 5-15g)
-    if sugar > 15.0:
-        score -= 30
-    elif sugar >= 5.0:
-        score -= 15
-        
-    # Salt Content (Thresholds: >1.5g, 0.5-1.5g)
-    if salt > 1.5:
-        score -= 25
-    elif salt >= 0.5:
-        score -= 10
-        
-    # Saturated Fat (Thresholds: >5g, 2-5g)
-    if saturated_fat > 5.0:
-        score -= 20
-    elif saturated_fat >= 2.0:
-        score -= 10
-        
-    # Additives (Deduction: -3 points each, max -15)
-    additive_deduction = min(num_additives * DEDUCTION_PER_ADDITIVE, MAX_DEDUCTION_ADDITIVES)
-    score -= additive_deduction
-    
-    # --- Bonuses ---
-    
-    # Fiber (Thresholds: ≥6g, 3-6g)
-    if fiber >= 6.0:
-        score += 5
-    elif fiber >= 3.0:
-        score += 2
-        
-    # Protein (Thresholds: ≥10g, 5-10g)
-    if protein >= 10.0:
-        score += 5
-    elif protein >= 5.0:
-        score += 2
-        
-    # --- Final Score Clamping ---
-    # Max(0, Min(100, calculated_score))
-    final_score = max(0, min(100, int(round(score))))
-    
-    return final_score
\ No newline at end of file
+    return profile.score(product_data, additives_list) if profile is not None else _DEFAULT_SCORER(product_data, additives_list)
+
+def calculate_health_scores(columns, additive_counts, profile=None):
+    """
+    Calculates Health Scores for many products at once from columnar data.
+
+    Produces exactly the same values as calling calculate_health_score() on each product.
+
+    Args:
+        columns (dict): Nutrient name -> sequence of per-100g values (NumPy array, array.array or list).
+            Missing nutrients are treated as 0.0, like the scalar function.
+        additive_counts (sequence): Number of additives for each product.
+        profile (ScoringProfile): Scores with another profile instead of the default one.
+
+    Returns:
+        numpy.ndarray (int64) for batches of NUMPY_MIN_BATCH or more when NumPy is installed,
+        otherwise array.array('i').
+    """
+    return (profile or PROFILES[DEFAULT_PROFILE]).score_batch(columns, additive_counts)
+
+
+if __name__ == '__main__':
+    # Parity checks: the compiled default profile must reproduce the original if-chain scorer exactly,
+    # and every batch engine must match the scalar scorer for every profile
+    from database import read_sample_products, SUGAR, SALT, SAT_FAT, PROTEIN, FIBER, CALORIES, ADDITIVES
+
+    def reference_score(product_data, additives_list):
+        score = BASE_SCORE
+        for nutrient, tiers in NUTRIENT_RULES:
+            value = product_data.get(nutrient, 0.0)
+            for threshold, inclusive, points in tiers:
+                if value > threshold or (inclusive and value == threshold):
+                    score += points
+                    break
+        score -= min(len(additives_list) * DEDUCTION_PER_ADDITIVE, MAX_DEDUCTION_ADDITIVES)
+        return max(MIN_SCORE, min(MAX_SCORE, int(round(score))))
+
+    SAMPLE_PRODUCTS = read_sample_products()
+    columns = {
+        'sugar': array('d', (p[SUGAR] for p in SAMPLE_PRODUCTS)),
+        'salt': array('d', (p[SALT] for p in SAMPLE_PRODUCTS)),
+        'saturated_fat': array('d', (p[SAT_FAT] for p in SAMPLE_PRODUCTS)),
+        'protein': array('d', (p[PROTEIN] for p in SAMPLE_PRODUCTS)),
+        'fiber': array('d', (p[FIBER] for p in SAMPLE_PRODUCTS)),
+        'calories': array('d', (p[CALORIES] for p in SAMPLE_PRODUCTS)),
+    }
+    additive_lists = [[a for a in p[ADDITIVES].split(',') if a.strip()] for p in SAMPLE_PRODUCTS]
+    counts = array('i', (len(a) for a in additive_lists))
+    rows = [{name: column[i] for name, column in columns.items()} for i in range(len(SAMPLE_PRODUCTS))]
+
+    # Every threshold, a hair either side of it, and the sample products
+    edges = sorted({edge for _, tiers in NUTRIENT_RULES for threshold, _, _ in tiers
+                    for edge in (threshold, nextafter(threshold, -inf), nextafter(threshold, inf))} | {0.0, 100.0})
+    probes = [({nutrient: value}, additives) for nutrient in SCORED_NUTRIENTS for value in edges
+              for additives in ([], ['E1'] * 3, ['E1'] * 9)] + list(zip(rows, additive_lists))
+    mismatches = [data for data, additives in probes if calculate_health_score(data, additives) != reference_score(data, additives)]
+    assert not mismatches, f"default profile differs from the reference scorer for: {mismatches[:5]}"
+    print(f"default: {len(probes)} boundary and sample cases match the reference scorer.")
+
+    # Every profile's generated if-chains must agree with its bisect tables (the NumPy engine's source of truth)
+    def table_score(profile, values, num_additives):
+        score = profile.base
+        for (scale, thresholds, points, while_below), value in zip(profile.rules, values):
+            if while_below is None or score - profile.base < while_below:
+                score += points[bisect_right(thresholds, value * scale)]
+        score -= min(num_additives * profile.additive_deduction, profile.max_additive_deduction)
+        score = int(round(score))
+        score = max(profile.min, score) if profile.min is not None else score
+        return min(profile.max, score) if profile.max is not None else score
+
+    import random
+    rng = random.Random(4)
+    for profile in PROFILES.values():
+        edges = [sorted({0.0, *(edge for t in thresholds for edge in (t / scale, nextafter(t / scale, -inf), nextafter(t / scale, inf)))})
+                 for scale, thresholds, _, _ in profile.rules]
+        cases = [[rng.choice(column) for column in edges] for _ in range(20000)]
+        for values in cases:
+            additives = rng.randrange(8)
+            expected = table_score(profile, values, additives)
+            assert profile.score_values(values, additives) == expected, (profile.name, values, additives)
+            assert profile.score(dict(zip(profile.nutrients, values)), ['E1'] * additives) == expected
+        print(f"{profile.name}: {len(cases)} threshold combinations match the bisect tables.")
+
+    for profile in PROFILES.values():
+        expected = [profile.score(row, additives) for row, additives in zip(rows, additive_lists)]
+        engines = [("array", profile._score_batch_array)]
+        if _load_numpy() is not None:
+            engines.append(("numpy", profile._score_batch_numpy))
+        for label, engine in engines:
+            actual = [int(v) for v in engine(columns, counts)]
+            mismatches = [SAMPLE_PRODUCTS[i][0] for i, (a, b) in enumerate(zip(expected, actual)) if a != b]
+            assert not mismatches, f"{profile.name} {label} batch scorer differs for barcodes: {mismatches}"
+            print(f"{profile.name} {label}: {len(actual)} sample products scored identically.")
+
+    # NULL nutrients (SQL rows) score as 0.0 in the scalar scorer and in both batch engines
+    null_columns = {nutrient: [None] * NUMPY_MIN_BATCH for nutrient in SCORED_NUTRIENTS}
+    null_counts = [0] * NUMPY_MIN_BATCH
+    for profile in PROFILES.values():
+        expected = profile.score({}, [])
+        assert profile.score(dict.fromkeys(SCORED_NUTRIENTS), []) == expected
+        # A full batch takes the NumPy engine when it is installed; a single row always takes the array engine
+        for size in (NUMPY_MIN_BATCH, 1):
+            batch = {nutrient: column[:size] for nutrient, column in null_columns.items()}
+            assert {int(v) for v in profile.score_batch(batch, null_counts[:size])} == {expected}, profile.name
+    print("NULL nutrients score as 0.0 in every engine.")
@@ -0,0 +1,327 @@
+# snapshot.py
+"""
+Compact, memory-mapped, read-only snapshot of the products table.
+
+    python manage.py snapshot --output catalogue.snap
+
+Workers mmap the file, so every worker on a host shares the same page-cache pages
+instead of holding its own copy of the catalogue, and a scan is a binary search over
+a sorted fixed-width barcode index rather than a SQLite query. SQLite stays the source
+of truth: products missing from the snapshot (e.g. added since the last export) fall
+through to the database, and re-exporting swaps the file atomically.
+
+File layout (little-endian, every section 8-byte aligned):
+    header        magic, format version, row count, string count, scoring rules version, created at
+    barcode keys  count x uint64 (barcode length * 10**13 + digits), sorted
+    nutrients     one float64 column per NUTRIENT_COLUMNS entry (NaN = NULL)
+    scores        int32 health score per row
+    updated at    int64 Unix time of the row's last change (Last-Modified)
+    string refs   one uint32 column per STRING_COLUMNS entry, indexing the string table
+    string table  (string count + 1) uint32 offsets, then the UTF-8 blob of interned strings
+"""
+
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from database import parse_additives
+from scoring import calculate_health_score, SCORING_RULES_VERSION, SCORED_NUTRIENTS
+
+# --- Snapshot Configuration ---
+CATALOGUE_SNAPSHOT = os.environ.get('CATALOGUE_SNAPSHOT', '')  # Path; unset disables snapshot lookups
+SNAPSHOT_CHECK_SECONDS = float(os.environ.get('SNAPSHOT_CHECK_SECONDS', '5'))  # How often workers look for a new file
+
+MAGIC = b'HSSNAP\x00\x01'
+FORMAT_VERSION = 2
+HEADER = struct.Struct('<8sIIIId')
+BARCODE_WIDTH = 13
+KEY_LENGTH_FACTOR = 10 ** BARCODE_WIDTH
+NULL_REF = 0xFFFFFFFF
+
+NUTRIENT_COLUMNS = ('sugar', 'salt', 'fat', 'saturated_fat', 'protein', 'fiber', 'calories')
+STRING_COLUMNS = ('name', 'brand', 'category', 'additives')
+
+SQL_SELECT_SNAPSHOT_ROWS = f"""
+SELECT barcode, {', '.join(NUTRIENT_COLUMNS)}, name, brand, category, additives, health_score, score_version, updated_at
+FROM products
+"""
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+def barcode_key(barcode):
+    """
+    Fixed-width uint64 key for an 8-13 digit barcode. The length is folded in so that
+    leading zeros stay significant ('00012345' and '12345' never collide).
+    """
+    return len(barcode) * KEY_LENGTH_FACTOR + int(barcode)
+
+def _layout(count, string_count, blob_size=0):
+    """Byte offsets of every section, shared by the writer and the reader."""
+    sections = {}
+    offset = _align(HEADER.size)
+    for name, size in (
+        ('keys', count * 8),
+        ('nutrients', len(NUTRIENT_COLUMNS) * count * 8),
+        ('scores', count * 4),
+        ('updated_at', count * 8),
+        ('string_refs', len(STRING_COLUMNS) * count * 4),
+        ('string_offsets', (string_count + 1) * 4),
+        ('blob', blob_size),
+    ):
+        sections[name] = offset
+        offset = _align(offset + size)
+    return sections, offset
+
+
+# --- Export ---
+
+def _is_number(value):
+    return value is None or (isinstance(value, float) and not math.isnan(value))
+
+def export_snapshot(conn, path, log=print):
+    """
+    Writes a snapshot of `conn`'s products table to `path`, replacing any previous file atomically.
+    Rows whose values cannot be stored exactly (e.g. text in a numeric column) are left out and
+    keep being served from SQLite. Returns the number of exported rows.
+    """
+    started = time.perf_counter()
+    keys = []
+    nutrients = [array('d') for _ in NUTRIENT_COLUMNS]
+    scores = array('i')
+    updated = array('q')
+    refs = [array('I') for _ in STRING_COLUMNS]
+    interned = {}
+    skipped = 0
+
+    for row in conn.execute(SQL_SELECT_SNAPSHOT_ROWS):
+        barcode = row[0]
+        values = row[1:1 + len(NUTRIENT_COLUMNS)]
+        name, brand, category, additives, health_score, score_version, updated_at = row[1 + len(NUTRIENT_COLUMNS):]
+        # Calories is an INTEGER column, so whole-number floats never come back from SQLite
+        calories = values[-1]
+        if isinstance(calories, int):
+            values = values[:-1] + (float(calories),)
+        elif isinstance(calories, float) and calories.is_integer():
+            skipped += 1
+            continue
+        if not (isinstance(barcode, str) and barcode.isdigit() and 0 < len(barcode) <= BARCODE_WIDTH) \
+                or not all(_is_number(v) for v in values) \
+                or not all(v is None or isinstance(v, str) for v in (name, brand, category, additives)):
+            skipped += 1
+            continue
+
+        additives_list = parse_additives(additives)
+        if score_version != SCORING_RULES_VERSION or health_score is None:
+            nutrition = dict(zip(NUTRIENT_COLUMNS, values))
+            health_score = calculate_health_score({n: nutrition[n] for n in SCORED_NUTRIENTS}, additives_list)
+
+        keys.append(barcode_key(barcode))
+        for column, value in zip(nutrients, values):
+            column.append(math.nan if value is None else value)
+        scores.append(health_score)
+        updated.append(updated_at or 0)
+        for column, text in zip(refs, (name, brand, category, ','.join(additives_list))):
+            column.append(NULL_REF if text is None else interned.setdefault(text, len(interned)))
+
+    # Sort every column by barcode key, so lookups are a binary search over the key column
+    count = len(keys)
+    order = sorted(range(count), key=keys.__getitem__)
+    keys = array('Q', (keys[i] for i in order))
+    nutrients = [array('d', (column[i] for i in order)) for column in nutrients]
+    scores = array('i', (scores[i] for i in order))
+    updated = array('q', (updated[i] for i in order))
+    refs = [array('I', (column[i] for i in order)) for column in refs]
+    offsets = array('I', [0])
+    blob = bytearray()
+    for text in interned:  # Insertion order matches the assigned indexes
+        blob += text.encode('utf-8')
+        offsets.append(len(blob))
+
+    sections, size = _layout(count, len(interned), len(blob))
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        f.truncate(size)
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, count, len(interned), SCORING_RULES_VERSION, time.time()))
+        f.seek(sections['keys'])
+        f.write(keys.tobytes())
+        f.seek(sections['nutrients'])
+        for column in nutrients:
+            f.write(column.tobytes())
+        f.seek(sections['scores'])
+        f.write(scores.tobytes())
+        f.seek(sections['updated_at'])
+        f.write(updated.tobytes())
+        f.seek(sections['string_refs'])
+        for column in refs:
+            f.write(column.tobytes())
+        f.seek(sections['string_offsets'])
+        f.write(offsets.tobytes())
+        f.seek(sections['blob'])
+        f.write(blob)
+        f.flush()
+        os.fsync(f.fileno())
+    # 🔑 Readers either see the old file or the complete new one, never a partial write
+    os.replace(tmp_path, path)
+
+    log(f"Exported {count} products ({skipped} skipped, {len(interned)} distinct strings, {size / 1e6:.1f} MB) "
+        f"to {path} in {time.perf_counter() - started:.1f}s")
+    return count
+
+
+# --- Lookup ---
+
+class CatalogueSnapshot:
+    """A read-only view over one snapshot file."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, string_count, score_version, created_at = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} catalogue snapshot.")
+        self.path = path
+        self.count = count
+        self.score_version = score_version
+        self.created_at = created_at
+
+        sections, _ = _layout(count, string_count)
+        view = memoryview(self._mmap)
+        self._keys = view[sections['keys']:][:count * 8].cast('Q')
+        self._nutrients = [
+            view[sections['nutrients'] + i * count * 8:][:count * 8].cast('d') for i in range(len(NUTRIENT_COLUMNS))
+        ]
+        self._scores = view[sections['scores']:][:count * 4].cast('i')
+        self._updated_at = view[sections['updated_at']:][:count * 8].cast('q')
+        self._refs = [
+            view[sections['string_refs'] + i * count * 4:][:count * 4].cast('I') for i in range(len(STRING_COLUMNS))
+        ]
+        self._string_offsets = view[sections['string_offsets']:][:(string_count + 1) * 4].cast('I')
+        self._blob_at = sections['blob']
+
+    def _string(self, ref):
+        if ref == NULL_REF:
+            return None
+        offsets = self._string_offsets
+        return self._mmap[self._blob_at + offsets[ref]:self._blob_at + offsets[ref + 1]].decode('utf-8')
+
+    def find(self, barcode):
+        """Row index of `barcode`, or None. Binary search over the sorted key column (runs in C)."""
+        key = barcode_key(barcode)
+        index = bisect_left(self._keys, key)
+        if index < self.count and self._keys[index] == key:
+            return index
+        return None
+
+    def get(self, barcode):
+        """(product dict with the products columns, additives list), or None when not in the snapshot."""
+        index = self.find(barcode)
+        if index is None:
+            return None
+        product = {'barcode': barcode}
+        for name, column in zip(NUTRIENT_COLUMNS, self._nutrients):
+            value = column[index]
+            product[name] = None if math.isnan(value) else value
+        if product['calories'] is not None and product['calories'].is_integer():
+            product['calories'] = int(product['calories'])
+        name, brand, category, additives = (self._string(column[index]) for column in self._refs)
+        product.update(name=name, brand=brand, category=category, health_score=self._scores[index],
+                       score_version=self.score_version, updated_at=self._updated_at[index])
+        return product, parse_additives(additives)
+
+
+class SnapshotFile:
+    """
+    Serves lookups from the snapshot at `path`, reopening it when the file is replaced.
+    Requests already holding the previous snapshot finish on it; its mapping is released afterwards.
+    """
+
+    def __init__(self, path, check_interval=SNAPSHOT_CHECK_SECONDS):
+        self.path = path
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._identity = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    def current(self):
+        now = time.monotonic()
+        if now >= self._next_check:
+            with self._lock:
+                if now >= self._next_check:
+                    self._next_check = now + self.check_interval
+                    self._refresh()
+        return self._snapshot
+
+    def _refresh(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self._snapshot = self._identity = None
+            return
+        identity = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if identity == self._identity:
+            return
+        self._identity = identity
+        try:
+            self._snapshot = CatalogueSnapshot(self.path)
+            self.reloads += 1
+        except (OSError, ValueError, struct.error) as e:
+            print(f"Ignoring catalogue snapshot {self.path}: {e}")
+            self._snapshot = None
+
+    def get(self, barcode):
+        snapshot = self.current()
+        found = snapshot.get(barcode) if snapshot is not None else None
+        if found is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return found
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            "rows": snapshot.count if snapshot is not None else 0,
+            "created_at": snapshot.created_at if snapshot is not None else None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+        }
+
+
+catalogue_snapshot = SnapshotFile(CATALOGUE_SNAPSHOT) if CATALOGUE_SNAPSHOT else None
+
+
+# --- Self-check ---
+if __name__ == '__main__':
+    import sqlite3
+    import tempfile
+
+    import database
+
+    # Every sample product must read back from the snapshot exactly as SQLite returns it
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(':memory:')
+        conn.row_factory = sqlite3.Row
+        database.create_table(conn)
+        database.load_sample_data(conn)
+        path = os.path.join(tmp, 'catalogue.snap')
+        export_snapshot(conn, path)
+        snapshot = CatalogueSnapshot(path)
+        for row in conn.execute("SELECT * FROM products"):
+            product, additives = snapshot.get(row['barcode'])
+            expected = dict(row)
+            assert all(product[k] == expected[k] for k in product), (product, expected)
+            assert additives == database.get_additives(conn, row['barcode'])
+        assert snapshot.get('99999999') is None
+        print(f"Snapshot round-trip OK for {snapshot.count} products.")
@@ -0,0 +1,237 @@
+# submissions.py
+"""
+Write-behind queue for community product submissions (POST /api/product).
+
+Requests validate and score a submission, enqueue it and return 202 straight away.
+One writer thread per worker drains the queue in batches and commits each batch in
+a single transaction (group commit). Requests therefore never wait on SQLite's
+single-writer lock, and a burst of submissions costs a handful of commits instead of
+one per request. Each submission's outcome is stored in `product_submissions` with
+the batch, so once it is committed any worker can answer its status URL. Until then
+only the accepting worker knows the submission: ids start with their submit time, so
+other workers report a recent id they cannot find as queued rather than unknown.
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+from database import get_pool, replace_product_additives
+from metrics import registry
+
+# --- Submission Queue Configuration ---
+SUBMISSION_QUEUE_SIZE = int(os.environ.get('SUBMISSION_QUEUE_SIZE', '1000'))
+SUBMISSION_BATCH_SIZE = int(os.environ.get('SUBMISSION_BATCH_SIZE', '200'))
+# How long the writer waits for more submissions before committing (the group-commit window)
+SUBMISSION_COMMIT_DELAY = float(os.environ.get('SUBMISSION_COMMIT_DELAY', '0.02'))
+SUBMISSION_RETENTION_SECONDS = 7 * 24 * 3600  # Status rows kept this long for polling clients
+# How long an id no status row answers for yet still reads as queued (it may sit in another worker's queue)
+SUBMISSION_QUEUED_SECONDS = 300
+
+SUBMISSION_COMMIT_SPAN = registry.span('submission_commit')  # One observation per group commit
+SUBMISSION_LATENCY_SPAN = registry.span('submission_latency')  # Enqueue -> committed, per submission
+
+# First writer wins: a barcode that already exists (or appears twice in one batch) is reported as a duplicate
+SQL_INSERT_SUBMITTED_PRODUCT = """
+INSERT INTO products
+(barcode, name, brand, category, sugar, salt, fat, saturated_fat, protein, fiber, calories, additives,
+ health_score, additive_count, score_version)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (barcode) DO NOTHING
+"""
+
+SQL_INSERT_SUBMISSION_STATUS = """
+INSERT OR REPLACE INTO product_submissions (id, barcode, status, error, submitted_at, processed_at)
+VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+
+def new_submission_id(now=None):
+    """32 hex characters: the submit time in milliseconds (12), then 80 random bits."""
+    millis = int((time.time() if now is None else now) * 1000)
+    return f"{millis:012x}{uuid.uuid4().hex[:20]}"
+
+def submission_time(submission_id):
+    """The submit time (epoch seconds) encoded in a new_submission_id() id."""
+    return int(submission_id[:12], 16) / 1000
+
+
+class QueueFull(Exception):
+    """The submission queue is at SUBMISSION_QUEUE_SIZE; the client should retry later."""
+
+
+class SubmissionQueue:
+    """
+    Bounded in-process queue drained by a single writer thread.
+    `on_added(row, additives_list)` runs after each committed insert (cache invalidation etc.).
+    """
+
+    def __init__(self, maxsize=SUBMISSION_QUEUE_SIZE, batch_size=SUBMISSION_BATCH_SIZE,
+                 commit_delay=SUBMISSION_COMMIT_DELAY, on_added=None):
+        self.batch_size = batch_size
+        self.commit_delay = commit_delay
+        self.on_added = on_added
+        self._queue = queue.Queue(maxsize)
+        self._lock = threading.Lock()
+        self._pending = {}  # Submission id -> barcode, until its batch is committed
+        self._writer = None
+        self._pid = None
+        self._next_purge = 0.0
+        self._stats = {"enqueued": 0, "rejected_full": 0, "added": 0, "duplicates": 0, "failed": 0, "batches": 0}
+
+    def submit(self, row, additives_list):
+        """
+        Queues one scored product row (products column order, as inserted by add_product).
+        Returns the submission id; raises QueueFull when the queue is at capacity.
+        """
+        submission_id = new_submission_id()
+        with self._lock:
+            self._ensure_writer()
+            try:
+                self._queue.put_nowait((submission_id, row, additives_list, time.time(), time.perf_counter()))
+            except queue.Full:
+                self._stats["rejected_full"] += 1
+                raise QueueFull() from None
+            self._pending[submission_id] = row[0]
+            self._stats["enqueued"] += 1
+        return submission_id
+
+    def status(self, conn, submission_id):
+        """Status dict for a submission, or None when it is unknown (or older than the retention period)."""
+        with self._lock:
+            barcode = self._pending.get(submission_id)
+        if barcode is not None:
+            return {"id": submission_id, "barcode": barcode, "status": "queued"}
+        row = conn.execute(
+            "SELECT barcode, status, error FROM product_submissions WHERE id = ?", (submission_id,)
+        ).fetchone()
+        if row is None:
+            # Accepted by another worker and not committed yet: that worker alone knows the barcode
+            if 0 <= time.time() - submission_time(submission_id) <= SUBMISSION_QUEUED_SECONDS:
+                return {"id": submission_id, "status": "queued"}
+            return None
+        result = {"id": submission_id, "barcode": row[0], "status": row[1]}
+        if row[2]:
+            result["error"] = row[2]
+        return result
+
+    def _ensure_writer(self):
+        # 🔑 Started lazily (and again after a fork): threads do not survive into gunicorn's forked workers
+        if self._writer is None or self._pid != os.getpid() or not self._writer.is_alive():
+            self._pid = os.getpid()
+            self._writer = threading.Thread(target=self._run, name='submission-writer', daemon=True)
+            self._writer.start()
+
+    def _next_batch(self, timeout=None):
+        try:
+            batch = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        # Group commit: let submissions that arrive in the next few milliseconds share this transaction
+        deadline = time.perf_counter() + self.commit_delay
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch:
+                self._commit(batch)
+
+    def _commit(self, batch):
+        started = time.perf_counter()
+        outcomes = []
+        added = []
+        failed_batch = False
+        with get_pool().writer() as conn:
+            try:
+                # Explicit BEGIN: the per-row savepoints must nest inside the batch transaction, not commit it
+                if not conn.in_transaction:
+                    conn.execute("BEGIN")
+                for submission_id, row, additives_list, submitted_at, _ in batch:
+                    outcome = self._insert(conn, row, additives_list)
+                    outcomes.append((submission_id, row[0], *outcome, submitted_at))
+                    if outcome[0] == "added":
+                        added.append((row, additives_list))
+                now = time.time()
+                conn.executemany(SQL_INSERT_SUBMISSION_STATUS, [outcome + (now,) for outcome in outcomes])
+                self._purge_old_statuses(conn, now)
+                conn.commit()
+            except sqlite3.Error as e:
+                conn.rollback()
+                print(f"Error committing {len(batch)} queued product submissions: {e}")
+                outcomes = [(item[0], item[1][0], "failed", "Database error during product insertion.", item[3])
+                            for item in batch]
+                added = []
+                failed_batch = True
+        # 🔑 Outside the `with`: the writer lock is not reentrant, so recording failures inside it would deadlock
+        if failed_batch:
+            self._record_failures(outcomes)
+        SUBMISSION_COMMIT_SPAN.observe(time.perf_counter() - started)
+
+        committed_at = time.perf_counter()
+        for item in batch:
+            SUBMISSION_LATENCY_SPAN.observe(committed_at - item[4])
+        with self._lock:
+            for outcome in outcomes:
+                self._pending.pop(outcome[0], None)
+            self._stats["batches"] += 1
+            self._stats["added"] += sum(1 for outcome in outcomes if outcome[2] == "added")
+            self._stats["duplicates"] += sum(1 for outcome in outcomes if outcome[2] == "duplicate")
+            self._stats["failed"] += sum(1 for outcome in outcomes if outcome[2] == "failed")
+        if self.on_added is not None:
+            for row, additives_list in added:
+                self.on_added(row, additives_list)
+
+    @staticmethod
+    def _insert(conn, row, additives_list):
+        """Inserts one submission inside its own savepoint, so a bad row fails alone. Returns (status, error)."""
+        conn.execute("SAVEPOINT submission")
+        try:
+            inserted = conn.execute(SQL_INSERT_SUBMITTED_PRODUCT, row).rowcount
+            if inserted:
+                replace_product_additives(conn, row[0], additives_list)
+        except sqlite3.Error as e:
+            conn.execute("ROLLBACK TO submission")
+            conn.execute("RELEASE submission")
+            print(f"Error inserting queued product submission {row[0]}: {e}")
+            return "failed", "Database error during product insertion."
+        conn.execute("RELEASE submission")
+        if not inserted:
+            return "duplicate", f"Product with barcode {row[0]} already exists."
+        return "added", None
+
+    def _record_failures(self, outcomes):
+        # Best effort, in its own transaction, so polling clients learn the batch failed
+        try:
+            with get_pool().writer() as conn:
+                now = time.time()
+                conn.executemany(SQL_INSERT_SUBMISSION_STATUS, [outcome + (now,) for outcome in outcomes])
+                conn.commit()
+        except sqlite3.Error as e:
+            print(f"Error recording failed product submissions: {e}")
+
+    def _purge_old_statuses(self, conn, now):
+        if now >= self._next_purge:
+            self._next_purge = now + 3600
+            conn.execute("DELETE FROM product_submissions WHERE processed_at < ?", (now - SUBMISSION_RETENTION_SECONDS,))
+
+    def flush(self):
+        """Commits everything queued so far on the calling thread (used at shutdown)."""
+        while True:
+            batch = self._next_batch(timeout=0)
+            if not batch:
+                return
+            self._commit(batch)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, depth=self._queue.qsize(), capacity=self._queue.maxsize)
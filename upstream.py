@@ -0,0 +1,150 @@
+# upstream.py
+"""
+Read-through fallback to an upstream product source (an Open Food Facts mirror).
+
+UPSTREAM_PRODUCT_URL selects the source; leaving it unset disables the fallback:
+    https://mirror.example/api/v2/product/{barcode}.json   OFF API v2 over HTTP(S)
+    file:///srv/off-mirror                                 Directory of <barcode>.json files (offline mirrors, tests)
+"""
+
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+from urllib.parse import urlsplit
+from urllib.request import url2pathname
+
+# --- Upstream Configuration ---
+UPSTREAM_PRODUCT_URL = os.environ.get('UPSTREAM_PRODUCT_URL', '')
+UPSTREAM_TIMEOUT = float(os.environ.get('UPSTREAM_TIMEOUT', '3.0'))  # Seconds per fetch
+USER_AGENT = "HealthScannerAPI/1.0 (+https://healthscannersa.netlify.app)"
+
+
+class UpstreamError(Exception):
+    """The upstream source could not answer (timeout, bad response). Not the same as an unknown barcode."""
+
+
+def normalize_document(document, barcode):
+    """
+    OFF API v2 response ({"status": 1, "product": {...}}) or bare product object -> product tuple.
+    Returns None for unknown or unusable products.
+    """
+    if not isinstance(document, dict):
+        return None
+    if 'product' in document or 'status' in document:
+        if not document.get('status'):
+            return None
+        document = document.get('product')
+    if not isinstance(document, dict):
+        return None
+    import importer  # Imported on first use: workers without an upstream source never need the import stack
+    # Store under the scanned barcode even if the mirror omits or reformats the code
+    return importer.normalize_off_product(dict(document, code=barcode))
+
+
+class HTTPSource:
+    """Fetches OFF API documents from a URL template containing `{barcode}`."""
+
+    def __init__(self, url_template, timeout=UPSTREAM_TIMEOUT):
+        self.url_template = url_template
+        self.timeout = timeout
+
+    def fetch(self, barcode):
+        request = urllib.request.Request(self.url_template.format(barcode=barcode), headers={'User-Agent': USER_AGENT})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                document = json.load(response)
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return None
+            raise UpstreamError(f"HTTP {e.code} from upstream") from e
+        except (OSError, ValueError) as e:
+            raise UpstreamError(str(e)) from e
+        return normalize_document(document, barcode)
+
+
+class FileSource:
+    """Reads `<barcode>.json` OFF documents from a local directory."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def fetch(self, barcode):
+        try:
+            with open(os.path.join(self.directory, f"{barcode}.json"), encoding='utf-8') as f:
+                document = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            raise UpstreamError(str(e)) from e
+        return normalize_document(document, barcode)
+
+
+def source_from_url(url):
+    """Builds the source for an UPSTREAM_PRODUCT_URL value, or None when it is empty."""
+    if not url:
+        return None
+    parts = urlsplit(url)
+    if parts.scheme == 'file':
+        return FileSource(url2pathname(parts.path))
+    if parts.scheme in ('http', 'https'):
+        return HTTPSource(url)
+    raise ValueError(f"Unsupported UPSTREAM_PRODUCT_URL scheme: {parts.scheme!r}")
+
+
+# --- Request Coalescing ---
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key: the first caller runs the function,
+    later callers wait for it and share its result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key, func, *args):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": len(self._calls)}
+
+
+upstream_source = source_from_url(UPSTREAM_PRODUCT_URL)
+upstream_flight = SingleFlight()